@@ -0,0 +1,77 @@
+# 効果音の優先度（大きいほど優先、同じフレームに重なったときに残す順）
+SOUND_PRIORITY = {
+    0: 0,  # ショット
+    1: 1,  # 爆発
+    3: 2,  # ボス出現・シールド
+    2: 3,  # ダメージ
+}
+# 効果音の長さ（ゲームのフレーム数、assets.pyxresの音の数×速さから求めた値）
+SOUND_FRAMES = {0: 5, 1: 3, 2: 12, 3: 3}
+SFX_CHANNELS = (0, 1, 2)  # 効果音に使うチャンネル（3はBGMのベースのために空けておく）
+
+
+class AudioQueue:
+    # 1フレームの間に要求された音声をためておき、フレームの終わりにまとめて出す
+    # 同じ効果音は1回にまとめ、優先度の高い順に空いているチャンネルへ割り当てる
+    # 鳴っている音より優先度の低い音は、空きが無ければ捨てる（鳴っている音を途中で切らない）
+    def __init__(self, channels=SFX_CHANNELS):
+        self.channels = channels
+        self.sounds = {}  # このフレームに要求された効果音: 要求されたチャンネル
+        self.music = None  # このフレームの最後のBGMの命令（('playm', msc, loop)か('stop',)）
+        # チャンネルごとに鳴っている効果音と、鳴り終わるフレーム
+        self.playing = [None] * len(channels)
+        self.busy_until = [0] * len(channels)
+        self.events = []  # flushで出した命令（毎フレーム使い回す）
+
+    def play(self, ch, snd):
+        self.sounds.setdefault(snd, ch)
+
+    def playm(self, msc, loop=False):
+        self.music = ('playm', msc, loop)
+
+    def stop(self):
+        self.music = ('stop',)
+
+    def flush(self, frame):
+        # フレームframeに鳴らす命令をeventsにまとめて返す
+        events = self.events
+        events.clear()
+        if self.music is not None:
+            # BGMを始め直す・止めるときは効果音のチャンネルも空く
+            events.append(self.music)
+            self.music = None
+            self.playing = [None] * len(self.channels)
+            self.busy_until = [0] * len(self.channels)
+        if not self.sounds:
+            return events
+
+        order = sorted(self.sounds, key=lambda snd: SOUND_PRIORITY.get(snd, 0), reverse=True)
+        for snd in order:
+            slot = self.allocate(snd, self.sounds[snd], frame)
+            if slot < 0:
+                continue
+            self.playing[slot] = snd
+            self.busy_until[slot] = frame + SOUND_FRAMES.get(snd, 1)
+            events.append(('play', self.channels[slot], snd))
+        self.sounds.clear()
+        return events
+
+    def allocate(self, snd, ch, frame):
+        # sndを鳴らすチャンネルの番号（channelsの位置、鳴らせなければ-1）
+        free = [slot for slot in range(len(self.channels)) if self.busy_until[slot] <= frame]
+        # 同じ音が鳴っているチャンネルで鳴らし直す
+        for slot in range(len(self.channels)):
+            if self.playing[slot] == snd and slot not in free:
+                return slot
+        # 要求されたチャンネル、それ以外の空いているチャンネルの順
+        if ch in self.channels and self.channels.index(ch) in free:
+            return self.channels.index(ch)
+        if free:
+            return free[0]
+        # 空きが無ければ、優先度が最も低く先に鳴り終わる音を止めて鳴らす
+        priority = SOUND_PRIORITY.get(snd, 0)
+        slot = min(range(len(self.channels)),
+                   key=lambda slot: (SOUND_PRIORITY.get(self.playing[slot], 0), self.busy_until[slot]))
+        if SOUND_PRIORITY.get(self.playing[slot], 0) < priority:
+            return slot
+        return -1
@@ -0,0 +1,281 @@
+import argparse
+import os
+import time
+import traceback
+
+import numpy as np
+
+from replay import InputEncoder, HEADER as REPLAY_HEADER, REPLAY_MAGIC, REPLAY_VERSION, SEED_LIMIT, clamp16
+from simulation import (Simulation, InputState, SCREEN_WIDTH, PLAYER_AREA_HEIGHT, BTN_LEFT,
+                        BTN_RIGHT, BTN_UP, BTN_DOWN, BTN_SPACE)
+from telemetry import TelemetryRecorder
+
+# 自動操縦の先読み
+HORIZON = 20  # 何フレーム先まで危険を調べるか
+PLAYER_SPEED = 2  # update_playerの移動速度
+PLAYER_SIZE = 8
+MARGIN = 1.5  # 当たり判定に足す余裕（ピクセル）
+NEAR_MARGIN = 6  # これより近くを通るのも少しだけ危険とみなす（弾の間の狭い隙間を避ける）
+HIT_COST = 1000  # 当たるフレーム1つ分のコスト（目標までの距離1ピクセルが1）
+NEAR_COST = 10  # 近くを通る脅威1つ分のコスト
+HOME_Y = PLAYER_AREA_HEIGHT - PLAYER_SIZE - 6  # 戻ろうとする高さ（弾を避ける時間が最も長い）
+BOSS_POWERUP_RANGE = 24  # ボス戦の間はこれより近いアイテムだけ取りに行く
+
+# 候補の操作: 9方向それぞれについて、HORIZONの間ずっと動くものと最初の数フレームだけ動くもの
+DIRECTIONS = [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+MOVE_FRAMES = (HORIZON, 8, 3)
+
+
+def direction_buttons(dx, dy):
+    buttons = 0
+    if dx < 0:
+        buttons |= BTN_LEFT
+    elif dx > 0:
+        buttons |= BTN_RIGHT
+    if dy < 0:
+        buttons |= BTN_UP
+    elif dy > 0:
+        buttons |= BTN_DOWN
+    return buttons
+
+
+def candidate_table():
+    # (候補の数, HORIZON, 2) の移動量と、候補ごとの最初のフレームのボタン
+    offsets = []
+    buttons = []
+    steps = np.arange(1, HORIZON + 1)
+    for frames in MOVE_FRAMES:
+        for dx, dy in DIRECTIONS:
+            if frames != HORIZON and dx == dy == 0:
+                continue  # 止まる候補は1つでよい
+            moved = np.minimum(steps, frames) * PLAYER_SPEED
+            offsets.append(np.stack([moved * dx, moved * dy], axis=-1))
+            buttons.append(direction_buttons(dx, dy))
+    return np.array(offsets, np.float64), buttons
+
+
+OFFSETS, CANDIDATE_BUTTONS = candidate_table()
+STEPS = np.arange(1, HORIZON + 1, dtype=np.float64)[:, None]  # (HORIZON, 1)
+# 早く当たるほど危険（1フレーム後の衝突はHORIZONフレーム後よりずっと重い）
+WEIGHTS = ((HORIZON + 1 - STEPS[:, 0]) / HORIZON) ** 2
+
+
+class Autopilot:
+    # ゲームの状態を読んで入力を決めるボット（ソークテスト用）
+    # 敵の弾と敵をHORIZONフレーム先まで等速で動かした危険マップを作り、
+    # 候補の操作ごとに自機の通り道の危険度を足し合わせて、安全な中で目標に近づくものを選ぶ
+    # 撃つ間隔は押して離すのを繰り返して最短にし、自機の弾が上限を超えない範囲で撃つ
+    def __init__(self):
+        self.fire_held = False
+
+    def act(self, sim, frame, inp):
+        inp.mouse_x = inp.mouse_y = 0
+        if sim.scene != "GAME":
+            # タイトルとゲームオーバーはスペースで抜ける（押し続けると1回しか効かない）
+            inp.buttons = BTN_SPACE if frame % 2 == 0 else 0
+            return
+        player = sim.player
+        px = float(player['x'])
+        py = float(player['y'])
+
+        danger = self.danger(sim, px, py)
+        target_x, target_y = self.target(sim, px, py)
+
+        # 候補の最後の位置と目標との距離（危険が同じなら目標に近いものを選ぶ）
+        end_x = np.clip(px + OFFSETS[:, -1, 0], 0, SCREEN_WIDTH - PLAYER_SIZE)
+        end_y = np.clip(py + OFFSETS[:, -1, 1], 0, PLAYER_AREA_HEIGHT - PLAYER_SIZE)
+        cost = danger + np.abs(end_x - target_x) + np.abs(end_y - target_y)
+        buttons = CANDIDATE_BUTTONS[int(cost.argmin())]
+
+        # 押して離すのを繰り返すと2フレームに1回撃てる
+        per_volley = (1, 2, 3)[min(player['power_level'], 2)]
+        room = len(sim.shots) + per_volley <= sim.max_shots
+        self.fire_held = room and not self.fire_held
+        if self.fire_held:
+            buttons |= BTN_SPACE
+        inp.buttons = buttons
+
+    def danger(self, sim, px, py):
+        # 候補ごとの危険度（HORIZONフレームの間に敵の弾か敵と重なるフレームと、近くを通る脅威の重みつきの合計）
+        player = sim.player
+        safe_frames = max(player['invincible'], player['shield'])
+        bullets = sim.bullets
+        enemies = sim.enemies
+        b = bullets.alive
+        e = enemies.alive
+        n = np.count_nonzero(b) + np.count_nonzero(e)
+        if n == 0 or safe_frames >= HORIZON:
+            return np.zeros(len(OFFSETS))
+        x = np.concatenate([bullets.x[b], enemies.x[e]])
+        y = np.concatenate([bullets.y[b], enemies.y[e]])
+        w = np.concatenate([bullets.w[b], enemies.w[e]])
+        h = np.concatenate([bullets.h[b], enemies.h[e]])
+        vx = np.concatenate([bullets.vx[b], enemies.vx[e]])
+        vy = np.concatenate([bullets.vy[b], enemies.vy[e]])
+
+        # 危険マップ: (HORIZON, 脅威の数) の未来の位置
+        tx = x + vx * STEPS
+        ty = y + vy * STEPS
+
+        # 自機の通り道: (候補の数, HORIZON, 1)
+        cx = np.clip(px + OFFSETS[:, :, 0], 0, SCREEN_WIDTH - PLAYER_SIZE)[:, :, None]
+        cy = np.clip(py + OFFSETS[:, :, 1], 0, PLAYER_AREA_HEIGHT - PLAYER_SIZE)[:, :, None]
+        hit = ((cx < tx + w + MARGIN) & (cx + PLAYER_SIZE + MARGIN > tx) &
+               (cy < ty + h + MARGIN) & (cy + PLAYER_SIZE + MARGIN > ty)).any(axis=2)
+        near = ((cx < tx + w + NEAR_MARGIN) & (cx + PLAYER_SIZE + NEAR_MARGIN > tx) &
+                (cy < ty + h + NEAR_MARGIN) & (cy + PLAYER_SIZE + NEAR_MARGIN > ty)).sum(axis=2)
+        weights = WEIGHTS
+        if safe_frames:
+            weights = np.where(STEPS[:, 0] > safe_frames, WEIGHTS, 0)
+        return HIT_COST * (hit @ weights) + NEAR_COST * (near @ weights)
+
+    def target(self, sim, px, py):
+        # 目指す位置（ボス、アイテム、撃ちやすい敵の順、無ければ画面下の中央）
+        # ボスは画面の下に抜けるまでに倒さないと次のボスが出ないので、近くのアイテム以外は後回しにする
+        enemies = sim.enemies
+        boss = enemies.resolve(sim.boss)
+        powerup_x = self.nearest_powerup(sim.powerups, px, py)
+        if boss >= 0:
+            if powerup_x is not None and abs(powerup_x - px) < BOSS_POWERUP_RANGE:
+                return powerup_x, HOME_Y
+            return self.aim_x(enemies, boss, py), HOME_Y
+        if powerup_x is not None:
+            return powerup_x, HOME_Y
+
+        if enemies.count:
+            i = enemies.indices()
+            # 自機より上にいる敵のうち最も下のもの
+            above = i[enemies.y[i] + enemies.h[i] < py - 4]
+            if above.size:
+                k = above[enemies.y[above].argmax()]
+                return self.aim_x(enemies, k, py), HOME_Y
+        return (SCREEN_WIDTH - PLAYER_SIZE) / 2, HOME_Y
+
+    def nearest_powerup(self, powerups, px, py):
+        # まだ自機より上にあるアイテムのうち横に最も近いもののx（無ければNone）
+        if not powerups.count:
+            return None
+        i = powerups.indices()
+        i = i[powerups.y[i] < py + PLAYER_SIZE]
+        if not i.size:
+            return None
+        return float(powerups.x[i[np.abs(powerups.x[i] - px).argmin()]])
+
+    def aim_x(self, enemies, i, py):
+        # 弾が届くころの敵の中心の真下に自機の中心が来るx
+        travel = max(0.0, (py - enemies.y[i] - enemies.h[i]) / (4 + enemies.vy[i]))
+        x = enemies.x[i] + enemies.vx[i] * travel + enemies.w[i] / 2
+        return float(np.clip(x, 0, SCREEN_WIDTH)) - PLAYER_SIZE / 2
+
+
+def autopilot_policy(seed):
+    # rollout.pyの方策として使う（act(sim, frame, inp)）
+    return Autopilot().act
+
+
+# --- ソークテスト ---
+
+def soak(seed, max_frames, slow_ms, failures_dir, telemetry=None):
+    # 自動操縦で1セッションを遊び、結果を辞書で返す
+    # 例外が起きたら入力をリプレイファイルに書き出して、そのフレームで止める
+    sim = Simulation(seed=seed)
+    bot = Autopilot()
+    encoder = InputEncoder() if failures_dir else None
+    inp = InputState()
+    clock = time.perf_counter
+    step_times = np.zeros(max_frames)
+    think_time = 0.0
+    slow_frames = []
+    error = None
+    frame = 0
+    while frame < max_frames:
+        start = clock()
+        bot.act(sim, frame, inp)
+        think_time += clock() - start
+        if encoder is not None:
+            encoder.add(inp.buttons, clamp16(inp.mouse_x), clamp16(inp.mouse_y))
+        start = clock()
+        try:
+            sim.step(inp)
+        except Exception:
+            error = traceback.format_exc()
+            break
+        step_times[frame] = clock() - start
+        if telemetry is not None:
+            telemetry.record(sim, step_times[frame])
+        if step_times[frame] * 1000 > slow_ms:
+            slow_frames.append((frame, step_times[frame] * 1000))
+        frame += 1
+        if sim.scene == "GAMEOVER":
+            break
+
+    if error and failures_dir:
+        encoder.flush()
+        path = os.path.join(failures_dir, f"crash_{seed}.sdr")
+        with open(path, 'wb') as f:
+            f.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed) + encoder.out)
+    times = step_times[:frame]
+    return {
+        'seed': seed,
+        'frames': frame,
+        'stage': sim.stage,
+        'score': sim.score,
+        'game_over': sim.scene == "GAMEOVER",
+        'step_p99_ms': float(np.percentile(times, 99) * 1000) if frame else 0.0,
+        'step_max_ms': float(times.max() * 1000) if frame else 0.0,
+        'think_us': think_time / max(frame, 1) * 1e6,
+        'slow_frames': slow_frames,
+        'error': error,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak-test the game headlessly with the autopilot bot")
+    parser.add_argument('--sessions', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0, help="first seed (sessions use seed, seed+1, ...)")
+    parser.add_argument('--max-frames', type=int, default=30 * 60 * 30,
+                        help="stop a session after this many frames (default: 30 minutes)")
+    parser.add_argument('--slow-ms', type=float, default=1000 / 30,
+                        help="report steps slower than this (default: one frame at 30 fps)")
+    parser.add_argument('--failures', metavar='DIR',
+                        help="write a replay of every session that raised an exception to DIR")
+    parser.add_argument('--telemetry', metavar='DIR', help="write per-second telemetry to DIR")
+    args = parser.parse_args()
+    if args.failures and not 0 <= args.seed <= SEED_LIMIT - args.sessions:
+        parser.error(f"--failures records replays, so the seeds must be between 0 and {SEED_LIMIT - 1}")
+    if args.failures:
+        os.makedirs(args.failures, exist_ok=True)
+    telemetry = None
+    if args.telemetry:
+        telemetry = TelemetryRecorder(args.telemetry, budget=args.slow_ms / 1000)
+
+    failed = 0
+    start = time.perf_counter()
+    total_frames = 0
+    print(f"{'seed':>6} {'frames':>7} {'stage':>5} {'score':>7} {'p99 ms':>7} {'max ms':>7} "
+          f"{'bot us':>7}  result")
+    for seed in range(args.seed, args.seed + args.sessions):
+        result = soak(seed, args.max_frames, args.slow_ms, args.failures, telemetry)
+        total_frames += result['frames']
+        if result['error']:
+            failed += 1
+            outcome = "ERROR"
+        else:
+            outcome = "game over" if result['game_over'] else "time limit"
+        print(f"{seed:>6} {result['frames']:>7} {result['stage']:>5} {result['score']:>7} "
+              f"{result['step_p99_ms']:>7.2f} {result['step_max_ms']:>7.2f} {result['think_us']:>7.0f}"
+              f"  {outcome}")
+        for frame, ms in result['slow_frames'][:5]:
+            print(f"       slow step at frame {frame}: {ms:.1f} ms")
+        if result['error']:
+            print(result['error'])
+    elapsed = time.perf_counter() - start
+    if telemetry is not None:
+        telemetry.close()
+    print(f"{total_frames} frames in {elapsed:.1f}s ({total_frames / elapsed:.0f} frames/s)"
+          f"  errors: {failed}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
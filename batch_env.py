@@ -0,0 +1,715 @@
+import argparse
+import time
+
+import numpy as np
+
+from simulation import (Simulation, InputState, SCREEN_WIDTH, SCREEN_HEIGHT,
+                        PLAYER_AREA_HEIGHT, BTN_LEFT, BTN_RIGHT, BTN_UP, BTN_DOWN,
+                        BTN_SPACE, BTN_A, SHOT_ENEMY, BULLET_PATTERN,
+                        ENEMY_SMALL, ENEMY_MEDIUM, ENEMY_BOSS, POWERUP_POWER,
+                        POWERUP_SHIELD, GAUGE_INCREASE)
+from patterns import BOSS_PATTERNS, boss_pattern_index, compile_pattern, aim
+
+# 乱数（splitmix64）：環境ごとに独立した系列をまとめて進める
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX2 = np.uint64(0x94D049BB133111EB)
+
+# 観測の並び（1環境ぶん、float32）
+# 自機: x, y, 残機, 無敵時間, シールド, パワーレベル, ステージ, ボスゲージの割合
+# 続いて敵・弾・アイテムのスロットごとの値（使われていないスロットはすべて0）
+PLAYER_FEATURES = 8
+ENEMY_FEATURES = 7  # alive, x, y, vx, vy, kind, hp
+SHOT_FEATURES = 5  # alive, x, y, vx, vy（自機の弾）
+BULLET_FEATURES = 6  # alive, x, y, vx, vy, kind（敵の弾）
+POWERUP_FEATURES = 4  # alive, x, y, kind
+
+BIG_SEQ = np.iinfo(np.int64).max  # 空きスロットの並び順（最後に回す）
+
+
+def mix64(z):
+    z = (z ^ (z >> np.uint64(30))) * MIX1
+    z = (z ^ (z >> np.uint64(27))) * MIX2
+    return z ^ (z >> np.uint64(31))
+
+
+class BatchStore:
+    # 環境数×容量の2次元配列で持つエンティティ格納庫（EntityStoreのバッチ版）
+    def __init__(self, n, capacity, columns):
+        self.capacity = capacity
+        self.columns = dict(columns)
+        for name, dtype in self.columns.items():
+            setattr(self, name, np.zeros((n, capacity), dtype))
+        self.alive = np.zeros((n, capacity), np.bool_)
+        self.seq = np.zeros((n, capacity), np.int64)
+        self.next_seq = np.zeros(n, np.int64)
+        self.count = np.zeros(n, np.int64)
+        self.rows = np.arange(n)
+
+    def spawn(self, mask, **values):
+        # maskの環境それぞれの空きスロットに1つずつ追加する（満杯の環境では何もしない）
+        # 値はスカラーか環境数の長さの配列
+        rows = mask.nonzero()[0]
+        if rows.size:
+            self.spawn_rows(rows, **{name: value[rows] if np.ndim(value) else value
+                                     for name, value in values.items()})
+
+    def spawn_rows(self, rows, **values):
+        # rowsの環境それぞれに1つずつ追加する（値はスカラーかrowsと同じ長さの配列）
+        slot = self.alive[rows].argmin(axis=1)
+        free = ~self.alive[rows, slot]
+        if not free.all():
+            rows = rows[free]
+            slot = slot[free]
+            values = {name: value[free] if np.ndim(value) else value
+                      for name, value in values.items()}
+        if not rows.size:
+            return
+        for name, value in values.items():
+            getattr(self, name)[rows, slot] = value
+        self.alive[rows, slot] = True
+        self.seq[rows, slot] = self.next_seq[rows]
+        self.next_seq[rows] += 1
+        self.count[rows] += 1
+
+    def spawn_many(self, rows, **values):
+        # rowsの環境に1つずつ、まとめて追加する（spawn_rowsをrowsの順に呼んだのと同じ結果）
+        # rowsは昇順で、同じ環境が続けて何度現れてもよい。空きが足りない環境では後ろの分を捨てる
+        if not rows.size:
+            return
+        targets, first, counts = np.unique(rows, return_index=True, return_counts=True)
+        j = np.arange(rows.size) - np.repeat(first, counts)  # その環境で何番目の追加か
+        k = np.repeat(np.arange(targets.size), counts)
+        free_slots = np.argsort(self.alive[targets], axis=1, kind='stable')  # 空きスロットが番号順に前へ
+        ok = j < (self.capacity - self.count[targets])[k]
+        if not ok.all():
+            rows, j, k = rows[ok], j[ok], k[ok]
+            values = {name: value[ok] if np.ndim(value) else value for name, value in values.items()}
+        slot = free_slots[k, j]
+        for name, value in values.items():
+            getattr(self, name)[rows, slot] = value
+        self.alive[rows, slot] = True
+        self.seq[rows, slot] = self.next_seq[rows] + j
+        added = np.bincount(k, minlength=targets.size)
+        self.next_seq[targets] += added
+        self.count[targets] += added
+
+    def kill(self, rows, slots):
+        # (環境, スロット)の組を削除
+        self.alive[rows, slots] = False
+        self.count[:] = self.alive.sum(axis=1)
+
+    def kill_mask(self, mask):
+        if mask.any():
+            self.alive &= ~mask
+            self.count[:] = self.alive.sum(axis=1)
+
+    def clear(self, rows):
+        self.alive[rows] = False
+        self.count[rows] = 0
+
+    def order(self):
+        # 環境ごとにスロットを生成順に並べた配列（空きスロットは後ろ）
+        return np.argsort(np.where(self.alive, self.seq, BIG_SEQ), axis=1, kind='stable')
+
+    def in_order(self, mask, order):
+        # maskが真のスロットを環境ごとに生成順に数え、j番目どうしを組にして返す
+        # [(j番目がある環境のマスク, 環境ごとのj番目のスロット), ...]
+        # （ループは容量ではなく、1つの環境で真になった数の最大値の回数だけ回る）
+        ranked = np.take_along_axis(mask, order, axis=1)
+        counts = ranked.sum(axis=1)
+        if not counts.any():
+            return []
+        packed = np.take_along_axis(order, np.argsort(~ranked, axis=1, kind='stable'), axis=1)
+        return [(counts > j, packed[:, j]) for j in range(counts.max())]
+
+    def overlaps(self, x, y, w, h):
+        # 環境ごとの矩形(x, y, w, h)と重なっている使用中スロットのマスク
+        # 使用中のスロットは容量のごく一部なので、それだけを取り出して調べる
+        r, i = self.alive.nonzero()
+        sx, sy = self.x[r, i], self.y[r, i]
+        hit = ((sx + self.w[r, i] > x[r]) & (sx < x[r] + w[r]) &
+               (sy + self.h[r, i] > y[r]) & (sy < y[r] + h[r]))
+        mask = np.zeros_like(self.alive)
+        mask[r[hit], i[hit]] = True
+        return mask
+
+
+class BatchEnv:
+    # 複数のゲームを同じ歩調で進めるバッチ環境
+    # Simulation.update_gameの規則（自機、弾、敵、ボス、衝突、スコア、残機とシールド）を
+    # 環境の次元に沿った配列演算で再現する。タイトル・一時停止・タッチ操作と見た目だけの
+    # 爆発・星は持たない。乱数の系列はSimulationとは別なので同じシードでも展開は一致しない
+    def __init__(self, max_enemies=8, max_shots=15, max_powerups=32, max_bullets=128):
+        self.max_enemies = max_enemies
+        self.max_shots = max_shots
+        self.max_powerups = max_powerups
+        # 敵の弾の容量（観測の大きさにもなるのでSimulationより小さい。弾幕が溢れた分は撃たれない）
+        self.max_bullets = max_bullets
+        self.pattern_cache = {}  # (パターン番号, ステージ): CompiledPattern
+        self.n = 0
+
+    def reset(self, n, seeds=None):
+        # n個のゲームを始めからやり直し、観測を返す
+        if seeds is None:
+            seeds = np.random.SeedSequence().generate_state(n, np.uint64)
+        seeds = np.asarray(seeds, np.uint64)
+        if seeds.shape != (n,):
+            raise ValueError(f"expected {n} seeds, got {seeds.size}")
+        self.n = n
+        self.rows = np.arange(n)
+        self.rng_state = mix64(seeds + GOLDEN)
+
+        position = {'x': np.float64, 'y': np.float64, 'w': np.float64, 'h': np.float64}
+        self.shots = BatchStore(n, self.max_shots + 6, {
+            **position, 'vx': np.float64, 'vy': np.float64, 'hp': np.int32})
+        self.bullets = BatchStore(n, self.max_bullets, {
+            **position, 'vx': np.float64, 'vy': np.float64, 'kind': np.int8, 'hp': np.int32})
+        self.enemies = BatchStore(n, self.max_enemies + 1, {
+            **position, 'vx': np.float64, 'vy': np.float64, 'kind': np.int8, 'hp': np.int32,
+            'timer': np.int32, 'score': np.int32, 'fire_rate': np.float64,
+            'pattern': np.int8, 'phase': np.int32})
+        self.powerups = BatchStore(n, self.max_powerups, {
+            **position, 'vy': np.float64, 'kind': np.int8})
+
+        # 自機とゲーム状態（環境ごとの値）
+        self.player_x = np.zeros(n)
+        self.player_y = np.zeros(n)
+        self.lives = np.zeros(n, np.int32)
+        self.invincible = np.zeros(n, np.int32)
+        self.shield = np.zeros(n, np.int32)
+        self.power_level = np.zeros(n, np.int32)
+        self.fire_hold = np.zeros(n, np.int32)  # 発射ボタンの押下継続フレーム数
+        self.score = np.zeros(n, np.int64)
+        self.stage = np.zeros(n, np.int32)
+        self.boss_gauge = np.zeros(n, np.int32)
+        self.boss_gauge_max = 1000
+        self.boss_appeared = np.zeros(n, np.bool_)
+        self.enemy_spawn_timer = np.zeros(n, np.int32)
+        self.frames = np.zeros(n, np.int64)  # ゲーム開始からのフレーム数
+
+        # 終了したゲームの結果（auto-resetの直前の値）
+        self.final_score = np.zeros(n, np.int64)
+        self.final_stage = np.zeros(n, np.int32)
+        self.final_frames = np.zeros(n, np.int64)
+
+        self.rewards = np.zeros(n, np.float32)
+        obs_size = (PLAYER_FEATURES + self.enemies.capacity * ENEMY_FEATURES +
+                    self.shots.capacity * SHOT_FEATURES + self.max_bullets * BULLET_FEATURES +
+                    self.max_powerups * POWERUP_FEATURES)
+        self.observations = np.zeros((n, obs_size), np.float32)
+
+        self.reset_rows(self.rows)
+        return self.observe()
+
+    def reset_rows(self, rows):
+        # 指定した環境のゲームを初期状態に戻す（乱数の系列はそのまま続ける）
+        self.player_x[rows] = 80
+        self.player_y[rows] = 100
+        self.lives[rows] = 3
+        self.invincible[rows] = 0
+        self.shield[rows] = 0
+        self.power_level[rows] = 0
+        self.fire_hold[rows] = 0
+        self.score[rows] = 0
+        self.stage[rows] = 1
+        self.boss_gauge[rows] = 0
+        self.boss_appeared[rows] = False
+        self.enemy_spawn_timer[rows] = 0
+        self.frames[rows] = 0
+        self.shots.clear(rows)
+        self.bullets.clear(rows)
+        self.enemies.clear(rows)
+        self.powerups.clear(rows)
+
+    # --- 乱数 ---
+
+    def random(self, mask=None, k=None):
+        # 環境ごとの[0, 1)の一様乱数（kを指定すると環境ごとにk個）
+        # maskを指定するとその環境の系列だけを進める（maskの外の環境の値は使わないこと）
+        # 乱数を引くかどうかは環境ごとの状態だけで決めるので、同じシードの環境は
+        # 一緒に進める他の環境によらず同じ展開になる
+        if k is None:
+            if mask is None:
+                self.rng_state += GOLDEN
+            else:
+                self.rng_state += GOLDEN * mask
+            z = mix64(self.rng_state)
+        else:
+            steps = GOLDEN * np.arange(1, k + 1, dtype=np.uint64)
+            z = mix64(self.rng_state[:, None] + steps)
+            self.rng_state += np.uint64(int(GOLDEN) * k % (1 << 64))
+        return (z >> np.uint64(11)) * (1.0 / (1 << 53))
+
+    def randint(self, a, b, mask=None):
+        # random.randintと同じく両端を含む
+        return a + np.floor(self.random(mask) * (b - a + 1))
+
+    def uniform(self, a, b, mask=None):
+        return a + self.random(mask) * (b - a)
+
+    def choice(self, a, b, mask=None):
+        return np.where(self.random(mask) < 0.5, a, b)
+
+    # --- 更新 ---
+
+    def step(self, actions):
+        # 環境ごとの入力（BTN_*のビット）で1フレーム進める
+        # 戻り値の配列は毎回使い回す（次のstepで上書きされる）
+        actions = np.asarray(actions)
+        score_before = self.score.copy()
+
+        self.update_player(actions)
+
+        # ショットの更新（数を制限）
+        over = self.shots.count > self.max_shots
+        self.keep_newest_shots(over)
+        self.update_shots(~over)
+        self.update_bullets()
+
+        self.update_enemies()
+        self.update_powerups()
+        self.update_collisions()
+
+        # 敵の生成タイミング管理
+        self.enemy_spawn_timer -= 1
+        spawn = (self.enemy_spawn_timer <= 0) & (self.enemies.count < self.max_enemies)
+        if spawn.any():
+            self.spawn_enemy(spawn)
+            self.enemy_spawn_timer[spawn] = 100 - np.minimum(60, self.stage[spawn] * 8)
+
+        # ボスゲージが満タンになったらボス出現
+        boss = ~self.boss_appeared & (self.boss_gauge >= self.boss_gauge_max)
+        if boss.any():
+            self.spawn_boss(boss)
+
+        self.frames += 1
+        np.subtract(self.score, score_before, out=self.rewards, casting='unsafe')
+
+        # 残機がなくなったゲームは結果を残して始めからやり直す
+        dones = self.lives <= 0
+        if dones.any():
+            rows = dones.nonzero()[0]
+            self.final_score[rows] = self.score[rows]
+            self.final_stage[rows] = self.stage[rows]
+            self.final_frames[rows] = self.frames[rows]
+            self.reset_rows(rows)
+        return self.observe(), self.rewards, dones
+
+    def update_player(self, actions):
+        # 無敵時間と盾の更新
+        np.maximum(self.invincible - 1, 0, out=self.invincible)
+        np.maximum(self.shield - 1, 0, out=self.shield)
+
+        # 移動処理
+        speed = 2
+        left = (actions & BTN_LEFT) != 0
+        right = (actions & BTN_RIGHT) != 0
+        up = (actions & BTN_UP) != 0
+        down = (actions & BTN_DOWN) != 0
+        self.player_x = np.where(left, np.maximum(self.player_x - speed, 0), self.player_x)
+        self.player_x = np.where(right, np.minimum(self.player_x + speed, SCREEN_WIDTH - 8), self.player_x)
+        self.player_y = np.where(up, np.maximum(self.player_y - speed, 0), self.player_y)
+        self.player_y = np.where(down, np.minimum(self.player_y + speed, PLAYER_AREA_HEIGHT - 8), self.player_y)
+
+        # ショット発射（btnp(hold=12, repeat=4)と同じ判定）
+        held = (actions & (BTN_SPACE | BTN_A)) != 0
+        self.fire_hold = np.where(held, self.fire_hold + 1, 0)
+        elapsed = self.fire_hold - 1
+        fire = (self.fire_hold == 1) | ((elapsed >= 12) & ((elapsed - 12) % 4 == 0))
+        if fire.any():
+            self.fire_player_shot(fire)
+
+    def fire_player_shot(self, fire):
+        # パワーレベルに応じた弾の生成
+        px = self.player_x
+        py = self.player_y
+        spawn = self.shots.spawn
+        shot = {'w': 2, 'h': 4, 'hp': 1}
+        single = fire & (self.power_level == 0)
+        double = fire & (self.power_level == 1)
+        triple = fire & (self.power_level >= 2)
+        spawn(single, x=px + 4, y=py - 4, vx=0, vy=-4, **shot)
+        spawn(double, x=px + 1, y=py, vx=0, vy=-4, **shot)
+        spawn(double, x=px + 5, y=py, vx=0, vy=-4, **shot)
+        spawn(triple, x=px + 3, y=py - 4, vx=0, vy=-3.5, **shot)
+        spawn(triple, x=px + 1, y=py - 2, vx=-1.0, vy=-3.5, **shot)
+        spawn(triple, x=px + 5, y=py - 2, vx=1.0, vy=-3.5, **shot)
+
+    def keep_newest_shots(self, over):
+        # 弾が多すぎる環境では新しいものからmax_shots個だけ残す
+        if not over.any():
+            return
+        shots = self.shots
+        alive = shots.alive[over]
+        seq = shots.seq[over]
+        newer = (alive[:, None, :] & (seq[:, None, :] > seq[:, :, None])).sum(axis=2)
+        drop = np.zeros_like(shots.alive)
+        drop[over] = alive & (newer >= self.max_shots)
+        shots.kill_mask(drop)
+
+    def update_shots(self, active):
+        # 自機の弾をまとめて移動し、画面外の弾を削除
+        shots = self.shots
+        moving = shots.alive & active[:, None]
+        np.add(shots.x, shots.vx, out=shots.x, where=moving)
+        np.add(shots.y, shots.vy, out=shots.y, where=moving)
+        shots.kill_mask(moving & ((shots.y < -shots.h) | (shots.x < 0) | (shots.x > SCREEN_WIDTH)))
+
+    def update_bullets(self):
+        # 敵の弾をまとめて移動し、画面外へ遠ざかっている弾を削除
+        bullets = self.bullets
+        if not bullets.count.any():
+            return
+        # 使用中のスロットだけを取り出して動かす
+        r, i = bullets.alive.nonzero()
+        x = bullets.x[r, i] + bullets.vx[r, i]
+        y = bullets.y[r, i] + bullets.vy[r, i]
+        bullets.x[r, i] = x
+        bullets.y[r, i] = y
+        vx, vy = bullets.vx[r, i], bullets.vy[r, i]
+        out = (((y > SCREEN_HEIGHT) & (vy >= 0)) |
+               ((y < -bullets.h[r, i]) & (vy <= 0)) |
+               ((x > SCREEN_WIDTH) & (vx >= 0)) |
+               ((x < -bullets.w[r, i]) & (vx <= 0)))
+        if out.any():
+            bullets.kill(r[out], i[out])
+
+    def update_enemies(self):
+        enemies = self.enemies
+        shots = self.shots
+        alive = enemies.alive.copy()
+        rows = self.rows
+
+        # 敵の移動（左右の動きがある敵は画面端で向きを反転）
+        np.add(enemies.y, enemies.vy, out=enemies.y, where=alive)
+        np.add(enemies.x, enemies.vx, out=enemies.x, where=alive)
+        bounce = alive & (enemies.vx != 0) & ((enemies.x <= 0) | (enemies.x >= SCREEN_WIDTH - enemies.w))
+        enemies.vx[bounce] = -enemies.vx[bounce]
+
+        # 通常の敵の弾の発射判定（生成順にk番目の敵がk番目の乱数を使い、自機の弾と合わせた弾数制限まで撃つ）
+        # 当たりを生成順に数えた累積和が残りの弾数以下の敵だけが撃つ（1体ずつ判定するのと同じ結果）
+        bullets = self.bullets
+        boss = alive & (enemies.kind == ENEMY_BOSS)
+        order = enemies.order()
+        rolls = self.random(k=enemies.capacity)
+        fired = shots.count + (bullets.alive & (bullets.kind == SHOT_ENEMY)).sum(axis=1)
+        ready = np.take_along_axis(alive & ~boss, order, axis=1)
+        ready &= rolls < np.take_along_axis(enemies.fire_rate, order, axis=1)
+        ready &= ready.cumsum(axis=1) <= (self.max_shots - fired)[:, None]
+        r, k = ready.nonzero()
+        if r.size:
+            i = order[r, k]
+            bullets.spawn_many(r, x=enemies.x[r, i] + enemies.w[r, i] // 2,
+                               y=enemies.y[r, i] + enemies.h[r, i], w=2, h=4, vx=0, vy=2,
+                               kind=SHOT_ENEMY, hp=1)
+
+        # ボスの弾幕
+        if boss.any():
+            self.fire_boss_patterns(boss)
+
+        # 画面外に出た敵を削除
+        enemies.kill_mask(alive & (enemies.y > SCREEN_HEIGHT))
+
+    def fire_boss_patterns(self, boss):
+        # 発射間隔が来たボスから、計算済みの表の1回分の弾をまとめて撃つ
+        enemies = self.enemies
+        rows = boss.any(axis=1).nonzero()[0]
+        i = boss[rows].argmax(axis=1)
+        enemies.timer[rows, i] -= 1
+        ready = enemies.timer[rows, i] <= 0
+        rows = rows[ready]
+        i = i[ready]
+        if not rows.size:
+            return
+
+        # パターンとステージの組ごとに同じ表を使う
+        pattern = enemies.pattern[rows, i].astype(np.int64)
+        stage = self.stage[rows].astype(np.int64)
+        keys = pattern * 10000 + stage
+        for key in np.unique(keys).tolist():
+            group = keys == key
+            r = rows[group]
+            g = i[group]
+            compiled = self.boss_pattern(key // 10000, key % 10000)
+            phase = enemies.phase[r, g]
+            table = compiled.velocities[phase % len(compiled.velocities)]  # (ボス数, 弾の数, 2)
+            x = enemies.x[r, g] + enemies.w[r, g] / 2 - 1.5
+            y = enemies.y[r, g] + enemies.h[r, g]
+            vx = table[:, :, 0]
+            vy = table[:, :, 1]
+            if compiled.aimed:
+                vx, vy = aim(vx, vy, (self.player_x[r] + 4 - x)[:, None],
+                             (self.player_y[r] + 4 - y)[:, None])
+            count = vx.shape[1]
+            self.bullets.spawn_many(np.repeat(r, count), x=np.repeat(x, count), y=np.repeat(y, count),
+                                    w=3, h=3, vx=vx.ravel(), vy=vy.ravel(), kind=BULLET_PATTERN, hp=1)
+            enemies.phase[r, g] += 1
+            enemies.timer[r, g] = compiled.interval
+
+    def boss_pattern(self, index, stage):
+        key = (index, stage)
+        pattern = self.pattern_cache.get(key)
+        if pattern is None:
+            pattern = compile_pattern(BOSS_PATTERNS[index], stage)
+            self.pattern_cache[key] = pattern
+        return pattern
+
+    def update_powerups(self):
+        powerups = self.powerups
+        np.add(powerups.y, powerups.vy, out=powerups.y, where=powerups.alive)
+        powerups.kill_mask(powerups.alive & (powerups.y > SCREEN_HEIGHT))
+
+    def update_collisions(self):
+        # Simulation.update_collisionsと同じ順（敵弾、体当たり、自機の弾、アイテム）で判定する
+        shots = self.shots
+        enemies = self.enemies
+        rows = self.rows
+        px = self.player_x
+        py = self.player_y
+        size = np.full(self.n, 8.0)
+
+        # 判定は移動後の位置で1回だけ行う（Simulationのqueryと同じ）
+        bullets = self.bullets
+        enemy_shot_hits = bullets.overlaps(px, py, size, size)
+        ram_hits = enemies.overlaps(px, py, size, size)
+        powerup_hits = self.powerups.overlaps(px, py, size, size)
+        order = enemies.order()
+
+        # 敵の弾: シールド中は当たった弾をすべて消し、そうでなければ最も古い弾でダメージ
+        hit = enemy_shot_hits.any(axis=1) & (self.invincible == 0)
+        shielded = hit & (self.shield > 0)
+        bullets.kill_mask(enemy_shot_hits & shielded[:, None])
+        damaged = hit & ~shielded
+        if damaged.any():
+            oldest = np.where(enemy_shot_hits, bullets.seq, BIG_SEQ).argmin(axis=1)
+            bullets.kill(rows[damaged], oldest[damaged])
+            self.damage_player(damaged)
+
+        # 体当たり: シールド中は当たった敵をすべて倒し、そうでなければ最も古い敵でダメージ
+        hit = ram_hits.any(axis=1) & (self.invincible == 0)
+        shielded = hit & (self.shield > 0)
+        rammed = ram_hits & hit[:, None]
+        damaged = hit & ~shielded
+        if damaged.any():
+            oldest = np.where(ram_hits, enemies.seq, BIG_SEQ).argmin(axis=1)
+            rammed &= ~damaged[:, None]
+            rammed[rows[damaged], oldest[damaged]] = True
+            self.damage_player(damaged)
+        if shielded.any():
+            for destroy, i in enemies.in_order(rammed & shielded[:, None], order):
+                enemies.alive[rows[destroy], i[destroy]] = False
+                self.add_score(destroy, enemies.score[rows, i])
+                self.add_boss_gauge(destroy, enemies.kind[rows, i])
+            enemies.count[:] = enemies.alive.sum(axis=1)
+
+        # 自機の弾: 敵ごとに（生成順に）重なっている最も古い弾を1発だけ消費する
+        target = enemies.alive & ~rammed
+        if target.any() and shots.count.any():
+            hit_shot = self.assign_shots(target, order)
+            for hit, i in enemies.in_order(hit_shot >= 0, order):
+                self.hit_enemy(hit, i, hit_shot[rows, i])
+
+        # アイテム
+        picked = powerup_hits.any(axis=1)
+        if picked.any():
+            power = (powerup_hits & (self.powerups.kind == POWERUP_POWER)).sum(axis=1)
+            self.power_level = np.minimum(2, self.power_level + power).astype(np.int32)
+            got_shield = (powerup_hits & (self.powerups.kind == POWERUP_SHIELD)).any(axis=1)
+            self.shield[got_shield] = 300
+            self.powerups.kill_mask(powerup_hits)
+
+    def assign_shots(self, target, order):
+        # targetの敵それぞれが消費する自機の弾のスロット（当たらない敵は-1）を (環境, 敵) の配列で返す
+        # 生成順の早い敵から順に、まだ残っている重なった弾のうち最も古いものを取るのと同じ結果を、
+        # 「全員が最も古い弾を指し、同じ弾を指した敵は生成順の早い敵が取り、外れた敵は次に古い弾を指し直す」
+        # を取り合いがなくなるまで繰り返して求める（取り合いはまれなので、ほとんどは1回で終わる）
+        shots = self.shots
+        enemies = self.enemies
+        hit_shot = np.full(target.shape, -1)
+        # 対象の敵（環境あたり数体）ごとに、同じ環境の弾すべてと重なりを調べる
+        tr, te = target.nonzero()
+        ex, ey = enemies.x[tr, te][:, None], enemies.y[tr, te][:, None]
+        overlap = (shots.alive[tr] &
+                   (ex + enemies.w[tr, te][:, None] > shots.x[tr]) &
+                   (ex < shots.x[tr] + shots.w[tr]) &
+                   (ey + enemies.h[tr, te][:, None] > shots.y[tr]) &
+                   (ey < shots.y[tr] + shots.h[tr]))
+        k, s = overlap.nonzero()
+        if not k.size:
+            return hit_shot
+        r, e = tr[k], te[k]
+        rank = np.empty_like(order)
+        np.put_along_axis(rank, order, np.arange(order.shape[1]), axis=1)
+        # 重なった (環境, 敵, 弾) の組を、環境、敵、弾の古い順に並べる（消しても並びは崩れない）
+        by_age = np.lexsort((shots.seq[r, s], e, r))
+        r, e, s = r[by_age], e[by_age], s[by_age]
+        while True:
+            # 敵ごとの先頭（残っている中で最も古い弾）
+            head = np.ones(r.size, np.bool_)
+            head[1:] = (r[1:] != r[:-1]) | (e[1:] != e[:-1])
+            heads = head.nonzero()[0]
+            hr, he, hs = r[heads], e[heads], s[heads]
+            # 同じ弾を指した敵のうち、生成順で2番目以降の敵は外れる
+            by_rank = np.lexsort((rank[hr, he], hs, hr))
+            lost = np.zeros(heads.size, np.bool_)
+            lost[by_rank[1:]] = (hr[by_rank[1:]] == hr[by_rank[:-1]]) & (hs[by_rank[1:]] == hs[by_rank[:-1]])
+            if not lost.any():
+                hit_shot[hr, he] = hs
+                return hit_shot
+            keep = np.ones(r.size, np.bool_)
+            keep[heads[lost]] = False
+            r, e, s = r[keep], e[keep], s[keep]
+
+    def damage_player(self, mask):
+        self.lives[mask] -= 1
+        self.invincible[mask] = 60
+
+    def hit_enemy(self, mask, i, shot):
+        # maskの環境で敵iに弾shotが当たった
+        enemies = self.enemies
+        rows = self.rows
+        r = rows[mask]
+        enemies.hp[r, i[mask]] -= self.shots.hp[r, shot[mask]]
+        self.shots.kill(r, shot[mask])
+
+        destroyed = mask & (enemies.hp[rows, i] <= 0)
+        if not destroyed.any():
+            return
+        kind = enemies.kind[rows, i]
+
+        # ボスを倒したらステージアップ
+        boss = destroyed & (kind == ENEMY_BOSS)
+        self.stage[boss] += 1
+        self.boss_appeared[boss] = False
+        self.boss_gauge[boss] = 0
+
+        # パワーアップアイテムのドロップ（ボスは確定）
+        drop = destroyed & (self.random(destroyed) < np.where(boss, 1.0, 0.1))
+        self.spawn_powerup(drop, enemies.x[rows, i] + enemies.w[rows, i] // 2,
+                           enemies.y[rows, i] + enemies.h[rows, i] // 2)
+
+        self.add_score(destroyed, enemies.score[rows, i])
+        self.add_boss_gauge(destroyed, kind)
+        enemies.kill(rows[destroyed], i[destroyed])
+
+    def add_score(self, mask, value):
+        # スコア加算と1000点ごとのステージアップ
+        self.score += np.where(mask, value, 0)
+        self.stage += mask & (self.score > 0) & (self.score % 1000 == 0)
+
+    def add_boss_gauge(self, mask, kind):
+        # ボス出現前のみゲージを加算
+        gauge = np.choose(kind, [GAUGE_INCREASE[ENEMY_SMALL], GAUGE_INCREASE[ENEMY_MEDIUM],
+                                 GAUGE_INCREASE[ENEMY_BOSS]])
+        add = mask & ~self.boss_appeared
+        self.boss_gauge = np.where(add, np.minimum(self.boss_gauge + gauge, self.boss_gauge_max),
+                                   self.boss_gauge).astype(np.int32)
+
+    def spawn_enemy(self, mask):
+        # 小型と中型をランダムに生成（ステージに応じて強化）
+        stage_factor = np.minimum(self.stage * 0.15, 1.0)
+        small = self.random(mask) < 0.5
+        x = np.where(small, self.randint(0, 152, mask), self.randint(10, 142, mask))
+        y = np.where(small, self.randint(-20, -10, mask), self.randint(-30, -20, mask))
+        vy = np.where(small, self.uniform(0.8, 2.0, mask), self.uniform(0.5, 1.2, mask)) * (1 + stage_factor)
+        vx = np.where(small, 0.0, self.choice(-0.8, 0.8, mask) * (1 + stage_factor * 0.5))
+        self.enemies.spawn(
+            mask, x=x, y=y, w=np.where(small, 8, 16), h=np.where(small, 8, 16), vx=vx, vy=vy,
+            kind=np.where(small, ENEMY_SMALL, ENEMY_MEDIUM),
+            hp=np.where(small, 1, 2), timer=0,
+            score=np.where(small, 10, 50),
+            fire_rate=np.where(small, 0.005 + stage_factor * 0.01, 0.015 + stage_factor * 0.02))
+
+        # 低確率でパワーアップアイテムを直接生成
+        drop = mask & (self.random(mask) < 0.03 + stage_factor * 0.01)
+        self.spawn_powerup(drop, self.randint(10, 150, drop), self.randint(-20, -10, drop))
+
+    def spawn_boss(self, mask):
+        self.boss_appeared |= mask
+        self.enemies.spawn(
+            mask, x=self.randint(20, 140, mask), y=self.randint(-40, -30, mask), w=16, h=16,
+            vx=self.choice(-0.8, 0.8, mask), vy=0.4, kind=ENEMY_BOSS, hp=10 + self.stage * 2,
+            timer=30, score=500, fire_rate=0, pattern=boss_pattern_index(self.stage),
+            phase=0)
+        # ボス出現時に必ずパワーアップアイテムも出現させる
+        self.spawn_powerup(mask, self.randint(10, 150, mask), self.randint(-20, -10, mask))
+
+    def spawn_powerup(self, mask, x, y):
+        if mask.any():
+            kind = self.choice(POWERUP_POWER, POWERUP_SHIELD, mask)
+            self.powerups.spawn(mask, x=x, y=y, w=8, h=8, vy=1, kind=kind)
+
+    # --- 観測 ---
+
+    def observe(self):
+        # 観測を使い回しの配列に書き込んで返す
+        obs = self.observations
+        obs[:, 0] = self.player_x
+        obs[:, 1] = self.player_y
+        obs[:, 2] = self.lives
+        obs[:, 3] = self.invincible
+        obs[:, 4] = self.shield
+        obs[:, 5] = self.power_level
+        obs[:, 6] = self.stage
+        obs[:, 7] = self.boss_gauge / self.boss_gauge_max
+        # 空きスロットは0のまま残し、使用中のスロットにだけ書き込む
+        obs[:, PLAYER_FEATURES:] = 0
+        offset = PLAYER_FEATURES
+        for store, names in ((self.enemies, ('x', 'y', 'vx', 'vy', 'kind', 'hp')),
+                             (self.shots, ('x', 'y', 'vx', 'vy')),
+                             (self.bullets, ('x', 'y', 'vx', 'vy', 'kind')),
+                             (self.powerups, ('x', 'y', 'kind'))):
+            features = len(names) + 1
+            view = obs[:, offset:offset + store.capacity * features].reshape(
+                self.n, store.capacity, features)
+            view[:, :, 0] = store.alive
+            for f, name in enumerate(names, 1):
+                np.copyto(view[:, :, f], getattr(store, name), casting='unsafe', where=store.alive)
+            offset += store.capacity * features
+        return obs
+
+
+def random_actions(rng, n):
+    # 発射しながらランダムに動く入力
+    moves = np.array([0, BTN_LEFT, BTN_RIGHT, BTN_UP, BTN_DOWN])
+    return moves[rng.integers(0, len(moves), n)] | BTN_SPACE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure BatchEnv throughput against a loop of Simulation")
+    parser.add_argument('--envs', type=int, default=1024)
+    parser.add_argument('--frames', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    env = BatchEnv()
+    env.reset(args.envs, np.arange(args.envs) + args.seed)
+    episodes = 0
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        _, _, dones = env.step(random_actions(rng, args.envs))
+        episodes += int(dones.sum())
+    batch_rate = args.envs * args.frames / (time.perf_counter() - start)
+
+    # 比較用: 同じ数のSimulationを1つずつ進める（時間がかかるので少ないフレームで見積もる）
+    sims = [Simulation(seed=args.seed + k) for k in range(args.envs)]
+    for sim in sims:
+        sim.start_game()
+    inp = InputState()
+    frames = max(1, min(args.frames, 20000 // args.envs))
+    start = time.perf_counter()
+    for _ in range(frames):
+        actions = random_actions(rng, args.envs).tolist()
+        for sim, action in zip(sims, actions):
+            inp.buttons = action
+            sim.step(inp)
+    loop_rate = args.envs * frames / (time.perf_counter() - start)
+
+    print(f"BatchEnv:        {batch_rate:>12.0f} game frames/s  ({episodes} episodes finished)")
+    print(f"Simulation loop: {loop_rate:>12.0f} game frames/s  ({batch_rate / loop_rate:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
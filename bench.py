@@ -0,0 +1,305 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from patterns import BOSS_PATTERNS
+from quality import QUALITY_LEVELS, level_capacity
+from simulation import (Simulation, InputState, BTN_LEFT, BTN_RIGHT, BTN_SPACE,
+                        SHOT_PLAYER, SHOT_ENEMY, ENEMY_SMALL, ENEMY_MEDIUM,
+                        POWERUP_POWER, POWERUP_SHIELD, SCREEN_WIDTH, SCREEN_HEIGHT)
+
+# 毎フレーム戻す残機（ゲームオーバーで計測が止まらないように）
+# 無敵時間があるので1フレームで減る残機は1つまで。HUDの残機表示も実際の数のまま描ける
+BENCH_LIVES = 3
+# ボス戦の台本で使う弾幕（BOSS_PATTERNSの番号）
+PATTERN_SPREAD = [spec['type'] for spec in BOSS_PATTERNS].index('spread')
+PATTERN_SPIRAL = [spec['type'] for spec in BOSS_PATTERNS].index('spiral')
+
+
+class Scenario:
+    # ベンチマーク用の台本
+    # setup(sim)で初期状態を作り、毎フレームscript(sim, frame, inp)で入力と状態を整える
+    # optionsはSimulationに渡す引数（容量を変える台本だけが使う）
+    def __init__(self, name, frames, setup, script, options=None):
+        self.name = name
+        self.frames = frames
+        self.setup = setup
+        self.script = script
+        self.options = options or {}
+
+
+def start_playing(sim):
+    sim.start_game()
+
+
+def weave(sim, frame, inp):
+    # 左右に往復しながら撃ち続ける
+    sim.player['lives'] = BENCH_LIVES
+    inp.buttons = BTN_SPACE | (BTN_LEFT if (frame // 45) % 2 else BTN_RIGHT)
+
+
+def idle(sim, frame, inp):
+    inp.buttons = 0
+
+
+def setup_stage(stage):
+    def setup(sim):
+        start_playing(sim)
+        sim.stage = stage
+        sim.bg_color = (sim.stage - 1) % 5
+    return setup
+
+
+def keep_boss(pattern):
+    # ボスが画面にいない間はゲージを満タンにして出し直す（撃たずに弾幕を浴び続ける）
+    # 弾幕はpattern（BOSS_PATTERNSの番号）に固定する。ステージごとのパターンの割り当てが
+    # 変わっても同じ弾幕を計測し続ける（ボスは出現から30フレーム撃たないので最初の弾幕から固定される）
+    def script(sim, frame, inp):
+        sim.player['lives'] = BENCH_LIVES
+        i = sim.enemies.resolve(sim.boss)
+        if i < 0:
+            sim.boss_appeared = False
+            sim.boss_gauge = sim.boss_gauge_max
+        else:
+            sim.enemies.pattern[i] = pattern
+        inp.buttons = BTN_LEFT if (frame // 45) % 2 else BTN_RIGHT
+    return script
+
+
+def keep_shield(sim, frame, inp):
+    sim.player['shield'] = 300
+    weave(sim, frame, inp)
+
+
+def fill_to_caps(sim, frame, inp):
+    # すべての格納庫を上限まで埋める
+    rng = sim.rng
+    while len(sim.enemies) < sim.max_enemies:
+        kind = rng.choice([ENEMY_SMALL, ENEMY_MEDIUM])
+        size = 8 if kind == ENEMY_SMALL else 16
+        sim.enemies.spawn(rng.uniform(0, 160 - size), rng.uniform(-20, 100), size, size,
+                          vx=0.8 if kind == ENEMY_MEDIUM else 0, vy=0.5, kind=kind,
+                          hp=2, score=10, fire_rate=0.02)
+    while len(sim.shots) + len(sim.bullets) < sim.max_shots:
+        if rng.random() < 0.5:
+            sim.shots.spawn(rng.uniform(0, 158), rng.uniform(0, 120), 2, 4, vy=-4, kind=SHOT_PLAYER, hp=1)
+        else:
+            sim.bullets.spawn(rng.uniform(0, 158), rng.uniform(0, 120), 2, 4, vy=2, kind=SHOT_ENEMY, hp=1)
+    while len(sim.powerups) < 8:
+        sim.powerups.spawn(rng.uniform(0, 152), rng.uniform(-20, 60), 8, 8, vy=1,
+                           kind=rng.choice([POWERUP_POWER, POWERUP_SHIELD]))
+    # 爆発の位置は見た目だけの乱数から引く（粒子の数でゲームの乱数の進み方が変わらないように）
+    effects_rng = sim.effects_rng
+    while sim.particles.room(sim.max_particles) > 16:
+        sim.create_explosion(effects_rng.uniform(0, 160), effects_rng.uniform(0, 120))
+    weave(sim, frame, inp)
+
+
+def particle_storm(sim, frame, inp):
+    # 最も高い画質で、毎フレーム爆発を起こして粒子を上限近くに保つ（数秒ごとにボスの爆発も）
+    sim.max_particles = sim.particles.capacity
+    sim.particle_density = QUALITY_LEVELS[-1]['particle_density']
+    rng = sim.effects_rng
+    for _ in range(8):
+        sim.create_explosion(rng.uniform(0, 160), rng.uniform(0, 120))
+    if frame % 90 == 0:
+        sim.emit('boss_explosion', rng.uniform(40, 120), rng.uniform(20, 80))
+    keep_shield(sim, frame, inp)
+
+
+def setup_triple(sim):
+    start_playing(sim)
+    sim.player['power_level'] = 2
+
+
+def hold_fire(sim, frame, inp):
+    sim.player['power_level'] = 2
+    weave(sim, frame, inp)
+
+
+SCENARIOS = [
+    Scenario('title', 3000, lambda sim: None, idle),
+    Scenario('stage1', 3000, start_playing, weave),
+    Scenario('stage10_boss', 3000, setup_stage(10), keep_boss(PATTERN_SPREAD)),  # 扇状の散弾
+    Scenario('stage15_spiral', 3000, setup_stage(15), keep_boss(PATTERN_SPIRAL)),  # 弾幕の弾が最も多いパターン
+    Scenario('shield', 3000, start_playing, keep_shield),
+    Scenario('max_entities', 3000, start_playing, fill_to_caps),
+    Scenario('triple_shot', 10000, setup_triple, hold_fire),
+    Scenario('particles', 3000, start_playing, particle_storm, options=level_capacity(QUALITY_LEVELS)),
+]
+
+
+def percentile_us(times, q):
+    return float(np.percentile(times, q) * 1e6) if len(times) else 0.0
+
+
+def run_scenario(scenario, frames, seed, app=None):
+    sim = Simulation(seed=seed, **scenario.options)
+    scenario.setup(sim)
+    if app is not None:
+        app.sim = sim
+    inp = InputState()
+    update_times = np.zeros(frames)
+    draw_times = np.zeros(frames if app is not None else 0)
+    clock = time.perf_counter
+    for frame in range(frames):
+        scenario.script(sim, frame, inp)
+        start = clock()
+        sim.step(inp)
+        update_times[frame] = clock() - start
+        if app is not None:
+            start = clock()
+            app.draw()
+            draw_times[frame] = clock() - start
+
+    result = {
+        'frames': frames,
+        'fps': frames / update_times.sum(),
+        'update_p50_us': percentile_us(update_times, 50),
+        'update_p99_us': percentile_us(update_times, 99),
+        'entities': {
+            'shots': len(sim.shots),
+            'bullets': len(sim.bullets),
+            'enemies': len(sim.enemies),
+            'powerups': len(sim.powerups),
+            'particles': len(sim.particles),
+        },
+    }
+    if app is not None:
+        result['draw_p50_us'] = percentile_us(draw_times, 50)
+        result['draw_p99_us'] = percentile_us(draw_times, 99)
+        result['fps'] = frames / (update_times.sum() + draw_times.sum())
+    return result
+
+
+def measure_allocations(scenario, frames, seed):
+    # tracemallocを有効にして別に走らせる（計測中は遅くなるため時間の計測とは分ける）
+    # alloc_peak_bytes: 1フレーム内で一時的に確保されたメモリの最大値の平均
+    # net_blocks_per_frame: フレームをまたいで残ったメモリブロック数の増加（定常状態では0に近いはず）
+    sim = Simulation(seed=seed, **scenario.options)
+    scenario.setup(sim)
+    inp = InputState()
+    warmup = min(100, frames // 2)
+    for frame in range(warmup):
+        scenario.script(sim, frame, inp)
+        sim.step(inp)
+
+    tracemalloc.start()
+    peaks = np.zeros(frames - warmup)
+    blocks_before = sys.getallocatedblocks()
+    for k, frame in enumerate(range(warmup, frames)):
+        scenario.script(sim, frame, inp)
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        sim.step(inp)
+        peaks[k] = tracemalloc.get_traced_memory()[1] - current
+    blocks_after = sys.getallocatedblocks()
+    tracemalloc.stop()
+    return {
+        'alloc_peak_bytes': float(peaks.mean()) if peaks.size else 0.0,
+        'net_blocks_per_frame': (blocks_after - blocks_before) / max(1, peaks.size),
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def create_app(software=False):
+    # 描画の計測用にpyxelのフロントエンドを用意する（ウィンドウが必要）
+    # softwareならNumPyの画面に描くので、ディスプレイの無い環境でも計測できる
+    # 画質は自動調整せず、従来の値の段階に固定する
+    import main
+    from quality import DEFAULT_LEVEL
+    if not software:
+        return main.StarDefender(quality=DEFAULT_LEVEL)
+    from renderer import FramebufferRenderer
+    return main.StarDefender(quality=DEFAULT_LEVEL, eager_assets=True,
+                             renderer=FramebufferRenderer(SCREEN_WIDTH, SCREEN_HEIGHT))
+
+
+def print_results(results):
+    header = f"{'scenario':<14} {'fps':>9} {'upd p50':>9} {'upd p99':>9}"
+    has_draw = any('draw_p50_us' in r for r in results.values())
+    if has_draw:
+        header += f" {'draw p50':>9} {'draw p99':>9}"
+    header += f" {'alloc B':>9} {'blocks/f':>9}"
+    print(header)
+    for name, r in results.items():
+        line = f"{name:<14} {r['fps']:>9.0f} {r['update_p50_us']:>9.1f} {r['update_p99_us']:>9.1f}"
+        if has_draw:
+            line += f" {r.get('draw_p50_us', 0):>9.1f} {r.get('draw_p99_us', 0):>9.1f}"
+        line += f" {r.get('alloc_peak_bytes', 0):>9.0f} {r.get('net_blocks_per_frame', 0):>9.2f}"
+        print(line)
+
+
+def print_comparison(results, baseline):
+    # 前回の結果との比較（fpsの変化率）
+    print()
+    print(f"{'scenario':<14} {'old fps':>9} {'new fps':>9} {'change':>8}")
+    for name, r in results.items():
+        old = baseline.get('scenarios', {}).get(name)
+        if not old:
+            continue
+        change = (r['fps'] / old['fps'] - 1) * 100
+        print(f"{name:<14} {old['fps']:>9.0f} {r['fps']:>9.0f} {change:>+7.1f}%")
+
+
+def main():
+    names = [s.name for s in SCENARIOS]
+    parser = argparse.ArgumentParser(description="Benchmark update (and optionally draw) cost per scenario")
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                        help=f"scenarios to run (default: all of {', '.join(names)})")
+    parser.add_argument('--frames', type=int, help="override the frame count of every scenario")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--draw', action='store_true', help="also time drawing (needs a pyxel window)")
+    parser.add_argument('--software', action='store_true',
+                        help="also time drawing into the NumPy framebuffer (no window needed)")
+    parser.add_argument('--no-alloc', action='store_true', help="skip the allocation pass")
+    parser.add_argument('--json', metavar='PATH', help="write results as JSON")
+    parser.add_argument('--compare', metavar='PATH', help="compare with an earlier JSON result")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(names)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+
+    app = create_app(args.software) if args.draw or args.software else None
+    selected = [s for s in SCENARIOS if not args.scenarios or s.name in args.scenarios]
+    results = {}
+    for scenario in selected:
+        frames = args.frames or scenario.frames
+        results[scenario.name] = run_scenario(scenario, frames, args.seed, app)
+        if not args.no_alloc:
+            results[scenario.name].update(measure_allocations(scenario, min(frames, 1000), args.seed))
+
+    print_results(results)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+    if args.json:
+        report = {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'seed': args.seed,
+            'renderer': 'software' if args.software else 'pyxel' if args.draw else None,
+            'scenarios': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from collision import CollisionWorld
+
+
+def check_collision(obj1, obj2):
+    # 従来の総当たりで使っていた矩形衝突判定（比較用）
+    return not (
+        obj1['x'] + obj1['width'] <= obj2['x'] or
+        obj1['x'] >= obj2['x'] + obj2['width'] or
+        obj1['y'] + obj1['height'] <= obj2['y'] or
+        obj1['y'] >= obj2['y'] + obj2['height']
+    )
+
+
+def make_scene(n_shots, n_enemies, seed):
+    # 画面内にランダムに弾と敵を配置
+    rng = random.Random(seed)
+    shots = [{'x': rng.uniform(0, 158), 'y': rng.uniform(-4, 136), 'width': 2, 'height': 4}
+             for _ in range(n_shots)]
+    enemies = []
+    for _ in range(n_enemies):
+        size = rng.choice([8, 16])
+        enemies.append({'x': rng.uniform(0, 160 - size), 'y': rng.uniform(-30, 140),
+                        'width': size, 'height': size})
+    return shots, enemies
+
+
+def to_arrays(objs):
+    return tuple(np.array([o[k] for o in objs], dtype=np.float64)
+                 for k in ('x', 'y', 'width', 'height'))
+
+
+def pairwise(shots, enemies):
+    # 敵ごとに全弾を調べる従来の方法
+    pairs = 0
+    for enemy in enemies:
+        for shot in shots:
+            if check_collision(shot, enemy):
+                pairs += 1
+    return pairs
+
+
+def time_call(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pairwise, brute-force matrix and grid collision")
+    parser.add_argument('--sizes', default="1,2,4,8,16,32,64,128,256,512,1024",
+                        help="comma separated entity counts (shots = enemies = N)")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    brute = CollisionWorld(brute_force_limit=float('inf'))
+    grid = CollisionWorld(brute_force_limit=0)
+
+    print(f"{'N':>6} {'pairs':>6} {'pairwise us':>12} {'matrix us':>10} {'grid us':>10}")
+    crossover_pairwise = None
+    crossover_matrix = None
+    for n in [int(v) for v in args.sizes.split(',')]:
+        shots, enemies = make_scene(n, n, args.seed)
+        s = to_arrays(shots)
+        e = to_arrays(enemies)
+
+        # 3つの方法が同じ結果になることを確認してから計測
+        expected = pairwise(shots, enemies)
+        assert len(brute.overlap_pairs(*e, *s)[0]) == expected
+        assert len(grid.overlap_pairs(*e, *s)[0]) == expected
+
+        t_pairwise = time_call(lambda: pairwise(shots, enemies), max(1, args.repeat // 4))
+        t_matrix = time_call(lambda: brute.overlap_pairs(*e, *s), args.repeat)
+        t_grid = time_call(lambda: grid.overlap_pairs(*e, *s), args.repeat)
+        print(f"{n:>6} {expected:>6} {t_pairwise * 1e6:>12.1f} {t_matrix * 1e6:>10.1f} {t_grid * 1e6:>10.1f}")
+
+        if crossover_pairwise is None and t_grid < t_pairwise:
+            crossover_pairwise = n
+        if crossover_matrix is None and t_grid < t_matrix:
+            crossover_matrix = n
+
+    print(f"grid faster than pairwise check_collision from N = {crossover_pairwise}")
+    print(f"grid faster than brute-force matrix from N = {crossover_matrix}"
+          f" (CollisionWorld.brute_force_limit compares N*N)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+# 比較する起動方法（名前, main.pyに渡す引数）
+MODES = [
+    ('lazy', []),  # 最初の画面の後に素材を読み込む（通常の起動）
+    ('eager', ['--eager-assets']),  # 最初の画面の前に素材を読み込む（以前の起動）
+]
+
+
+def measure_startup(extra_args):
+    # main.pyを起動して最初の画面を描き終えるまでの時間を測る
+    # total: プロセスの起動から（インタプリタとimportを含む）, init/first_frame: pyxel.initの直前から
+    start = time.time()
+    result = subprocess.run([sys.executable, MAIN, '--startup-report', *extra_args],
+                            capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['total'] = report.pop('wall_time') - start
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time to the first drawn frame")
+    parser.add_argument('--runs', type=int, default=10, help="launches per mode (the median is shown)")
+    parser.add_argument('--json', metavar='PATH', help="write results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'mode':8} {'total ms':>9} {'init ms':>8} {'frame ms':>9} {'assets ms':>10}")
+    for name, extra_args in MODES:
+        reports = [measure_startup(extra_args) for _ in range(args.runs)]
+        median = {key: statistics.median(report.get(key, 0.0) for report in reports) * 1000
+                  for key in ('total', 'init', 'first_frame', 'load_assets')}
+        results[name] = median
+        print(f"{name:8} {median['total']:9.1f} {median['init']:8.1f} {median['first_frame']:9.1f} "
+              f"{median['load_assets']:10.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
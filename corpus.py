@@ -0,0 +1,207 @@
+import argparse
+import mmap
+import struct
+import itertools
+import time
+import weakref
+
+import numpy as np
+
+from replay import (InputEncoder, HEADER as REPLAY_HEADER, REPLAY_MAGIC, REPLAY_VERSION, SEED_LIMIT,
+                    clamp16, parse_replay, iter_frames, decode_runs, RAW_VERSION, run_replay)
+from rollout import resolve_policy
+from simulation import Simulation, InputState, BTN_SPACE
+
+# コーパス（多数のリプレイをまとめたパックファイル）の形式
+# ヘッダ: マジック, バージョン, セッション数, 索引の位置
+# 本体: リプレイファイルのバイト列をそのまま並べる（1つずつ切り出せばリプレイファイルになる）
+# 索引: セッションごとに INDEX_DTYPE の1行（ファイル末尾）
+# 読み込みはファイルをメモリマップし、必要なセッションの部分だけを読む
+PACK_MAGIC = b'SDPK'
+PACK_VERSION = 1
+PACK_HEADER = struct.Struct('<4sHIQ')
+INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),  # 本体の位置
+    ('length', '<u4'),  # バイト数
+    ('seed', '<u8'),
+    ('frames', '<u4'),
+])
+
+
+def count_frames(data):
+    # リプレイのフレーム数
+    _, version, body = parse_replay(data)
+    if version == RAW_VERSION:
+        return sum(1 for _ in iter_frames(version, body))
+    return sum(run[3] for run in decode_runs(body))
+
+
+class CorpusWriter:
+    # リプレイを1つずつ追記し、closeで索引を書く
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, 0, 0))
+        self.rows = []
+
+    def add(self, data, frames=None):
+        # リプレイファイルのバイト列を追加する（framesを省くと数える）
+        seed, _, _ = parse_replay(data)
+        if frames is None:
+            frames = count_frames(data)
+        self.rows.append((self.file.tell(), len(data), seed, frames))
+        self.file.write(data)
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.rows, INDEX_DTYPE).tobytes())
+        self.file.seek(0)
+        self.file.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(self.rows), index_offset))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Corpus:
+    # パックファイルをメモリマップして、セッションを1つずつ取り出す
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < PACK_HEADER.size:
+            raise ValueError(f"{path}: not a corpus pack")
+        magic, version, count, index_offset = PACK_HEADER.unpack_from(self.map)
+        if magic != PACK_MAGIC:
+            raise ValueError(f"{path}: not a corpus pack")
+        if version != PACK_VERSION:
+            raise ValueError(f"{path}: unsupported corpus version {version}")
+        # 索引は小さいのでコピーしておく（マップを指したままだと閉じられない）
+        self.index = np.frombuffer(self.map, INDEX_DTYPE, count, index_offset).copy()
+        # sessionで渡したビューのうち、呼び出し側がまだ持っているもの（捨てられたビューは自動で消える）
+        # 残っているとマップを閉じられないので、closeでまとめて解放する。ビューの比較は中身で行われるので通し番号をキーにする
+        self.views = weakref.WeakValueDictionary()
+        self.view_ids = itertools.count()
+
+    def __len__(self):
+        return len(self.index)
+
+    def session(self, i):
+        # i番目のセッションのリプレイファイルのバイト列（コピーせずにマップを指す）
+        # 返したビューはcloseで解放されるので、閉じた後も使うならbytes()でコピーしておく
+        row = self.index[i]
+        start = int(row['offset'])
+        view = memoryview(self.map)[start:start + int(row['length'])]
+        self.views[next(self.view_ids)] = view
+        return view
+
+    def replay(self, i, **options):
+        # i番目のセッションをヘッドレス再生し、最後の状態のSimulationを返す
+        data = self.session(i)
+        try:
+            return run_replay(data=data, **options)
+        finally:
+            # 登録はdataが捨てられたときに消える
+            data.release()
+
+    def close(self):
+        for view in list(self.views.values()):
+            view.release()
+        self.views.clear()
+        try:
+            self.map.close()
+        except BufferError:
+            # sessionのビューから作ったビュー（parse_replayの本体など）がまだ残っている
+            raise BufferError(f"{self.path}: a view of a session is still in use;"
+                              " release it or copy it with bytes() before closing") from None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def record_session(seed, policy, max_frames):
+    # 方策でゲームオーバー（またはmax_frames）まで遊び、リプレイのバイト列とフレーム数を返す
+    sim = Simulation(seed=seed)
+    encoder = InputEncoder()
+    act = policy(seed)
+    inp = InputState(BTN_SPACE)
+    # タイトル画面でスペースを押して始める（再生したときも同じ入力で始まる）
+    encoder.add(inp.buttons, 0, 0)
+    sim.step(inp)
+    frame = 0
+    while sim.scene != "GAMEOVER" and frame < max_frames:
+        act(sim, frame, inp)
+        encoder.add(inp.buttons, clamp16(inp.mouse_x), clamp16(inp.mouse_y))
+        sim.step(inp)
+        frame += 1
+    encoder.flush()
+    data = REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed) + encoder.out
+    return bytes(data), encoder.frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and read packed replay corpora")
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack_parser = commands.add_parser('pack', help="pack replay files into a corpus")
+    pack_parser.add_argument('path')
+    pack_parser.add_argument('replays', nargs='+')
+    generate_parser = commands.add_parser('generate', help="record policy sessions into a corpus")
+    generate_parser.add_argument('path')
+    generate_parser.add_argument('--sessions', type=int, default=100)
+    generate_parser.add_argument('--seed', type=int, default=0, help="seed of the first session")
+    generate_parser.add_argument('--policy', default='random')
+    generate_parser.add_argument('--max-frames', type=int, default=5000)
+    info_parser = commands.add_parser('info', help="summarize a corpus")
+    info_parser.add_argument('path')
+    replay_parser = commands.add_parser('replay', help="replay sessions from a corpus headlessly")
+    replay_parser.add_argument('path')
+    replay_parser.add_argument('sessions', nargs='*', type=int, metavar='INDEX',
+                               help="session indices (default: all)")
+    args = parser.parse_args()
+    if args.command == 'generate' and not 0 <= args.seed <= SEED_LIMIT - args.sessions:
+        parser.error(f"the seeds of the recorded sessions must be between 0 and {SEED_LIMIT - 1}")
+
+    if args.command == 'pack':
+        with CorpusWriter(args.path) as writer:
+            for path in args.replays:
+                with open(path, 'rb') as f:
+                    writer.add(f.read())
+        print(f"packed {len(args.replays)} replays into {args.path}")
+    elif args.command == 'generate':
+        policy = resolve_policy(args.policy)
+        start = time.perf_counter()
+        with CorpusWriter(args.path) as writer:
+            for seed in range(args.seed, args.seed + args.sessions):
+                data, frames = record_session(seed, policy, args.max_frames)
+                writer.add(data, frames)
+        print(f"recorded {args.sessions} sessions in {time.perf_counter() - start:.1f}s")
+    elif args.command == 'info':
+        with Corpus(args.path) as corpus:
+            index = corpus.index
+            frames = int(index['frames'].sum())
+            size = int(index['length'].sum())
+            print(f"sessions: {len(corpus)}  frames: {frames}  input bytes: {size}"
+                  f"  ({size / max(frames, 1):.3f} bytes/frame)")
+    else:
+        with Corpus(args.path) as corpus:
+            sessions = args.sessions or range(len(corpus))
+            start = time.perf_counter()
+            frames = 0
+            for i in sessions:
+                sim = corpus.replay(i)
+                frames += sim.frame_count
+                print(f"{i:6d} seed {sim.seed}  frames {sim.frame_count}  score {sim.score}"
+                      f"  stage {sim.stage}  scene {sim.scene}")
+            elapsed = time.perf_counter() - start
+            print(f"replayed {frames} frames in {elapsed:.2f}s ({frames / max(elapsed, 1e-9):.0f} fps)")
+
+
+if __name__ == '__main__':
+    main()
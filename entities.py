@@ -0,0 +1,195 @@
+import numpy as np
+
+EMPTY = np.zeros(0, np.int64)  # 空のスロット一覧
+
+
+class EntityStore:
+    # 構造体配列（SoA）形式のエンティティ格納庫
+    # 属性ごとにNumPy配列を持ち、aliveマスクで使用中のスロットを表す
+    # 固定容量のプールとして働き、空きスロットはスタックでO(1)に取得・返却する
+    def __init__(self, capacity, columns=None):
+        self.capacity = capacity
+
+        # 共通の列
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.w = np.zeros(capacity)
+        self.h = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.kind = np.zeros(capacity, np.int8)
+        self.hp = np.zeros(capacity, np.int32)
+        self.timer = np.zeros(capacity, np.int32)
+        self.alive = np.zeros(capacity, np.bool_)
+        self.seq = np.zeros(capacity, np.int64)  # 生成順（古いものから処理するため）
+        self.generation = np.zeros(capacity, np.int64)  # 解放されるたびに増える世代
+
+        # 格納庫ごとの追加の列（名前: dtype）
+        self.extra_columns = dict(columns or {})
+        for name, dtype in self.extra_columns.items():
+            setattr(self, name, np.zeros(capacity, dtype))
+
+        self.count = 0
+        self.next_seq = 0
+
+        # 毎フレームの判定で使い回す作業用の配列（スナップショットには含めない）
+        self.scratch = np.zeros(capacity)
+        self.hit_mask = np.zeros(capacity, np.bool_)
+        self.test_mask = np.zeros(capacity, np.bool_)
+        self.heading_mask = np.zeros(capacity, np.bool_)
+
+        # 空きスロットのスタック（小さい番号から使う）
+        self.free_slots = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return self.count
+
+    def column_names(self):
+        # スナップショットなどで使う全列の名前
+        names = ['x', 'y', 'w', 'h', 'vx', 'vy', 'kind', 'hp', 'timer', 'alive', 'seq',
+                 'generation']
+        return names + list(self.extra_columns)
+
+    def spawn(self, x, y, w, h, vx=0.0, vy=0.0, kind=0, hp=0, timer=0, **extra):
+        # 空きスロットに追加（満杯なら-1を返して何もしない）
+        if not self.free_slots:
+            return -1
+        i = self.free_slots.pop()
+        self.x[i] = x
+        self.y[i] = y
+        self.w[i] = w
+        self.h[i] = h
+        self.vx[i] = vx
+        self.vy[i] = vy
+        self.kind[i] = kind
+        self.hp[i] = hp
+        self.timer[i] = timer
+        for name, value in extra.items():
+            getattr(self, name)[i] = value
+        self.alive[i] = True
+        self.seq[i] = self.next_seq
+        self.next_seq += 1
+        self.count += 1
+        return i
+
+    def spawn_many(self, x, y, w, h, vx, vy, kind=0, hp=0):
+        # vx, vyの数だけまとめて追加（空きが足りない分は捨てる）し、使ったスロットを返す
+        # x, y, w, hはスカラーか同じ長さの配列
+        n = min(len(vx), len(self.free_slots))
+        if n == 0:
+            return EMPTY
+        slots = np.array(self.free_slots[:-n - 1:-1], np.int64)
+        del self.free_slots[-n:]
+        for column, value in ((self.x, x), (self.y, y), (self.w, w), (self.h, h)):
+            column[slots] = value[:n] if np.ndim(value) else value
+        self.vx[slots] = vx[:n]
+        self.vy[slots] = vy[:n]
+        self.kind[slots] = kind
+        self.hp[slots] = hp
+        self.timer[slots] = 0
+        self.alive[slots] = True
+        self.seq[slots] = np.arange(self.next_seq, self.next_seq + n)
+        self.next_seq += n
+        self.count += n
+        return slots
+
+    def kill(self, i):
+        # スロットをプールに返す（古いハンドルは無効になる）
+        if self.alive[i]:
+            self.alive[i] = False
+            self.generation[i] += 1
+            self.free_slots.append(int(i))
+            self.count -= 1
+
+    def kill_mask(self, mask):
+        # マスクで指定したスロットをまとめて削除（何も消さないフレームは配列を作らない）
+        np.logical_and(mask, self.alive, out=self.test_mask)
+        if np.count_nonzero(self.test_mask):
+            for i in self.test_mask.nonzero()[0]:
+                self.kill(i)
+
+    def clear(self):
+        self.generation[self.alive] += 1
+        self.alive[:] = False
+        self.free_slots[:] = range(self.capacity - 1, -1, -1)
+        self.count = 0
+
+    def handle(self, i):
+        # スロットと世代を組み合わせた安定したハンドル
+        return int(self.generation[i]) * self.capacity + int(i)
+
+    def resolve(self, handle):
+        # ハンドルが指すスロット（解放済み・再利用済みなら-1）
+        if handle is None:
+            return -1
+        i = handle % self.capacity
+        if self.alive[i] and self.generation[i] == handle // self.capacity:
+            return i
+        return -1
+
+    def indices(self, mask=None):
+        # 使用中（またはmaskで絞り込んだ）スロットを生成順に返す
+        if not self.count:
+            return EMPTY
+        if mask is None:
+            mask = self.alive
+        idx = mask.nonzero()[0]
+        if idx.size > 1:
+            idx = idx[np.argsort(self.seq[idx], kind='stable')]
+        return idx
+
+    def keep_newest(self, n):
+        # 新しいものからn個だけ残す
+        if self.count > n:
+            for i in self.indices()[:self.count - n]:
+                self.kill(i)
+
+    def overlaps(self, x, y, w, h, mask=None):
+        # 矩形(x, y, w, h)と重なっている使用中スロットのマスク
+        # 作業用の配列hit_maskを返すので、次にoverlaps/leaving/kill_maskを呼ぶ前に使い切る
+        if mask is None:
+            mask = self.alive
+        hit, test, edge = self.hit_mask, self.test_mask, self.scratch
+        np.add(self.x, self.w, out=edge)
+        np.greater(edge, x, out=hit)
+        hit &= mask
+        np.less(self.x, x + w, out=test)
+        hit &= test
+        np.add(self.y, self.h, out=edge)
+        np.greater(edge, y, out=test)
+        hit &= test
+        np.less(self.y, y + h, out=test)
+        hit &= test
+        return hit
+
+    def advance(self, dt):
+        # 全スロットを速度のdtフレーム分だけ動かす
+        # （使っていないスロットの位置は次のspawnで上書きされるので、マスクで絞らずに配列全体で足す）
+        step = self.scratch
+        np.multiply(self.vx, dt, out=step)
+        self.x += step
+        np.multiply(self.vy, dt, out=step)
+        self.y += step
+
+    def leaving(self, width, height):
+        # 画面(0, 0, width, height)の外にいて、さらに遠ざかっているスロットのマスク
+        # 作業用の配列hit_maskを返す（kill_maskにそのまま渡せる）
+        out, test, heading, edge = self.hit_mask, self.test_mask, self.heading_mask, self.scratch
+        np.greater(self.y, height, out=out)
+        np.greater_equal(self.vy, 0, out=heading)
+        out &= heading
+        np.negative(self.h, out=edge)
+        np.less(self.y, edge, out=test)
+        np.less_equal(self.vy, 0, out=heading)
+        test &= heading
+        out |= test
+        np.greater(self.x, width, out=test)
+        np.greater_equal(self.vx, 0, out=heading)
+        test &= heading
+        out |= test
+        np.negative(self.w, out=edge)
+        np.less(self.x, edge, out=test)
+        np.less_equal(self.vx, 0, out=heading)
+        test &= heading
+        out |= test
+        return out
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from rollout import rollout, resolve_policy
+from simulation import MAX_TIME_SCALE
+
+# 早送り（Simulationのtime_scale）の結果が通常の速さとどれだけ一致するかを調べる
+# 乱数を引く回数が変わるのでセッションごとの展開は一致しない。同じシードの集まりを
+# 速さごとに遊ばせ、結果の分布（平均と標準誤差）を通常の速さと比べる
+METRICS = [
+    # (名前, 集計する値)
+    ('score', lambda s: s['score']),
+    ('stage', lambda s: s['stage']),
+    ('frames', lambda s: s['frames']),  # 生き残ったフレーム数
+    ('game_over', lambda s: s['game_over'].astype(np.float64)),
+    ('deaths_enemy_shot', lambda s: s['deaths_enemy_shot']),
+    ('deaths_ram', lambda s: s['deaths_ram']),
+]
+
+
+def mean_and_error(values):
+    values = np.asarray(values, np.float64)
+    if values.size < 2:
+        return float(values.mean()), 0.0
+    return float(values.mean()), float(values.std(ddof=1) / np.sqrt(values.size))
+
+
+def compare(seeds, policy, max_frames, scales, workers):
+    # 速さごとに同じシードを遊ばせ、{速さ: {'elapsed', 'fps', 指標: (平均, 標準誤差)}} を返す
+    results = {}
+    for scale in scales:
+        start = time.perf_counter()
+        summaries = np.concatenate(list(rollout(seeds, policy, max_frames, workers, time_scale=scale)))
+        elapsed = time.perf_counter() - start
+        result = {'elapsed': elapsed, 'fps': float(summaries['frames'].sum()) / elapsed}
+        for name, value in METRICS:
+            result[name] = mean_and_error(value(summaries))
+        results[scale] = result
+    return results
+
+
+def print_report(results):
+    base_scale = min(results)
+    base = results[base_scale]
+    print(f"{'metric':<18}" + "".join(f"{f'x{scale}':>22}" for scale in results))
+    print(f"{'frames/s':<18}" + "".join(
+        f"{r['fps']:>12.0f} ({r['fps'] / base['fps']:4.1f}x)  " for r in results.values()))
+    for name, _ in METRICS:
+        cells = []
+        for scale, r in results.items():
+            mean, error = r[name]
+            if scale == base_scale:
+                cells.append(f"{mean:>12.2f} ±{error:<7.2f}  ")
+                continue
+            # 通常の速さとの差（%）と、差が標準誤差の何倍か（2を超えると偶然では説明しにくい）
+            base_mean, base_error = base[name]
+            diff = (mean - base_mean) / base_mean * 100 if base_mean else 0.0
+            z = (mean - base_mean) / max(np.hypot(error, base_error), 1e-9)
+            cells.append(f"{mean:>10.2f} {diff:+5.1f}% z{z:+4.1f}")
+        print(f"{name:<18}" + "".join(f"{cell:>22}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fast-forward outcomes with normal-speed stepping")
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0, help="first seed (sessions use seed, seed+1, ...)")
+    parser.add_argument('--policy', default='random')
+    parser.add_argument('--max-frames', type=int, default=30 * 60 * 5,
+                        help="stop a session after this many game frames (default: 5 minutes)")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help=f"time scales to compare (1 to {MAX_TIME_SCALE}, the smallest is the reference)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--json', metavar='PATH', help="write the comparison as JSON")
+    args = parser.parse_args()
+    try:
+        resolve_policy(args.policy)
+    except (ValueError, ImportError, AttributeError) as e:
+        parser.error(str(e))
+    if any(not 1 <= scale <= MAX_TIME_SCALE for scale in args.scales):
+        parser.error(f"--scales must be between 1 and {MAX_TIME_SCALE}")
+
+    seeds = range(args.seed, args.seed + args.sessions)
+    results = compare(seeds, args.policy, args.max_frames, sorted(set(args.scales)), args.workers)
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({str(scale): r for scale, r in results.items()}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from bench import SCENARIOS, create_app, git_commit
+from renderer import write_png
+from simulation import Simulation, InputState
+
+# 描画結果の比較（描画の最適化の前後で画面が1ドットも変わっていないかを確かめる）
+# ベンチマークの台本を進め、一定のフレームごとの画面をNumPyの画面（FramebufferRenderer）に描いて、
+# パレットの番号のまま記録する。ウィンドウの無い環境でも記録と比較ができる
+FRAMES_VERSION = 1
+DEFAULT_EVERY = 60  # 何フレームごとに画面を撮るか
+
+
+def reset_frontend(app):
+    # フロントエンドが前のセッションで描いたもの（星の層、静止した画面）を描き直させる
+    app.starfield_key = None
+    app.frame_cache_key = None
+    if not app.assets_loaded:
+        app.load_assets()
+
+
+def render_session(app, scenario, frames, seed, every):
+    # 1セッションを進め、(撮ったフレームの番号, (枚数, 高さ, 幅)の画面) を返す
+    sim = Simulation(seed=seed, **scenario.options)
+    scenario.setup(sim)
+    app.sim = sim
+    reset_frontend(app)
+    shots = [frame for frame in range(frames) if (frame + 1) % every == 0 or frame == frames - 1]
+    images = np.zeros((len(shots), app.gfx.screen.height, app.gfx.screen.width), np.uint8)
+    inp = InputState()
+    k = 0
+    for frame in range(frames):
+        scenario.script(sim, frame, inp)
+        sim.step(inp)
+        if frame == shots[k]:
+            app.draw()
+            images[k] = app.gfx.pixels()
+            k += 1
+            if k == len(shots):
+                break
+    return shots, images
+
+
+def select(names):
+    return [s for s in SCENARIOS if not names or s.name in names]
+
+
+def record(path, names, frames, seed, every):
+    app = create_app(software=True)
+    meta = {'version': FRAMES_VERSION, 'seed': seed, 'every': every, 'commit': git_commit(), 'sessions': []}
+    arrays = {}
+    for scenario in select(names):
+        n = frames or scenario.frames
+        shots, images = render_session(app, scenario, n, seed, every)
+        meta['sessions'].append({'name': scenario.name, 'frames': n, 'shots': shots})
+        arrays[scenario.name] = images
+        print(f"{scenario.name:<14} {n:6d} frames  {len(shots)} images")
+    np.savez_compressed(path, meta=json.dumps(meta), **arrays)
+
+
+def load_frames(path):
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        if meta.get('version') != FRAMES_VERSION:
+            raise ValueError(f"{path}: unsupported frames version {meta.get('version')}")
+        return meta, {s['name']: data[s['name']] for s in meta['sessions']}
+
+
+def report(name, shots, expected, actual, out=None):
+    # 1セッションの比較結果を表示し、一致していればTrueを返す
+    # outを指定すると、最初に違ったフレームの両方の画面と違うドットの位置をPNGで書き出す
+    differs = (expected != actual).reshape(len(shots), -1).sum(axis=1)
+    bad = differs.nonzero()[0]
+    if not bad.size:
+        print(f"{name:<14} identical ({len(shots)} images)")
+        return True
+    k = int(bad[0])
+    ys, xs = (expected[k] != actual[k]).nonzero()
+    print(f"{name:<14} differs at frame {shots[k]}: {differs[k]} pixels in x {xs.min()}-{xs.max()},"
+          f" y {ys.min()}-{ys.max()} ({bad.size} of {len(shots)} images differ)")
+    if out:
+        os.makedirs(out, exist_ok=True)
+        stem = os.path.join(out, f"{name}_{shots[k]:05d}")
+        write_png(f"{stem}_expected.png", expected[k])
+        write_png(f"{stem}_actual.png", actual[k])
+        write_png(f"{stem}_diff.png", np.where(expected[k] != actual[k], 8, 0).astype(np.uint8))
+    return False
+
+
+def check(path, out=None):
+    # 記録した画面と今のコードの画面を比べる
+    meta, images = load_frames(path)
+    scenarios = {s.name: s for s in SCENARIOS}
+    app = create_app(software=True)
+    ok = True
+    for session in meta['sessions']:
+        scenario = scenarios.get(session['name'])
+        if scenario is None:
+            print(f"{session['name']:<14} no longer exists")
+            ok = False
+            continue
+        shots, actual = render_session(app, scenario, session['frames'], meta['seed'], meta['every'])
+        ok &= report(session['name'], shots, images[session['name']], actual, out)
+    return ok
+
+
+def compare_backends(names, frames, seed, every, out=None):
+    # 同じ台本をpyxelとNumPyの画面に描いて比べる（pyxelのウィンドウが必要）
+    pyxel_app = create_app()
+    software_app = create_app(software=True)
+    ok = True
+    for scenario in select(names):
+        n = frames or scenario.frames
+        shots, expected = render_session(pyxel_app, scenario, n, seed, every)
+        _, actual = render_session(software_app, scenario, n, seed, every)
+        ok &= report(scenario.name, shots, expected, actual, out)
+    return ok
+
+
+def screenshots(out, names, frames, seed, every):
+    # 撮った画面をPNGで書き出す
+    os.makedirs(out, exist_ok=True)
+    app = create_app(software=True)
+    for scenario in select(names):
+        shots, images = render_session(app, scenario, frames or scenario.frames, seed, every)
+        for frame, image in zip(shots, images):
+            write_png(os.path.join(out, f"{scenario.name}_{frame:05d}.png"), image)
+        print(f"{scenario.name:<14} {len(shots)} images")
+
+
+def main():
+    names = [s.name for s in SCENARIOS]
+    parser = argparse.ArgumentParser(description="Record and compare rendered frames without a window")
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_parser = commands.add_parser('record', help="record golden frames with the current code")
+    record_parser.add_argument('path')
+    check_parser = commands.add_parser('check', help="compare the current code against recorded frames")
+    check_parser.add_argument('path')
+    compare_parser = commands.add_parser('compare',
+                                         help="compare the NumPy framebuffer with pyxel (needs a pyxel window)")
+    shot_parser = commands.add_parser('shot', help="write rendered frames as PNG files")
+    shot_parser.add_argument('out', metavar='DIR')
+    for p in (record_parser, compare_parser, shot_parser):
+        p.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                       help=f"scenarios to render (default: all of {', '.join(names)})")
+        p.add_argument('--frames', type=int, help="override the frame count of every scenario")
+        p.add_argument('--seed', type=int, default=1)
+        p.add_argument('--every', type=int, default=DEFAULT_EVERY, help="capture every N frames (and the last)")
+    for p in (check_parser, compare_parser):
+        p.add_argument('--out', metavar='DIR', help="write the first differing frame as PNG files")
+    args = parser.parse_args()
+    if args.command == 'check':
+        sys.exit(0 if check(args.path, args.out) else 1)
+
+    unknown = set(args.scenarios) - set(names)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+    if args.every < 1:
+        parser.error("--every must be at least 1")
+    if args.command == 'record':
+        record(args.path, args.scenarios, args.frames, args.seed, args.every)
+    elif args.command == 'shot':
+        screenshots(args.out, args.scenarios, args.frames, args.seed, args.every)
+    else:
+        sys.exit(0 if compare_backends(args.scenarios, args.frames, args.seed, args.every, args.out) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+import argparse
+import hashlib
+import json
+import struct
+import sys
+
+import numpy as np
+
+from bench import SCENARIOS, Scenario, start_playing, git_commit
+from rollout import resolve_policy
+from simulation import Simulation, InputState
+from snapshot import pack_rng
+
+# ゲームの状態のトレース（最適化の前後でゲームの展開が変わっていないかを確かめる）
+# 台本つきのセッションを毎フレーム進め、状態の項目ごとのハッシュを記録する
+# 格納庫は使用中のエンティティを生成順に並べてから列ごとにハッシュするので、
+# スロットの割り当て方が変わっても、中身と順番が同じなら同じトレースになる
+TRACE_VERSION = 1
+STATE_FIELDS = ['scene', 'is_paused', 'frame_count', 'game_frames', 'skip_frame', 'score', 'stage',
+                'enemy_spawn_timer', 'boss_gauge', 'boss_gauge_max', 'boss_appeared', 'bg_color',
+                'star_scroll', 'touch_last_x', 'touch_last_y', 'touch_fire_timer',
+                'touch_start_time', 'is_tap', 'is_touching']
+IGNORED_COLUMNS = {'alive', 'seq', 'generation'}  # 格納庫の管理用の列（中身ではない）
+STORES = ['shots', 'bullets', 'enemies', 'powerups']
+NUMBER = struct.Struct('<d')
+
+
+def digest(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def value_digest(value):
+    # 数値は型によらず値だけでハッシュする（intが等しいfloatになっても同じ）
+    if isinstance(value, str):
+        return digest(value.encode())
+    if value is None:
+        return digest(b'None')
+    return digest(NUMBER.pack(float(value)))
+
+
+def boss_order(sim):
+    # ボスが使用中の敵の中で生成順に何番目か（いなければ-1）
+    i = sim.enemies.resolve(sim.boss)
+    if i < 0:
+        return -1
+    return int((sim.enemies.indices() == i).argmax())
+
+
+def trace_fields(sim):
+    # [(項目名, sim -> ハッシュ)]（並びがトレースの列になる）
+    fields = [(name, lambda sim, name=name: value_digest(getattr(sim, name)))
+              for name in STATE_FIELDS]
+    fields += [(f'player.{key}', lambda sim, key=key: value_digest(sim.player[key]))
+               for key in sim.player]
+    fields += [(f'deaths.{cause}', lambda sim, cause=cause: value_digest(sim.deaths[cause]))
+               for cause in sorted(sim.deaths)]
+    fields += [(f'pickups.{name}', lambda sim, name=name: value_digest(sim.pickups[name]))
+               for name in sorted(sim.pickups)]
+    fields.append(('boss', lambda sim: value_digest(boss_order(sim))))
+    fields.append(('rng', lambda sim: digest(pack_rng(sim.rng))))
+    fields.append(('effects_rng', lambda sim: digest(pack_rng(sim.effects_rng))))
+    for store_name in STORES:
+        store = getattr(sim, store_name)
+        for column in store.column_names():
+            if column in IGNORED_COLUMNS:
+                continue
+            fields.append((f'{store_name}.{column}',
+                           lambda sim, s=store_name, c=column: column_digest(getattr(sim, s), c)))
+    # パーティクルは使用中の粒子が先頭に生成順で並んでいる
+    for column in sim.particles.column_names():
+        fields.append((f'particles.{column}',
+                       lambda sim, c=column: digest(getattr(sim.particles, c)[:sim.particles.count].tobytes())))
+    return fields
+
+
+def column_digest(store, column):
+    return digest(getattr(store, column)[store.indices()].tobytes())
+
+
+def trace_sessions(seed):
+    # トレースを取るセッション（ベンチマークの台本と、ゲームオーバーまで遊ぶランダムな方策）
+    return SCENARIOS + [Scenario('random_play', 3000, start_playing, resolve_policy('random')(seed))]
+
+
+def run_trace(scenario, frames, seed):
+    # 1セッションを進め、各フレームの後の項目ごとのハッシュを(frames, 項目数)の配列で返す
+    sim = Simulation(seed=seed, **scenario.options)
+    scenario.setup(sim)
+    fields = trace_fields(sim)
+    digests = np.zeros((frames, len(fields)), np.uint64)
+    inp = InputState()
+    for frame in range(frames):
+        scenario.script(sim, frame, inp)
+        sim.step(inp)
+        digests[frame] = [field(sim) for _, field in fields]
+    return [name for name, _ in fields], digests
+
+
+def record(path, names, frames, seed):
+    sessions = [s for s in trace_sessions(seed) if not names or s.name in names]
+    meta = {'version': TRACE_VERSION, 'seed': seed, 'commit': git_commit(), 'sessions': []}
+    arrays = {}
+    for scenario in sessions:
+        n = frames or scenario.frames
+        fields, digests = run_trace(scenario, n, seed)
+        meta['sessions'].append({'name': scenario.name, 'frames': n, 'fields': fields})
+        arrays[scenario.name] = digests
+        print(f"{scenario.name:<14} {n:6d} frames  {len(fields)} fields")
+    np.savez_compressed(path, meta=json.dumps(meta), **arrays)
+
+
+def load_trace(path):
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        if meta.get('version') != TRACE_VERSION:
+            raise ValueError(f"{path}: unsupported trace version {meta.get('version')}")
+        return meta, {s['name']: data[s['name']] for s in meta['sessions']}
+
+
+def first_divergence(fields_a, digests_a, fields_b, digests_b):
+    # 最初に食い違ったフレームとその時に違っていた項目（食い違いが無ければNone）
+    # 両方にある項目だけを比べる。フレーム数が違えば短い方の終わりまで
+    common = [name for name in fields_a if name in fields_b]
+    a = digests_a[:, [fields_a.index(name) for name in common]]
+    b = digests_b[:, [fields_b.index(name) for name in common]]
+    frames = min(len(a), len(b))
+    differs = a[:frames] != b[:frames]
+    rows = differs.any(axis=1).nonzero()[0]
+    if not rows.size:
+        return None
+    frame = int(rows[0])
+    return frame, [common[k] for k in differs[frame].nonzero()[0]]
+
+
+def report(name, fields_a, digests_a, fields_b, digests_b):
+    # 1セッションの比較結果を表示し、一致していればTrueを返す
+    result = first_divergence(fields_a, digests_a, fields_b, digests_b)
+    missing = sorted(set(fields_a) ^ set(fields_b))
+    if result is None:
+        note = f"  (not compared: {', '.join(missing)})" if missing else ""
+        length = "" if len(digests_a) == len(digests_b) else f" for the first {min(len(digests_a), len(digests_b))} frames"
+        print(f"{name:<14} identical{length}{note}")
+        return True
+    frame, changed = result
+    print(f"{name:<14} diverges at frame {frame}: {changed[0]}"
+          + (f" (also {', '.join(changed[1:])})" if len(changed) > 1 else ""))
+    return False
+
+
+def check(path):
+    # 記録したトレースと今のコードのトレースを比べる
+    meta, traces = load_trace(path)
+    sessions = {s.name: s for s in trace_sessions(meta['seed'])}
+    ok = True
+    for session in meta['sessions']:
+        scenario = sessions.get(session['name'])
+        if scenario is None:
+            print(f"{session['name']:<14} no longer exists")
+            ok = False
+            continue
+        fields, digests = run_trace(scenario, session['frames'], meta['seed'])
+        ok &= report(session['name'], session['fields'], traces[session['name']], fields, digests)
+    return ok
+
+
+def diff(path_a, path_b):
+    # 記録した2つのトレースを比べる
+    meta_a, traces_a = load_trace(path_a)
+    meta_b, traces_b = load_trace(path_b)
+    sessions_b = {s['name']: s for s in meta_b['sessions']}
+    ok = True
+    for session in meta_a['sessions']:
+        other = sessions_b.get(session['name'])
+        if other is None:
+            continue
+        ok &= report(session['name'], session['fields'], traces_a[session['name']],
+                     other['fields'], traces_b[session['name']])
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and compare per-frame game state hashes")
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_parser = commands.add_parser('record', help="record a golden trace with the current code")
+    record_parser.add_argument('path')
+    record_parser.add_argument('sessions', nargs='*', metavar='SESSION',
+                               help="sessions to record (default: all)")
+    record_parser.add_argument('--frames', type=int, help="override the frame count of every session")
+    record_parser.add_argument('--seed', type=int, default=1)
+    check_parser = commands.add_parser('check', help="compare the current code against a trace")
+    check_parser.add_argument('path')
+    diff_parser = commands.add_parser('diff', help="compare two recorded traces")
+    diff_parser.add_argument('path_a')
+    diff_parser.add_argument('path_b')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        known = {s.name for s in trace_sessions(args.seed)}
+        unknown = set(args.sessions) - known
+        if unknown:
+            parser.error(f"unknown session: {', '.join(sorted(unknown))}")
+        record(args.path, args.sessions, args.frames, args.seed)
+        return
+    ok = check(args.path) if args.command == 'check' else diff(args.path_a, args.path_b)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import queue
+import sqlite3
+import threading
+import time
+
+# ハイスコアの記録（SQLite）
+# ゲームのループからはキューに積むだけで、ディスクへの書き込みは別スレッドがまとめて行う
+# タイトル画面の表示にはスレッドが書き込みのたびに読み直した上位の記録を使う（ループはディスクを読まない）
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    played_at REAL NOT NULL,  -- ゲームオーバーの時刻（UNIX時間）
+    seed INTEGER,
+    score INTEGER NOT NULL,
+    stage INTEGER NOT NULL,
+    frames INTEGER NOT NULL  -- 遊んだフレーム数
+);
+CREATE INDEX IF NOT EXISTS sessions_score ON sessions (score DESC);
+CREATE INDEX IF NOT EXISTS sessions_stage_score ON sessions (stage, score DESC);
+"""
+INSERT_SESSION = "INSERT INTO sessions (played_at, seed, score, stage, frames) VALUES (?, ?, ?, ?, ?)"
+TOP_QUERY = "SELECT score, stage, played_at FROM sessions ORDER BY score DESC, played_at LIMIT ?"
+STAGE_BESTS_QUERY = "SELECT stage, MAX(score) FROM sessions GROUP BY stage ORDER BY stage"
+HISTORY_QUERY = "SELECT played_at, seed, score, stage, frames FROM sessions ORDER BY id DESC LIMIT ?"
+TOP_COUNT = 5  # 覚えておく上位の記録の数
+QUEUE_SIZE = 64  # 書き込み待ちの記録の上限（あふれた分は捨てる）
+BATCH_SIZE = 32  # 1回のトランザクションで書く記録の上限
+STOP = None  # 書き込みスレッドを止める印
+
+
+def connect(path):
+    # 遅いストレージでも書き込みが短く済むように、WALで同期を減らす
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def merge_top(top, entry, count):
+    # 上位の記録にentry (score, stage, played_at) を加えた新しいタプル
+    return tuple(sorted(top + (entry,), key=lambda e: (-e[0], e[2]))[:count])
+
+
+def merge_row(top, stage_bests, row, count):
+    # 書き込み待ちの行 (played_at, seed, score, stage, frames) を上位の記録とステージごとの最高スコアに加える
+    played_at, _, score, stage, _ = row
+    top = merge_top(top, (score, stage, played_at), count)
+    if score > stage_bests.get(stage, -1):
+        stage_bests = {**stage_bests, stage: score}
+    return top, stage_bests
+
+
+class Leaderboard:
+    # ハイスコアの記録と上位の記録の読み出し
+    # recordはキューに積むだけで待たない。top/stage_bestsはメモリ上のコピーを返す
+    def __init__(self, path, top_count=TOP_COUNT, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE):
+        self.path = path
+        self.top_count = top_count
+        self.batch_size = batch_size
+        self.queue = queue.Queue(queue_size)
+        # 読み出し用のコピー（丸ごと置き換えるので読むときはロックは要らない）
+        # 置き換えはlockの中で行い、キューに積んだがまだ書いていない記録pendingと食い違わないようにする
+        self.lock = threading.Lock()
+        self.pending = []  # 書き込み待ちの行（キューに積んだのと同じタプル）
+        self.top = ()  # (score, stage, played_at) のタプル、スコアの高い順
+        self.stage_bests = {}  # ステージ: そのステージで終わった記録の最高スコア
+        self.dropped = 0  # キューがあふれて捨てた記録の数
+        self.error = None  # 書き込みスレッドで起きた例外（起きたらスレッドは止まり、以降の記録は捨てる）
+        self.thread = threading.Thread(target=self.run, name="leaderboard", daemon=True)
+        self.thread.start()
+
+    def record(self, score, stage, frames, seed=None):
+        # 1セッションの結果を書き込み待ちに積む（ゲームのループから呼ぶ）
+        row = (time.time(), seed, score, stage, frames)
+        with self.lock:
+            if self.error is not None:
+                # 書き込みスレッドが止まっているので、積んでも書かれない
+                self.dropped += 1
+                return
+            try:
+                self.queue.put_nowait(row)
+            except queue.Full:
+                self.dropped += 1
+                return
+            # 書き込みを待たずに表示に反映する（書き込んだ後に読み直した値で置き換わる）
+            self.pending.append(row)
+            self.top, self.stage_bests = merge_row(self.top, self.stage_bests, row, self.top_count)
+
+    def high_score(self):
+        return self.top[0][0] if self.top else 0
+
+    def close(self, timeout=2.0):
+        # 残りの記録を書き終えるまで待つ（終了時に呼ぶ）
+        if not self.thread.is_alive():
+            return
+        try:
+            self.queue.put(STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+    def run(self):
+        # 書き込みスレッド: 最初に記録を読み込み、その後はキューに積まれた記録をまとめて書く
+        try:
+            conn = connect(self.path)
+        except Exception as e:
+            self.error = e
+            return
+        try:
+            self.refresh(conn)
+            stopping = False
+            while not stopping:
+                rows = [self.queue.get()]
+                while len(rows) < self.batch_size:
+                    try:
+                        rows.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if STOP in rows:
+                    stopping = True
+                    rows = [row for row in rows if row is not STOP]
+                if rows:
+                    with conn:
+                        conn.executemany(INSERT_SESSION, rows)
+                    self.refresh(conn, rows)
+        except Exception as e:
+            # SQLiteのエラーに限らず（範囲外のシードのOverflowErrorなど）、止まった理由を残す
+            self.error = e
+        finally:
+            conn.close()
+
+    def refresh(self, conn, written=()):
+        # 読み直した記録に、まだ書いていない記録を足して置き換える
+        # （書いた記録は読み直した値に入っているので足さない。足すと同じ記録が2回並ぶ）
+        top = tuple(conn.execute(TOP_QUERY, (self.top_count,)))
+        stage_bests = dict(conn.execute(STAGE_BESTS_QUERY))
+        written = set(map(id, written))
+        with self.lock:
+            self.pending = [row for row in self.pending if id(row) not in written]
+            for row in self.pending:
+                top, stage_bests = merge_row(top, stage_bests, row, self.top_count)
+            self.top = top
+            self.stage_bests = stage_bests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the local high-score leaderboard")
+    parser.add_argument('path', help="leaderboard database")
+    parser.add_argument('--top', type=int, default=10, help="number of top scores to show")
+    parser.add_argument('--history', type=int, default=0, metavar='N', help="also show the last N sessions")
+    args = parser.parse_args()
+
+    conn = connect(args.path)
+    print(f"{'rank':>4} {'score':>7} {'stage':>5}  date")
+    for rank, (score, stage, played_at) in enumerate(conn.execute(TOP_QUERY, (args.top,)), 1):
+        print(f"{rank:>4} {score:>7} {stage:>5}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(played_at))}")
+    print()
+    print(f"{'stage':>5} {'best':>7}")
+    for stage, score in conn.execute(STAGE_BESTS_QUERY):
+        print(f"{stage:>5} {score:>7}")
+    if args.history:
+        print()
+        print(f"{'date':16} {'seed':>10} {'score':>7} {'stage':>5} {'frames':>7}")
+        for played_at, seed, score, stage, frames in conn.execute(HISTORY_QUERY, (args.history,)):
+            print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(played_at)):16} {seed if seed is not None else '-':>10}"
+                  f" {score:>7} {stage:>5} {frames:>7}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,873 +1,708 @@
+import argparse
+import atexit
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
 import pyxel
-import random
-import math
+from leaderboard import Leaderboard
+from particles import SHAPE_PIXEL, SHAPE_RECT, SHAPE_CIRCLE
+from profiler import FrameProfiler, UPDATE_PHASES, DRAW_PHASES
+from quality import QualityController, QUALITY_LEVELS, DEFAULT_LEVEL, level_capacity
+from renderer import PyxelRenderer
+from replay import InputRecorder, InputPlayer, SEED_LIMIT
+from telemetry import TelemetryRecorder
+from snapshot import RewindBuffer
+from starfield import STAR_LAYERS, STAR_TILE_HEIGHT, star_layers, layer_offset
+from timestep import FixedTimestep, SIM_FPS
+from simulation import (Simulation, InputState, BTN_LEFT, BTN_RIGHT, BTN_UP,
+                        BTN_DOWN, BTN_SPACE, BTN_ESC, BTN_R, BTN_A, BTN_START,
+                        BTN_MOUSE, ENEMY_SMALL, ENEMY_MEDIUM,
+                        ENEMY_BOSS, POWERUP_POWER, BULLET_PATTERN, SCREEN_WIDTH,
+                        SCREEN_HEIGHT)
 
-class StarDefender:
-    def __init__(self):
-        # ゲーム画面の初期化 - モバイル向けに最適化
-        pyxel.init(160, 140, title="スターデフェンダー", fps=30, display_scale=4)
-        pyxel.load("assets.pyxres")  # スプライトとサウンドをロード
-        pyxel.mouse(False)  # マウスカーソルを非表示に変更
-        
-        # パフォーマンス最適化用の変数
-        self.skip_frame = 0
-        self.max_enemies = 8  # さらに敵の数を削減
-        self.max_particles = 10  # パーティクル数も削減
-        self.max_shots = 15  # 同時に表示する弾の数を制限
-        
-        self.scene = "TITLE"
-        self.is_paused = False
-        self.reset_game()
-        
-        # タッチ操作用の変数
-        self.touch_last_x = 0
-        self.touch_last_y = 0
-        self.touch_fire_timer = 0
-        self.touch_start_time = 0
-        self.is_tap = False
-        
-        # モバイル状態検出
-        self.is_mobile = False
+ASSETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets.pyxres")  # 起動した場所によらずmain.pyの隣を読む
+SCORES_FILE = "scores.db"  # ハイスコアの記録（ユーザーのデータフォルダに置く）
+
+# イメージバンクの使い方（0はassets.pyxresのスプライト）
+STAR_BANK = 1  # 星の層のタイル
+FRAME_CACHE_BANK = 2  # 静止した画面（タイトル、一時停止、ゲームオーバー）の描画結果
+
+device = None  # probe_deviceの結果（プロセスの中で1回だけ調べる）
+
+def default_scores_path():
+    # ハイスコアの記録の場所（古いpyxelではカレントディレクトリ）
+    if hasattr(pyxel, 'user_data_dir'):
+        return os.path.join(pyxel.user_data_dir("StarDefender", "StarDefender"), SCORES_FILE)
+    return SCORES_FILE
+
+def probe_device():
+    # 動いている環境でできること（携帯端末か、ゲームパッドのボタンがあるか）
+    # platform.platform()はlibcの版を調べるためにPython本体のファイルを読むので使わず、
+    # unameの文字列だけで判定する
+    global device
+    if device is None:
+        is_mobile = False
         try:
-            # Webブラウザ実行時のモバイル判定を試みる
-            import platform
-            self.is_mobile = "mobile" in platform.platform().lower() or "android" in platform.platform().lower() or "ios" in platform.platform().lower()
-        except:
+            system, _, release, _, machine = platform.uname()[:5]
+            name = " ".join((sys.platform, system, release, machine)).lower()
+            is_mobile = "mobile" in name or "android" in name or "ios" in name
+        except Exception:
             pass
-        
-        # ゲーム開始
-        pyxel.run(self.update, self.draw)
-    
-    def reset_game(self):
-        # プレイヤー情報
-        self.player = {
-            'x': 80,
-            'y': 100,
-            'width': 8,
-            'height': 8,
-            'lives': 3,
-            'invincible': 0,
-            'power_level': 0,
-            'shield': 0
+        device = {
+            'is_mobile': is_mobile,
+            'has_gamepad': hasattr(pyxel, 'GAMEPAD1_BUTTON_A'),
+            'has_start_button': hasattr(pyxel, 'GAMEPAD1_BUTTON_START'),
         }
-        
-        # ゲーム状態
-        self.shots = []
-        self.enemies = []
-        self.powerups = []
-        self.explosions = []
-        self.stars = []
-        self.boss = None
-        self.boss_gauge = 0
-        self.boss_gauge_max = 1000
-        self.boss_appeared = False
-        
-        # 背景色の設定
-        self.bg_color = 0  # 最初の背景は黒
-        
-        # ステージ情報
-        self.score = 0
-        self.stage = 1
-        self.enemy_spawn_timer = 0
-        
-        # 背景の星を生成（さらに削減）
-        for i in range(15):  # 20から15に削減
-            self.stars.append({
-                'x': pyxel.rndi(0, 159),
-                'y': pyxel.rndi(0, 119),
-                'speed': pyxel.rndf(0.5, 1.5),
-                'color': pyxel.rndi(5, 7)
-            })
-        
-        # タッチ操作フラグ
-        self.is_touching = False
+    return device
+
+class StarDefender:
+    # pyxel用のフロントエンド（ゲームロジックはSimulationが担当）
+    def __init__(self, seed=None, record_path=None, replay_path=None, quality=None,
+                 quality_log_path=None, render_fps=SIM_FPS, max_catch_up=4, interpolate=False,
+                 rewind_seconds=0, eager_assets=False, startup_report=False, scores_path=None,
+                 telemetry_dir=None, renderer=None):
+        # ゲーム画面の初期化 - モバイル向けに最適化
+        # 描画の頻度はrender_fpsで、ゲームは実時間に合わせてSIM_FPSの固定刻みで進める
+        # rendererを渡すとpyxelのウィンドウを作らず、そこに描く（FramebufferRendererで画面を撮るとき）
+        self.init_start = time.perf_counter()
+        if renderer is None:
+            pyxel.init(160, 140, title="スターデフェンダー", fps=render_fps, display_scale=4)
+            pyxel.mouse(False)  # マウスカーソルを非表示に変更
+            renderer = PyxelRenderer()
+        self.gfx = renderer
+        
+        # スプライトとサウンドはタイトル画面を1回描いた後に読み込む（タイトルはどちらも使わない）
+        self.assets_loaded = False
+        self.startup_report = startup_report
+        self.startup = {}  # 起動にかかった時間（秒、--startup-report用）
+        if eager_assets:
+            self.load_assets()
+        
+        # 記録した入力の再生（シードも記録のものを使う）
+        self.input_player = None
+        if replay_path:
+            self.input_player = InputPlayer(replay_path)
+            seed = self.input_player.seed
+        
+        # ゲーム本体（パーティクルの容量は最も高い画質に合わせておく）
+        self.sim = Simulation(seed=seed, **level_capacity(QUALITY_LEVELS))
+        
+        # 画質の調整（qualityを指定したらその段階に固定し、Noneなら処理時間に合わせて自動で変える）
+        self.adaptive_quality = quality is None
+        self.quality = QualityController(fps=render_fps, level=DEFAULT_LEVEL if quality is None else quality)
+        self.apply_quality(self.quality.settings())
+        self.frame_start = 0.0
+        self.last_draw_frame = 0
+        self.quality_log = None
+        if quality_log_path:
+            self.quality_log = open(quality_log_path, 'w')
+            atexit.register(self.quality_log.close)
+        
+        # 固定刻みでの更新（1回の描画で最大max_catch_upステップまで追いつく）
+        self.timestep = FixedTimestep(1 / SIM_FPS, max_catch_up)
+        self.pending_buttons = 0  # ステップを進めなかった描画フレームで押されたボタン
+        
+        # 描画の補間（前のステップとの間の位置に描く）
+        self.interpolate = interpolate
+        self.previous_positions = {}
+        self.previous_player = (0, 0)
+        
+        # 入力の記録
+        self.recorder = None
+        if record_path:
+            self.recorder = InputRecorder(record_path, self.sim.seed)
+            atexit.register(self.recorder.close)
+        
+        # 巻き戻し（BackSpaceを押している間、直近rewind_seconds秒を1ステップずつ戻る）
+        self.rewind = None
+        if rewind_seconds > 0:
+            self.rewind = RewindBuffer(self.sim, rewind_seconds, SIM_FPS)
+        
+        # ハイスコアの記録（再生中の結果は記録しない）
+        # 書き込みは別スレッドで行うので、ゲームオーバーのときもループは止まらない
+        self.leaderboard = None
+        if scores_path and not replay_path:
+            self.leaderboard = Leaderboard(scores_path)
+            atexit.register(self.leaderboard.close)
+        
+        # 1秒ごとの計測値の記録（frame_secondsは前に描画したフレームの更新から描画までの時間）
+        self.telemetry = None
+        self.frame_seconds = 0.0
+        if telemetry_dir:
+            self.telemetry = TelemetryRecorder(telemetry_dir, budget=1 / render_fps)
+            atexit.register(self.telemetry.close)
+        
+        # 効果音の後にBGMを再開できるか（できなければFalseにする）
+        self.sound_resume = True
+        
+        # 携帯端末かどうかとゲームパッドの有無（描画のたびに調べない）
+        device = probe_device()
+        self.is_mobile = device['is_mobile']
+        self.has_gamepad = device['has_gamepad']
+        self.has_start_button = device['has_start_button']
+        
+        # 星の層を描いたときのステージと背景色（変わったら描き直す）
+        self.starfield_key = None
+        
+        # 静止した画面の描画結果を保存したときの状態（同じ間は保存した画面を1回で描く）
+        self.frame_cache_key = None
+        
+        # サブシステムごとの処理時間の計測（F1キーで表示を切り替え）
+        self.profiler = FrameProfiler([(self.sim, UPDATE_PHASES), (self, DRAW_PHASES)])
+        self.startup['init'] = time.perf_counter() - self.init_start
     
-    def update(self):
-        # フレームスキップカウンターを更新
-        self.skip_frame += 1
-        
-        # ゲームパッドの処理はシンプルに保つ
-        # 一時停止切り替え（ESCキーまたはポーズボタン）
-        if (pyxel.btnp(pyxel.KEY_ESCAPE) or 
-            (hasattr(pyxel, 'GAMEPAD1_BUTTON_START') and pyxel.btnp(pyxel.GAMEPAD1_BUTTON_START))):
-            if self.scene == "GAME":
-                self.is_paused = not self.is_paused
-                if self.is_paused:
-                    pyxel.stop()
-                else:
-                    pyxel.playm(0, loop=True)
-        
-        # シーンごとの更新処理
-        if self.scene == "TITLE":
-            self.update_title()
-        elif self.scene == "GAME":
-            if not self.is_paused:
-                self.update_game()
-        elif self.scene == "GAMEOVER":
-            self.update_gameover()
-        
-        # リスタート処理
-        if pyxel.btnp(pyxel.KEY_R):
-            self.reset_game()
-            self.scene = "GAME"
-            self.is_paused = False
+    def load_assets(self):
+        # スプライトとサウンドを読み込む
+        # 読み込むと使っていないイメージバンクも消えるので、星の層と保存した画面は描き直す
+        start = time.perf_counter()
+        self.gfx.load(ASSETS_PATH)
+        self.assets_loaded = True
+        self.starfield_key = None
+        self.frame_cache_key = None
+        self.startup['load_assets'] = time.perf_counter() - start
     
-    def update_title(self):
-        # スタート画面の更新処理
-        start_pressed = pyxel.btnp(pyxel.KEY_SPACE)
-        
-        # ゲームパッドのAボタン（存在する場合のみ）
-        if hasattr(pyxel, 'GAMEPAD1_BUTTON_A') and pyxel.btnp(pyxel.GAMEPAD1_BUTTON_A):
-            start_pressed = True
-        
-        # タップ判定
-        if self.is_tap:
-            start_pressed = True
-        
-        if start_pressed:
-            self.scene = "GAME"
-            self.is_paused = False
-            pyxel.playm(0, loop=True)
-            self.is_tap = False
+    def run(self):
+        # ゲーム開始
+        pyxel.run(self.update, self.draw)
     
-    def update_game(self):
-        # プレイヤーの更新
-        self.update_player()
-        
-        # モバイル用タッチコントロールの更新
-        self.update_touch_controls()
-        
-        # ショットの更新（数を制限）
-        if len(self.shots) <= self.max_shots:
-            self.update_shots()
-        else:
-            # 弾が多すぎる場合は古い弾を削除
-            self.shots = self.shots[-self.max_shots:]
-        
-        # 敵の更新
-        self.update_enemies()
-        
-        # パワーアップアイテムの更新
-        self.update_powerups()
-        
-        # エフェクトの更新
-        self.update_explosions()
-        
-        # 星の更新は4フレームに1回だけ行う（さらに軽量化）
-        if self.skip_frame % 4 == 0:
-            self.update_stars()
-        
-        # 敵の生成タイミング管理
-        self.enemy_spawn_timer -= 1
-        if self.enemy_spawn_timer <= 0 and len(self.enemies) < self.max_enemies:
-            self.spawn_enemy()
-            # 出現間隔をさらに長く
-            self.enemy_spawn_timer = 100 - min(60, self.stage * 8)  # ステージに応じて出現間隔を短縮
-        
-        # ボス出現条件をゲージベースに変更
-        if not self.boss_appeared and self.boss_gauge >= self.boss_gauge_max:
-            self.boss_appeared = True # ボス出現フラグを立てる
-            
-            # 強力な敵として生成（より強力に）
-            strong_enemy = {
-                'x': random.randint(20, 140),
-                'y': random.randint(-40, -30),
-                'width': 16,
-                'height': 16,
-                'type': 'boss',  # ボス用の新しいタイプ
-                'health': 10 + self.stage * 2,  # 耐久力をさらに上げる
-                'score': 500, # 高得点
-                'speed': 0.4,
-                'fire_rate': 0.1, # 発射確率が非常に高い
-                'move_x': random.choice([-0.8, 0.8]),
-                'fire_pattern': 'spread',  # 特殊な攻撃パターン
-                'next_fire': 30,  # 次の発射までのカウンター
-                'anim_frame': 0,  # アニメーションフレーム
-                'anim_counter': 0  # アニメーションカウンター
-            }
-            self.enemies.append(strong_enemy)
-            # ボス出現音
-            pyxel.play(0, 3)
-            
-            # ボス出現時に必ずパワーアップアイテムも出現させる
-            self.powerups.append({
-                'x': random.randint(10, 150),
-                'y': random.randint(-20, -10),
-                'width': 8,
-                'height': 8,
-                'type': random.choice(['power', 'shield']),
-                'speed': 1
-            })
+    def apply_quality(self, settings):
+        # 画質の設定を反映（どれも見た目だけに関わる値）
+        self.sim.max_particles = settings['max_particles']
+        self.sim.particle_density = settings['particle_density']
+        self.sim.star_update_interval = settings['star_update_interval']
+        self.shot_draw_limit = settings['shot_draw_limit']
     
-    def update_gameover(self):
-        # ゲームオーバー画面の更新処理
-        restart_pressed = pyxel.btnp(pyxel.KEY_R)
-        
-        # ゲームパッドのAボタン（存在する場合のみ）
-        if hasattr(pyxel, 'GAMEPAD1_BUTTON_A') and pyxel.btnp(pyxel.GAMEPAD1_BUTTON_A):
-            restart_pressed = True
-        
-        # タップ判定
-        if self.is_tap:
-            restart_pressed = True
-        
-        if restart_pressed:
-            self.reset_game()
-            self.scene = "GAME"
-            self.is_paused = False
+    def update_quality(self):
+        # 今のフレームの処理時間（更新から描画の終わりまで）を記録し、必要なら画質を変える
+        skipped = pyxel.frame_count - self.last_draw_frame - 1  # 描画が省かれたフレーム数
+        self.last_draw_frame = pyxel.frame_count
+        settings = self.quality.record(self.frame_seconds, max(0, skipped))
+        if settings is None:
+            return
+        self.apply_quality(settings)
+        if self.quality_log:
+            frame, old, new, mean_ms, reason = self.quality.decisions[-1]
+            self.quality_log.write(f"{frame} {old}->{new} {mean_ms:.2f}ms {reason}\n")
     
-    def update_player(self):
-        # 無敵時間と盾の更新
-        if self.player['invincible'] > 0:
-            self.player['invincible'] -= 1
-        if self.player['shield'] > 0:
-            self.player['shield'] -= 1
-        
-        # 移動速度
-        speed = 2
-        
-        # キーボード入力による移動
-        move_left = pyxel.btn(pyxel.KEY_LEFT)
-        move_right = pyxel.btn(pyxel.KEY_RIGHT)
-        move_up = pyxel.btn(pyxel.KEY_UP)
-        move_down = pyxel.btn(pyxel.KEY_DOWN)
+    def read_input(self):
+        # pyxelの入力をSimulation用の入力に変換
+        buttons = 0
+        if pyxel.btn(pyxel.KEY_LEFT):
+            buttons |= BTN_LEFT
+        if pyxel.btn(pyxel.KEY_RIGHT):
+            buttons |= BTN_RIGHT
+        if pyxel.btn(pyxel.KEY_UP):
+            buttons |= BTN_UP
+        if pyxel.btn(pyxel.KEY_DOWN):
+            buttons |= BTN_DOWN
+        if pyxel.btn(pyxel.KEY_SPACE):
+            buttons |= BTN_SPACE
+        if pyxel.btn(pyxel.KEY_ESCAPE):
+            buttons |= BTN_ESC
+        if pyxel.btn(pyxel.KEY_R):
+            buttons |= BTN_R
+        if pyxel.btn(pyxel.MOUSE_BUTTON_LEFT):
+            buttons |= BTN_MOUSE
         
         # ゲームパッド入力（存在する場合のみ）
         if hasattr(pyxel, 'GAMEPAD1_BUTTON_DPAD_LEFT'):
-            move_left = move_left or pyxel.btn(pyxel.GAMEPAD1_BUTTON_DPAD_LEFT)
-            move_right = move_right or pyxel.btn(pyxel.GAMEPAD1_BUTTON_DPAD_RIGHT)
-            move_up = move_up or pyxel.btn(pyxel.GAMEPAD1_BUTTON_DPAD_UP)
-            move_down = move_down or pyxel.btn(pyxel.GAMEPAD1_BUTTON_DPAD_DOWN)
-        
-        # 移動処理
-        if move_left:
-            self.player['x'] = max(self.player['x'] - speed, 0)
-        if move_right:
-            self.player['x'] = min(self.player['x'] + speed, 160 - self.player['width'])
-        if move_up:
-            self.player['y'] = max(self.player['y'] - speed, 0)
-        if move_down:
-            self.player['y'] = min(self.player['y'] + speed, 120 - self.player['height'])
-        
-        # ショット発射（キーボード）
-        fire_pressed = pyxel.btnp(pyxel.KEY_SPACE, 12, 4)
-        
-        # ゲームパッドのショットボタン（存在する場合のみ）
-        if hasattr(pyxel, 'GAMEPAD1_BUTTON_A'):
-            fire_pressed = fire_pressed or pyxel.btnp(pyxel.GAMEPAD1_BUTTON_A, 12, 4)
-        
-        if fire_pressed:
-            self.fire_player_shot()
-        
-        # タッチ操作による移動（タッチ画面用）
-        if self.is_touching:
-            # 移動と射撃の処理
-            self.touch_fire_timer += 1
-            if self.touch_fire_timer >= 8:  # 射撃間隔を少し長く
-                self.fire_player_shot()
-                self.touch_fire_timer = 0
+            if pyxel.btn(pyxel.GAMEPAD1_BUTTON_DPAD_LEFT):
+                buttons |= BTN_LEFT
+            if pyxel.btn(pyxel.GAMEPAD1_BUTTON_DPAD_RIGHT):
+                buttons |= BTN_RIGHT
+            if pyxel.btn(pyxel.GAMEPAD1_BUTTON_DPAD_UP):
+                buttons |= BTN_UP
+            if pyxel.btn(pyxel.GAMEPAD1_BUTTON_DPAD_DOWN):
+                buttons |= BTN_DOWN
+        if hasattr(pyxel, 'GAMEPAD1_BUTTON_A') and pyxel.btn(pyxel.GAMEPAD1_BUTTON_A):
+            buttons |= BTN_A
+        if hasattr(pyxel, 'GAMEPAD1_BUTTON_START') and pyxel.btn(pyxel.GAMEPAD1_BUTTON_START):
+            buttons |= BTN_START
+        
+        return InputState(buttons, pyxel.mouse_x, pyxel.mouse_y)
     
-    def update_touch_controls(self):
-        # タッチ状態をリセット
-        self.is_touching = False
-        self.is_tap = False
-        
-        # タッチ操作の検出
-        if pyxel.btnp(pyxel.MOUSE_BUTTON_LEFT):
-            self.touch_last_x = pyxel.mouse_x
-            self.touch_last_y = pyxel.mouse_y
-            self.touch_start_time = pyxel.frame_count
-        
-        if pyxel.btn(pyxel.MOUSE_BUTTON_LEFT):
-            x, y = pyxel.mouse_x, pyxel.mouse_y
-            
-            # 短時間タップ判定
-            if pyxel.frame_count - self.touch_start_time < 5:
-                self.is_tap = True
-            
-            # タイトル/ゲームオーバー画面のタップ判定
-            if self.scene == "TITLE" or self.scene == "GAMEOVER":
-                if 20 <= x <= 140 and 30 <= y <= 110:
-                    self.is_tap = True
-            
-            # ゲーム中のタッチ操作
-            if self.scene == "GAME":
-                self.is_touching = True
-                
-                # タッチ位置に自機を移動（単純な実装）
-                target_x = x - self.player['width'] // 2
-                target_y = y - self.player['height'] // 2
-                
-                # 移動速度制限
-                max_move = 4
-                dx = target_x - self.player['x']
-                dy = target_y - self.player['y']
-                
-                if abs(dx) > max_move:
-                    dx = max_move * (1 if dx > 0 else -1)
-                if abs(dy) > max_move:
-                    dy = max_move * (1 if dy > 0 else -1)
-                
-                # プレイヤーを移動
-                self.player['x'] = max(min(self.player['x'] + dx, 160 - self.player['width']), 0)
-                self.player['y'] = max(min(self.player['y'] + dy, 120 - self.player['height']), 0)
-        
-        # タッチ終了時の処理
-        if not pyxel.btn(pyxel.MOUSE_BUTTON_LEFT) and self.is_touching:
-            self.is_touching = False
-            self.touch_fire_timer = 0
+    def update(self):
+        self.frame_start = time.perf_counter()
+        
+        # タイトル画面を1回描いたら、ゲームが始まる前に残りの素材を読み込んでおく
+        if not self.assets_loaded and pyxel.frame_count > 0:
+            self.load_assets()
+        
+        # プロファイラの表示切り替え（ゲームの入力とは別扱いで記録しない）
+        if pyxel.btnp(pyxel.KEY_F1):
+            self.profiler.toggle()
+        
+        # 経過した実時間の分だけゲームを進める（描画が遅れても時間どおりに進む）
+        steps = self.timestep.advance(self.frame_start)
+        if not self.input_player:
+            inp = self.read_input()
+            if not steps:
+                # 短い押下を取りこぼさないように、次のステップまで覚えておく
+                self.pending_buttons |= inp.buttons
+                return
+            inp.buttons |= self.pending_buttons
+            self.pending_buttons = 0
+        rewinding = self.rewind is not None and pyxel.btn(pyxel.KEY_BACKSPACE)
+        for _ in range(steps):
+            if rewinding:
+                if self.interpolate:
+                    self.save_positions()
+                self.rewind.rewind()
+                continue
+            if self.input_player:
+                inp = self.input_player.next_input()
+                if inp is None:
+                    return  # 再生終了（最後の画面のまま止める）
+            self.step_simulation(inp)
     
-    def fire_player_shot(self):
-        # プレイヤーの弾発射関数
-        power = self.player['power_level']
-        
-        # ショット音
-        pyxel.play(0, 0)
-        
-        # パワーレベルに応じた弾の生成
-        if power == 0:
-            # 基本ショット
-            self.shots.append({
-                'x': self.player['x'] + 4,
-                'y': self.player['y'] - 4,
-                'width': 2,
-                'height': 4,
-                'type': 'player',
-                'damage': 1,
-                'speed': 4
-            })
-        elif power == 1:
-            # ダブルショット
-            self.shots.append({
-                'x': self.player['x'] + 1,
-                'y': self.player['y'],
-                'width': 2,
-                'height': 4,
-                'type': 'player',
-                'damage': 1,
-                'speed': 4
-            })
-            self.shots.append({
-                'x': self.player['x'] + 5,
-                'y': self.player['y'],
-                'width': 2,
-                'height': 4,
-                'type': 'player',
-                'damage': 1,
-                'speed': 4
-            })
-        else:
-            # トリプルショット (3方向)
-            shot_speed_y = 3.5  # Spread shot vertical speed
-            shot_speed_x = 1.0  # Spread shot horizontal speed
-            self.shots.append({
-                'x': self.player['x'] + 3, # Center
-                'y': self.player['y'] - 4,
-                'width': 2,
-                'height': 4,
-                'type': 'player',
-                'damage': 1,
-                'speed': shot_speed_y, # Vertical speed
-                'dx': 0 # Horizontal speed
-            })
-            self.shots.append({
-                'x': self.player['x'] + 1, # Left
-                'y': self.player['y'] - 2,
-                'width': 2,
-                'height': 4,
-                'type': 'player',
-                'damage': 1,
-                'speed': shot_speed_y,
-                'dx': -shot_speed_x
-            })
-            self.shots.append({
-                'x': self.player['x'] + 5, # Right
-                'y': self.player['y'] - 2,
-                'width': 2,
-                'height': 4,
-                'type': 'player',
-                'damage': 1,
-                'speed': shot_speed_y,
-                'dx': shot_speed_x
-            })
+    def step_simulation(self, inp):
+        # 入力を渡してゲームを1ステップ進める
+        if self.recorder:
+            self.recorder.record(inp)
+        if self.interpolate:
+            self.save_positions()
+        was_over = self.sim.scene == "GAMEOVER"
+        self.sim.step(inp)
+        if self.leaderboard and not was_over and self.sim.scene == "GAMEOVER":
+            self.leaderboard.record(self.sim.score, self.sim.stage, self.sim.game_frames, self.sim.seed)
+        if self.telemetry:
+            self.telemetry.record(self.sim, self.frame_seconds)
+        if not self.assets_loaded and (self.sim.audio_events or self.sim.scene != "TITLE"):
+            self.load_assets()  # 最初のフレームでゲームが始まった場合
+        if self.rewind is not None:
+            self.rewind.record()
+        
+        # 要求された音声を再生
+        for event in self.sim.audio_events:
+            if event[0] == 'play':
+                self.play_sound(event[1], event[2])
+            elif event[0] == 'playm':
+                pyxel.playm(event[1], loop=event[2])
+            else:
+                pyxel.stop()
     
-    def update_shots(self):
-        # ショットの更新
-        for shot in list(self.shots):
-            # ショットのタイプに応じた移動
-            if shot['type'] == 'player':
-                shot['y'] -= shot['speed']
-                # 横方向の移動がある場合 (パワーアップ用)
-                if 'dx' in shot:
-                    shot['x'] += shot['dx']
-                # 画面外に出たショットを削除
-                if shot['y'] < -shot['height'] or shot['x'] < 0 or shot['x'] > 160:
-                    if shot in self.shots: # Avoid error if removed by collision check
-                        self.shots.remove(shot)
-            elif shot['type'] == 'enemy':
-                shot['y'] += shot['speed']
-                
-                # 横方向の移動がある場合
-                if 'dx' in shot:
-                    shot['x'] += shot['dx']
-                
-                # 敵の弾とプレイヤーの衝突判定
-                if not self.player['invincible'] > 0 and self.check_collision(shot, self.player):
-                    if self.player['shield'] > 0:
-                        # シールドがある場合はダメージなし
-                        self.shots.remove(shot)
-                        # シールド効果音
-                        pyxel.play(0, 3)
-                    else:
-                        # シールドがなければライフ減少
-                        self.player['lives'] -= 1
-                        self.player['invincible'] = 60  # 1秒間の無敵
-                        self.create_explosion(self.player['x'], self.player['y'])
-                        self.shots.remove(shot)
-                        pyxel.play(0, 2)  # ダメージ音
-                        
-                        if self.player['lives'] <= 0:
-                            self.scene = "GAMEOVER"
-                            self.is_paused = False
-                    continue
-                
-                # 画面外に出たショットを削除
-                if shot['y'] > 140 or shot['x'] < 0 or shot['x'] > 160:
-                    if shot in self.shots: # Avoid error if removed by collision check
-                         self.shots.remove(shot)
+    def play_sound(self, ch, snd):
+        # 効果音が終わったらチャンネルのBGMに戻す（resumeの無い古いpyxelではそのまま鳴らす）
+        if self.sound_resume:
+            try:
+                pyxel.play(ch, snd, resume=True)
+                return
+            except TypeError:
+                self.sound_resume = False
+        pyxel.play(ch, snd)
     
-    def update_enemies(self):
-        # 敵の更新
-        for enemy in list(self.enemies):
-            # 敵の移動
-            enemy['y'] += enemy['speed']
-            
-            # 左右の動きがある敵
-            if 'move_x' in enemy and enemy['move_x'] != 0:
-                enemy['x'] += enemy['move_x']
-                # 画面端での向きの反転
-                if enemy['x'] <= 0 or enemy['x'] >= 160 - enemy['width']:
-                    enemy['move_x'] = -enemy['move_x']
-            
-            # ボスのアニメーション更新
-            if enemy['type'] == 'boss' and 'anim_counter' in enemy:
-                enemy['anim_counter'] += 1
-                if enemy['anim_counter'] >= 10:  # 10フレームごとにアニメーション
-                    enemy['anim_counter'] = 0
-                    enemy['anim_frame'] = (enemy['anim_frame'] + 1) % 2
-            
-            # 通常敵の弾発射
-            if 'fire_rate' in enemy and random.random() < enemy['fire_rate']:
-                if len(self.shots) < self.max_shots:  # 弾数制限のチェック
-                    # ボスの場合は特殊な攻撃パターン
-                    if enemy['type'] == 'boss' and 'fire_pattern' in enemy:
-                        if enemy['fire_pattern'] == 'spread':
-                            # 次の発射までのカウンターを減少
-                            if 'next_fire' in enemy:
-                                enemy['next_fire'] -= 1
-                                
-                                # カウンターが0になったら発射
-                                if enemy['next_fire'] <= 0:
-                                    # 散弾パターン (3発同時に異なる角度で発射)
-                                    for i in range(3):
-                                        angle = -1 + i  # -1, 0, 1の角度（左、中央、右）
-                                        self.shots.append({
-                                            'x': enemy['x'] + enemy['width'] // 2 + angle * 4,
-                                            'y': enemy['y'] + enemy['height'],
-                                            'width': 2,
-                                            'height': 4,
-                                            'type': 'enemy',
-                                            'damage': 1,
-                                            'speed': 2.5,
-                                            'dx': angle * 0.5  # 水平方向への移動
-                                        })
-                                    
-                                    # 次の発射までのカウンターをリセット
-                                    enemy['next_fire'] = 25  # 攻撃間隔を短くする
-                    else:
-                        # 通常の敵の弾発射
-                        self.shots.append({
-                            'x': enemy['x'] + enemy['width'] // 2,
-                            'y': enemy['y'] + enemy['height'],
-                            'width': 2,
-                            'height': 4,
-                            'type': 'enemy',
-                            'damage': 1,
-                            'speed': 2
-                        })
-            
-            # 画面外に出た敵を削除
-            if enemy['y'] > 140:
-                self.enemies.remove(enemy)
-                continue
-            
-            # プレイヤーとの衝突判定
-            if (not self.player['invincible'] > 0 and
-                self.check_collision(enemy, self.player)):
-                if self.player['shield'] > 0:
-                    # シールドがある場合はダメージなし、敵を破壊
-                    self.create_explosion(enemy['x'], enemy['y'])
-                    self.enemies.remove(enemy)
-                    self.add_score(enemy['score'])
-                    
-                    # 敵撃破時にボスゲージを加算 (ボス自身は加算しない)
-                    if enemy['type'] != 'boss':
-                        gauge_increase = 0
-                        if enemy['type'] == 'small':
-                            gauge_increase = 20 # 小さい敵のゲージ上昇量 (調整可能)
-                        elif enemy['type'] == 'medium':
-                            gauge_increase = 50 # 中くらいの敵のゲージ上昇量 (調整可能)
-                        
-                        if not self.boss_appeared: # ボス出現前のみゲージを加算
-                            self.boss_gauge = min(self.boss_gauge + gauge_increase, self.boss_gauge_max)
-                else:
-                    # シールドがなければライフ減少
-                    self.player['lives'] -= 1
-                    self.player['invincible'] = 60  # 1秒間の無敵
-                    self.create_explosion(self.player['x'], self.player['y'])
-                    pyxel.play(0, 2)  # ダメージ音
-                    
-                    if self.player['lives'] <= 0:
-                        self.scene = "GAMEOVER"
-                        self.is_paused = False
-                continue
-            
-            # プレイヤーの弾との衝突判定
-            for shot in list(self.shots):
-                if shot['type'] == 'player' and self.check_collision(shot, enemy):
-                    # 敵にダメージ
-                    enemy['health'] -= shot['damage']
-                    self.shots.remove(shot)
-                    
-                    # 敵の体力が0以下になったら破壊
-                    if enemy['health'] <= 0:
-                        self.create_explosion(enemy['x'], enemy['y'])
-                        
-                        # ボスの場合は大きな爆発
-                        if enemy['type'] == 'boss':
-                            # 追加の爆発エフェクト
-                            for i in range(5):
-                                x = enemy['x'] + random.uniform(0, enemy['width'])
-                                y = enemy['y'] + random.uniform(0, enemy['height'])
-                                self.create_explosion(x, y)
-                            
-                            # ボスを倒したらステージアップと背景色変更
-                            self.stage += 1
-                            self.boss_appeared = False  # 次のボス出現のためにフラグをリセット
-                            self.boss_gauge = 0  # ボスゲージもリセット
-                            
-                            # 背景色を変更（ステージごとに少しずつ変化）
-                            self.bg_color = (self.stage - 1) % 5  # 0, 1, 2, 3, 4 の循環
-                        
-                        # パワーアップアイテムのドロップ（確率、ボスは確定でドロップ）
-                        drop_chance = 0.1  # 通常敵のドロップ率
-                        if enemy['type'] == 'boss':
-                            drop_chance = 1.0  # ボスは確定ドロップ
-                            
-                        if random.random() < drop_chance:
-                            self.powerups.append({
-                                'x': enemy['x'] + enemy['width'] // 2,
-                                'y': enemy['y'] + enemy['height'] // 2,
-                                'width': 8,
-                                'height': 8,
-                                'type': random.choice(['power', 'shield']),
-                                'speed': 1
-                            })
-                        
-                        # スコア加算
-                        self.add_score(enemy['score'])
-                        # 敵撃破時にボスゲージを加算 (ボス自身は加算しない)
-                        if enemy['type'] != 'boss':
-                            gauge_increase = 0
-                            if enemy['type'] == 'small':
-                                gauge_increase = 20 # 小さい敵のゲージ上昇量 (調整可能)
-                            elif enemy['type'] == 'medium':
-                                gauge_increase = 50 # 中くらいの敵のゲージ上昇量 (調整可能)
-                            
-                            if not self.boss_appeared: # ボス出現前のみゲージを加算
-                                self.boss_gauge = min(self.boss_gauge + gauge_increase, self.boss_gauge_max)
-                        
-                        self.enemies.remove(enemy)
-                    break
+    def draw(self):
+        # 静止した画面は保存しておいた描画結果をそのまま使う
+        key = self.static_frame_key()
+        if key is not None and key == self.frame_cache_key:
+            self.gfx.blt(0, 0, FRAME_CACHE_BANK, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+        else:
+            self.draw_scene()
+            self.frame_cache_key = key
+            if key is not None:
+                self.gfx.image(FRAME_CACHE_BANK).blt(0, 0, self.gfx.screen, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+        
+        # プロファイラの表示
+        if self.profiler.enabled:
+            self.profiler.end_frame()
+            self.draw_profiler()
+        
+        self.frame_seconds = time.perf_counter() - self.frame_start
+        if self.adaptive_quality:
+            self.update_quality()
+        
+        if self.startup_report:
+            self.report_startup()
     
-    def update_powerups(self):
-        # パワーアップアイテムの更新
-        for powerup in list(self.powerups):
-            powerup['y'] += powerup['speed']
-            
-            # 画面外に出たアイテムを削除
-            if powerup['y'] > 140:
-                self.powerups.remove(powerup)
-                continue
-            
-            # プレイヤーとの衝突判定
-            if self.check_collision(powerup, self.player):
-                # パワーアップ効果
-                if powerup['type'] == 'power':
-                    self.player['power_level'] = min(2, self.player['power_level'] + 1)
-                elif powerup['type'] == 'shield':
-                    self.player['shield'] = 300  # シールド効果（10秒）
-                
-                # アイテム取得音
-                pyxel.play(0, 3)
-                
-                self.powerups.remove(powerup)
+    def report_startup(self):
+        # 最初の画面を描き終えるまでの時間を1行のJSONで出力して終了する
+        # wall_timeは親プロセスが起動からの時間を測るための時刻
+        self.startup['first_frame'] = time.perf_counter() - self.init_start
+        self.startup['wall_time'] = time.time()
+        print(json.dumps(self.startup), flush=True)
+        pyxel.quit()
     
-    def update_explosions(self):
-        # 爆発エフェクトの更新
-        for exp in list(self.explosions):
-            exp['radius'] += exp['speed']
-            exp['life'] -= 1
-            if exp['life'] <= 0:
-                self.explosions.remove(exp)
+    def render_starfield(self):
+        # 星の層をイメージバンクに描いておく（ステージか背景色が変わったときだけ）
+        sim = self.sim
+        image = self.gfx.image(STAR_BANK)
+        image.cls(0)
+        for layer, stars in enumerate(star_layers(sim.stage, sim.bg_color)):
+            v = layer * STAR_TILE_HEIGHT
+            for x, y, color in stars:
+                image.pset(x, v + y, color)
+        self.starfield_key = (sim.stage, sim.bg_color)
     
-    def update_stars(self):
-        # 星の更新
-        for star in self.stars:
-            star['y'] += star['speed']
-            if star['y'] > 139:
-                star['y'] = 0
-                star['x'] = random.randint(0, 159)
+    def save_positions(self):
+        # 補間用にステップ前の位置を保存（生成順の番号で同じエンティティか確かめる）
+        sim = self.sim
+        for name in ('enemies', 'shots', 'bullets', 'powerups'):
+            store = getattr(sim, name)
+            saved = self.previous_positions.get(name)
+            if saved is None or saved[0].size != store.capacity:
+                saved = (np.zeros(store.capacity), np.zeros(store.capacity),
+                         np.zeros(store.capacity, np.int64))
+                self.previous_positions[name] = saved
+            np.copyto(saved[0], store.x)
+            np.copyto(saved[1], store.y)
+            np.copyto(saved[2], store.seq)
+        self.previous_player = (sim.player['x'], sim.player['y'])
     
-    def spawn_enemy(self):
-        # 敵の生成（タイプを最小限にして最適化）
-        enemy_type = random.choice(['small', 'medium'])
-        
-        # ステージに応じた敵の強化
-        stage_factor = min(self.stage * 0.15, 1.0)  # ステージが上がるほど強くなる
-        
-        if enemy_type == 'small':
-            enemy = {
-                'x': random.randint(0, 152),
-                'y': random.randint(-20, -10),
-                'width': 8,
-                'height': 8,
-                'type': 'small',
-                'health': 1,
-                'score': 10,
-                'speed': random.uniform(0.8, 2.0) * (1 + stage_factor),  # 速度を上げる
-                'fire_rate': 0.005 + (stage_factor * 0.01)  # ステージが上がると発射確率も上がる
-            }
-        else:
-            enemy = {
-                'x': random.randint(10, 142),
-                'y': random.randint(-30, -20),
-                'width': 16,
-                'height': 16,
-                'type': 'medium',
-                'health': 2,
-                'score': 50,
-                'speed': random.uniform(0.5, 1.2) * (1 + stage_factor),  # 速度を上げる
-                'fire_rate': 0.015 + (stage_factor * 0.02),  # 発射確率を上げる
-                'move_x': random.choice([-0.8, 0.8]) * (1 + stage_factor * 0.5)  # 左右移動も速く
-            }
-        
-        # パワーアップ出現率の増加
-        drop_rate = random.random()
-        if drop_rate < 0.03 + (stage_factor * 0.01):  # 低確率でパワーアップアイテムを直接生成
-            self.powerups.append({
-                'x': random.randint(10, 150),
-                'y': random.randint(-20, -10),
-                'width': 8,
-                'height': 8,
-                'type': random.choice(['power', 'shield']),
-                'speed': 1
-            })
-        
-        self.enemies.append(enemy)
+    def positions(self, name):
+        # 描画する位置（補間するときは前のステップとの間の位置）
+        store = getattr(self.sim, name)
+        saved = self.previous_positions.get(name)
+        if not self.interpolate or saved is None or saved[0].size != store.capacity:
+            return store.x, store.y
+        x0, y0, seq0 = saved
+        alpha = self.timestep.alpha()
+        same = seq0 == store.seq  # ステップの間に生成された（スロットを再利用した）ものは補間しない
+        return (np.where(same, x0 + (store.x - x0) * alpha, store.x),
+                np.where(same, y0 + (store.y - y0) * alpha, store.y))
     
-    def create_explosion(self, x, y):
-        # 爆発エフェクトの生成
-        colors = [8, 9, 10, 11]
-        
-        # エフェクト数を制限
-        if len(self.explosions) < self.max_particles:
-            for i in range(3):  # 爆発の粒子数を3に制限
-                self.explosions.append({
-                    'x': x + random.uniform(-5, 5),
-                    'y': y + random.uniform(-5, 5),
-                    'radius': random.uniform(1, 3),
-                    'speed': random.uniform(0.2, 0.8),
-                    'life': random.randint(10, 20),
-                    'color': random.choice(colors)
-                })
-        
-        # 爆発音
-        pyxel.play(0, 1)
+    def player_position(self):
+        sim = self.sim
+        if not self.interpolate:
+            return sim.player['x'], sim.player['y']
+        alpha = self.timestep.alpha()
+        x0, y0 = self.previous_player
+        return x0 + (sim.player['x'] - x0) * alpha, y0 + (sim.player['y'] - y0) * alpha
     
-    def add_score(self, value):
-        # スコア加算
-        self.score += value
-        
-        # スコアに応じたステージアップ
-        if self.score > 0 and self.score % 1000 == 0:
-            self.stage += 1
+    def static_frame_key(self):
+        # タイトル・一時停止・ゲームオーバーの画面を決める値の組（ゲーム中はNone）
+        # ゲームが1フレームでも進めばgame_framesが変わるので、前の画面は使われない
+        sim = self.sim
+        if sim.scene == "GAME" and not sim.is_paused:
+            return None
+        top = self.leaderboard.top if self.leaderboard else ()
+        # 一時停止中も点滅し続けるもの（ボスの輪郭と無敵中の自機）は点滅の段階も含める
+        blink = None
+        if sim.scene == "GAME":
+            blink = ((sim.frame_count // 3) % 3 if sim.boss_appeared else None,
+                     sim.skip_frame % 4 < 2 if sim.player['invincible'] > 0 else None)
+        return (sim.scene, sim.is_paused, sim.game_frames, sim.score, sim.stage, sim.bg_color, top,
+                self.is_mobile, self.has_gamepad, self.has_start_button, blink)
     
-    def draw(self):
+    def draw_scene(self):
+        sim = self.sim
+        
         # 画面をクリア (背景色をステージに応じて変更)
-        pyxel.cls(self.bg_color)
+        self.gfx.cls(sim.bg_color)
         
         # 星（背景）の描画
         self.draw_stars()
         
         # シーンに応じた描画処理
-        if self.scene == "TITLE":
+        if sim.scene == "TITLE":
             self.draw_title()
-        elif self.scene == "GAME":
+        elif sim.scene == "GAME":
             self.draw_game()
             
             # 一時停止画面の描画
-            if self.is_paused:
+            if sim.is_paused:
                 self.draw_pause_screen()
                 
-        elif self.scene == "GAMEOVER":
+        elif sim.scene == "GAMEOVER":
             self.draw_gameover()
     
     def draw_stars(self):
-        # 背景の星を描画
-        for star in self.stars:
-            pyxel.pset(star['x'], star['y'], star['color'])
+        sim = self.sim
+        if self.starfield_key != (sim.stage, sim.bg_color):
+            self.render_starfield()
+        
+        # 背景の星を層ごとにタイルで描画（遠い層ほどゆっくり流れる）
+        for layer in range(len(STAR_LAYERS)):
+            v = layer * STAR_TILE_HEIGHT
+            for y in range(layer_offset(sim.star_scroll, layer) - STAR_TILE_HEIGHT, SCREEN_HEIGHT,
+                           STAR_TILE_HEIGHT):
+                self.gfx.blt(0, y, STAR_BANK, 0, v, SCREEN_WIDTH, STAR_TILE_HEIGHT, 0)
     
     def draw_title(self):
         # タイトル画面の描画
-        pyxel.text(55, 40, "STAR DEFENDER", 7)
-        pyxel.text(50, 60, "PRESS SPACE TO START", 11)
+        self.gfx.text(55, 40, "STAR DEFENDER", 7)
+        self.gfx.text(50, 60, "PRESS SPACE TO START", 11)
         
         # モバイル用テキスト
         if self.is_mobile:
-            pyxel.text(60, 70, "OR TAP TO START", 11)
+            self.gfx.text(60, 70, "OR TAP TO START", 11)
         
         # ゲームパッド用のテキスト
-        if hasattr(pyxel, 'GAMEPAD1_BUTTON_A'):
-            pyxel.text(50, 80, "OR PRESS A TO START", 11)
+        if self.has_gamepad:
+            self.gfx.text(50, 80, "OR PRESS A TO START", 11)
         
         # コントロール説明
-        pyxel.text(30, 100, "ARROW KEYS: MOVE", 6)
-        pyxel.text(30, 110, "SPACE: FIRE", 6)
+        self.gfx.text(30, 100, "ARROW KEYS: MOVE", 6)
+        self.gfx.text(30, 110, "SPACE: FIRE", 6)
+        
+        # ハイスコア（上位3件、書き込みスレッドが読み込んだコピーを使う）
+        if self.leaderboard and self.leaderboard.top:
+            self.gfx.text(30, 122, "HIGH SCORES", 10)
+            for rank, (score, stage, _) in enumerate(self.leaderboard.top[:3]):
+                self.gfx.text(30 + rank * 34, 130, f"{rank + 1}.{score}", 7)
     
     def draw_game(self):
-        # 敵と弾の描画
-        for enemy in self.enemies:
+        # ゲーム画面の描画（フェーズごとに分けてプロファイラで計測できるようにする）
+        self.draw_enemies()
+        self.draw_shots()
+        self.draw_bullets()
+        self.draw_powerups()
+        self.draw_player()
+        self.draw_particles()
+        self.draw_hud()
+    
+    def draw_enemies(self):
+        sim = self.sim
+        
+        # 敵の描画
+        enemies = sim.enemies
+        order = enemies.indices()
+        ex, ey = self.positions('enemies')
+        for x, y, w, h, kind, health, anim_frame in zip(
+                ex[order].tolist(), ey[order].tolist(),
+                enemies.w[order].tolist(), enemies.h[order].tolist(),
+                enemies.kind[order].tolist(), enemies.hp[order].tolist(),
+                enemies.anim_frame[order].tolist()):
             # 敵の種類に応じたスプライト描画
-            if enemy['type'] == 'small':
+            if kind == ENEMY_SMALL:
                 u, v = 8, 0
-            elif enemy['type'] == 'medium':
+            elif kind == ENEMY_MEDIUM:
                 u, v = 0, 16
-            elif enemy['type'] == 'boss':  # ボス用の描画設定
+            elif kind == ENEMY_BOSS:  # ボス用の描画設定
                 # ボスのアニメーション（2フレーム交互）
-                if 'anim_frame' in enemy and enemy['anim_frame'] == 1:
+                if anim_frame == 1:
                     u, v = 32, 16  # 2フレーム目
                 else:
                     u, v = 16, 16  # 1フレーム目
             else:
                 u, v = 0, 0
                 
-            w = enemy['width']
-            h = enemy['height']
-            pyxel.blt(enemy['x'], enemy['y'], 0, u, v, w, h, 0)
+            self.gfx.blt(x, y, 0, u, v, w, h, 0)
             
             # ボスの場合は体力ゲージと輪郭を表示
-            if enemy['type'] == 'boss':
+            if kind == ENEMY_BOSS:
                 # 体力ゲージの背景
-                pyxel.rect(enemy['x'], enemy['y'] - 4, enemy['width'], 2, 1)
+                self.gfx.rect(x, y - 4, w, 2, 1)
                 # 現在の体力を表示（初期値は10+stage*2なので、それを100%として計算）
-                health_percent = enemy['health'] / (10 + self.stage * 2)
-                gauge_width = int(enemy['width'] * health_percent)
-                pyxel.rect(enemy['x'], enemy['y'] - 4, gauge_width, 2, 8)
+                health_percent = health / (10 + sim.stage * 2)
+                gauge_width = int(w * health_percent)
+                self.gfx.rect(x, y - 4, gauge_width, 2, 8)
                 
                 # ボスを目立たせるための輪郭
-                pyxel.rectb(enemy['x'] - 1, enemy['y'] - 1, enemy['width'] + 2, enemy['height'] + 2, 8 + (pyxel.frame_count // 3) % 3)  # 点滅する輪郭
-        
-        # 弾の描画（数を制限）
-        for shot in self.shots[:self.max_shots]:
-            if shot['type'] == 'player':
-                pyxel.rect(shot['x'], shot['y'], shot['width'], shot['height'], 11)
-            else:
-                pyxel.rect(shot['x'], shot['y'], shot['width'], shot['height'], 8)
-        
+                self.gfx.rectb(x - 1, y - 1, w + 2, h + 2, 8 + (sim.frame_count // 3) % 3)  # 点滅する輪郭
+    
+    def draw_shots(self):
+        sim = self.sim
+        
+        # 自機の弾の描画（数を制限）
+        shots = sim.shots
+        order = shots.indices()[:self.shot_draw_limit]
+        sx, sy = self.positions('shots')
+        for x, y, w, h in zip(sx[order].tolist(), sy[order].tolist(),
+                              shots.w[order].tolist(), shots.h[order].tolist()):
+            self.gfx.rect(x, y, w, h, 11)
+    
+    def draw_bullets(self):
+        # 敵の弾の描画（弾幕の弾は色を変える）
+        bullets = self.sim.bullets
+        order = bullets.indices()
+        bx, by = self.positions('bullets')
+        for x, y, w, h, kind in zip(
+                bx[order].tolist(), by[order].tolist(),
+                bullets.w[order].tolist(), bullets.h[order].tolist(),
+                bullets.kind[order].tolist()):
+            self.gfx.rect(x, y, w, h, 14 if kind == BULLET_PATTERN else 8)
+    
+    def draw_powerups(self):
         # パワーアップアイテムの描画
-        for powerup in self.powerups:
-            color = 11 if powerup['type'] == 'power' else 12
-            pyxel.circ(powerup['x'], powerup['y'], 3, color)
+        powerups = self.sim.powerups
+        order = powerups.indices()
+        px, py = self.positions('powerups')
+        for x, y, kind in zip(px[order].tolist(), py[order].tolist(),
+                              powerups.kind[order].tolist()):
+            color = 11 if kind == POWERUP_POWER else 12
+            self.gfx.circ(x, y, 3, color)
+    
+    def draw_player(self):
+        sim = self.sim
         
         # プレイヤーの描画（無敵時はフラッシュさせる）
-        if self.player['invincible'] == 0 or self.skip_frame % 4 < 2:
+        if sim.player['invincible'] == 0 or sim.skip_frame % 4 < 2:
+            x, y = self.player_position()
+            
             # シールド有効時は輪郭を表示
-            if self.player['shield'] > 0:
-                pyxel.circb(self.player['x'] + 4, self.player['y'] + 4, 6, 12)
+            if sim.player['shield'] > 0:
+                self.gfx.circb(x + 4, y + 4, 6, 12)
             
-            pyxel.blt(self.player['x'], self.player['y'], 0, 0, 0, 8, 8, 0)
-        
-        # エフェクトの描画
-        for exp in self.explosions:
-            pyxel.circ(exp['x'], exp['y'], exp['radius'], exp['color'])
+            self.gfx.blt(x, y, 0, 0, 0, 8, 8, 0)
+    
+    def draw_particles(self):
+        # エフェクトの描画（色と大きさは配列でまとめて求め、描き方ごとに最も安い命令で描く）
+        particles = self.sim.particles
+        n = particles.count
+        if not n:
+            return
+        colors, sizes, shapes = particles.appearance()
+        x = particles.x[:n]
+        y = particles.y[:n]
+        if self.interpolate:
+            # 補間するときは速度から前のステップとの間の位置に戻す
+            back = (1 - self.timestep.alpha()) * self.sim.time_scale
+            x = x - particles.vx[:n] * back
+            y = y - particles.vy[:n] * back
+        
+        # 噴射などの正方形（左上の位置に直してから描く）
+        rects = shapes == SHAPE_RECT
+        if rects.any():
+            s = sizes[rects]
+            for rx, ry, size, color in zip((x[rects] - s / 2).tolist(), (y[rects] - s / 2).tolist(),
+                                           s.tolist(), colors[rects].tolist()):
+                self.gfx.rect(rx, ry, size, size, color)
+        
+        # 爆発の円
+        circles = shapes == SHAPE_CIRCLE
+        if circles.any():
+            for cx, cy, radius, color in zip(x[circles].tolist(), y[circles].tolist(),
+                                             sizes[circles].tolist(), colors[circles].tolist()):
+                self.gfx.circ(cx, cy, radius, color)
+        
+        # 破片と火花の点（いちばん多いので最後にまとめて描く）
+        pixels = shapes == SHAPE_PIXEL
+        if pixels.any():
+            pset = self.gfx.pset
+            for px, py, color in zip(x[pixels].tolist(), y[pixels].tolist(), colors[pixels].tolist()):
+                pset(px, py, color)
+    
+    def draw_hud(self):
+        sim = self.sim
         
         # UI表示
         # スコア
-        pyxel.text(4, 4, f"SCORE: {self.score}", 7)
+        self.gfx.text(4, 4, f"SCORE: {sim.score}", 7)
         
         # 残機
-        for i in range(self.player['lives']):
-            pyxel.blt(4 + i * 10, 15, 0, 0, 0, 8, 8, 0)
+        for i in range(sim.player['lives']):
+            self.gfx.blt(4 + i * 10, 15, 0, 0, 0, 8, 8, 0)
         
         # パワーレベル
-        pyxel.text(100, 4, f"POWER: {self.player['power_level']}", 11)
+        self.gfx.text(100, 4, f"POWER: {sim.player['power_level']}", 11)
         
         # ステージ
-        pyxel.text(100, 15, f"STAGE: {self.stage}", 12)
+        self.gfx.text(100, 15, f"STAGE: {sim.stage}", 12)
         
         # ボス出現ゲージの描画
-        if not self.boss_appeared: # ボス出現前のみゲージ表示
+        if not sim.boss_appeared: # ボス出現前のみゲージ表示
             gauge_width = 50 # ゲージバーの幅
             gauge_height = 5  # ゲージバーの高さ
             gauge_x = 105     # ゲージバーのX座標
             gauge_y = 25      # ゲージバーのY座標
             
             # ゲージ背景
-            pyxel.rectb(gauge_x, gauge_y, gauge_width, gauge_height, 1)
+            self.gfx.rectb(gauge_x, gauge_y, gauge_width, gauge_height, 1)
             # 現在のゲージ量
-            current_gauge_width = int(gauge_width * (self.boss_gauge / self.boss_gauge_max))
-            pyxel.rect(gauge_x, gauge_y, current_gauge_width, gauge_height, 8)
+            current_gauge_width = int(gauge_width * (sim.boss_gauge / sim.boss_gauge_max))
+            self.gfx.rect(gauge_x, gauge_y, current_gauge_width, gauge_height, 8)
             # テキスト表示 (例: BOSS: 50%)
-            pyxel.text(gauge_x - 20, gauge_y, f"BOSS:", 7)
-            pyxel.text(gauge_x + gauge_width + 2, gauge_y, f"{int(self.boss_gauge / self.boss_gauge_max * 100)}%", 7)
+            self.gfx.text(gauge_x - 20, gauge_y, f"BOSS:", 7)
+            self.gfx.text(gauge_x + gauge_width + 2, gauge_y, f"{int(sim.boss_gauge / sim.boss_gauge_max * 100)}%", 7)
     
     def draw_pause_screen(self):
         # 半透明の黒色オーバーレイ（交互の線で表現）
         for y in range(0, 140, 2):
-            pyxel.line(0, y, 160, y, 0)
+            self.gfx.line(0, y, 160, y, 0)
         
         # ポーズテキスト
-        pyxel.text(65, 60, "PAUSED", 7)
+        self.gfx.text(65, 60, "PAUSED", 7)
         
         # 再開方法
-        if hasattr(pyxel, 'GAMEPAD1_BUTTON_START'):
-            pyxel.text(45, 75, "PRESS START TO RESUME", 11)
+        if self.has_start_button:
+            self.gfx.text(45, 75, "PRESS START TO RESUME", 11)
         else:
-            pyxel.text(45, 75, "PRESS ESC TO RESUME", 11)
+            self.gfx.text(45, 75, "PRESS ESC TO RESUME", 11)
     
     def draw_gameover(self):
+        sim = self.sim
+        
         # ゲームオーバー画面の描画
-        pyxel.text(60, 50, "GAME OVER", 8)
-        pyxel.text(50, 70, f"FINAL SCORE: {self.score}", 7)
-        pyxel.text(45, 90, "PRESS R TO RESTART", 11)
+        self.gfx.text(60, 50, "GAME OVER", 8)
+        self.gfx.text(50, 70, f"FINAL SCORE: {sim.score}", 7)
+        if self.leaderboard:
+            self.gfx.text(50, 78, f"HIGH SCORE: {self.leaderboard.high_score()}", 10)
+        self.gfx.text(45, 90, "PRESS R TO RESTART", 11)
         
         # モバイル用テキスト
         if self.is_mobile:
-            pyxel.text(55, 100, "OR TAP TO RESTART", 11)
+            self.gfx.text(55, 100, "OR TAP TO RESTART", 11)
         
         # ゲームパッド用のテキスト
-        if hasattr(pyxel, 'GAMEPAD1_BUTTON_A'):
-            pyxel.text(40, 110, "OR PRESS A TO RESTART", 11)
-    
-    def check_collision(self, obj1, obj2):
-        # 単純な矩形衝突判定
-        return not (
-            obj1['x'] + obj1['width'] <= obj2['x'] or
-            obj1['x'] >= obj2['x'] + obj2['width'] or
-            obj1['y'] + obj1['height'] <= obj2['y'] or
-            obj1['y'] >= obj2['y'] + obj2['height']
-        )
+        if self.has_gamepad:
+            self.gfx.text(40, 110, "OR PRESS A TO RESTART", 11)
+
+    def draw_profiler(self):
+        sim = self.sim
+        profiler = self.profiler
+        
+        # サブシステムごとの平均時間（ミリ秒）を棒グラフで表示
+        times = profiler.averages()
+        scale = 60 / max(times.max(), 0.01)  # 最も重い処理を棒の最大幅にする
+        num_updates = len(UPDATE_PHASES)
+        self.gfx.rect(0, 0, 112, len(times) * 6 + 16, 0)
+        self.gfx.text(2, 2, f"UPD {times[:num_updates].sum():.2f} DRW {times[num_updates:].sum():.2f}", 7)
+        for i, (name, ms) in enumerate(zip(profiler.phases, times.tolist())):
+            y = 9 + i * 6
+            color = 11 if i < num_updates else 12
+            self.gfx.text(2, y, name.split('_', 1)[1][:4], color)
+            self.gfx.rect(20, y + 1, max(1, int(ms * scale)), 3, color)
+            self.gfx.text(84, y, f"{ms:.2f}", 7)
+        
+        # エンティティ数
+        self.gfx.text(2, 9 + len(times) * 6,
+                   f"S{len(sim.shots)} B{len(sim.bullets)} E{len(sim.enemies)} P{len(sim.powerups)} X{len(sim.particles)}"
+                   f" Q{self.quality.level}", 7)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Star Defender")
+    parser.add_argument('--seed', type=int, help="random seed for a reproducible run")
+    parser.add_argument('--record', metavar='PATH', help="record per-frame input to PATH")
+    parser.add_argument('--replay', metavar='PATH', help="play back a recorded session")
+    parser.add_argument('--quality', type=int, choices=range(len(QUALITY_LEVELS)),
+                        help="fix the quality level instead of adapting to frame time")
+    parser.add_argument('--quality-log', metavar='PATH', help="write quality level changes to PATH")
+    parser.add_argument('--render-fps', type=int, default=SIM_FPS,
+                        help=f"frames drawn per second (the game always steps at {SIM_FPS} per second)")
+    parser.add_argument('--max-catch-up', type=int, default=4,
+                        help="most game steps run for one drawn frame when behind")
+    parser.add_argument('--interpolate', action='store_true',
+                        help="draw moving things between the last two game steps")
+    parser.add_argument('--rewind', type=float, default=0, metavar='SECONDS',
+                        help="keep the last SECONDS of play and rewind while Backspace is held")
+    parser.add_argument('--eager-assets', action='store_true',
+                        help="load sprites and sounds before the first frame (for startup comparisons)")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="print startup timings as JSON after the first frame and exit")
+    parser.add_argument('--scores', metavar='PATH',
+                        help="high-score database (default: scores.db in the user data directory)")
+    parser.add_argument('--no-scores', action='store_true', help="do not read or save high scores")
+    parser.add_argument('--telemetry', metavar='DIR', help="write per-second play metrics to DIR")
+    args = parser.parse_args()
+    if args.seed is not None and not 0 <= args.seed < SEED_LIMIT:
+        parser.error(f"--seed must be between 0 and {SEED_LIMIT - 1}")
+    if args.rewind and (args.record or args.replay):
+        parser.error("--rewind cannot be combined with --record or --replay")
+    if not args.no_scores and args.scores is None:
+        args.scores = default_scores_path()
+    return args
 
-# ゲーム開始
-StarDefender()
\ No newline at end of file
+if __name__ == "__main__":
+    # ゲーム開始
+    args = parse_args()
+    StarDefender(seed=args.seed, record_path=args.record, replay_path=args.replay,
+                 quality=args.quality, quality_log_path=args.quality_log,
+                 render_fps=args.render_fps, max_catch_up=args.max_catch_up,
+                 interpolate=args.interpolate, rewind_seconds=args.rewind,
+                 eager_assets=args.eager_assets, startup_report=args.startup_report,
+                 scores_path=None if args.no_scores else args.scores,
+                 telemetry_dir=args.telemetry).run()
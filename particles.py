@@ -0,0 +1,208 @@
+import math
+
+import numpy as np
+
+# パーティクル（見た目だけの粒子）
+# 使用中の粒子は配列の先頭に詰めて持ち、移動・寿命の判定・削除を配列全体でまとめて行う
+# 削除は生き残った粒子を前に詰め直すだけなので、並び（描画の重なり）は生成順のまま
+
+# 寿命に対する見た目の変化（寿命をCURVE_STEPS段階に分け、段階ごとの色と大きさ）
+# shape: pixel（1点、pset）, rect（大きさを1辺とする正方形、rect）, circle（大きさを半径とする円、circ）
+CURVE_STEPS = 8
+CURVES = {
+    'fire': {'shape': 'circle', 'colors': [7, 10, 10, 9, 9, 8, 8, 2],
+             'sizes': [1, 2, 2.5, 3, 3, 2.5, 2, 1]},
+    'flash': {'shape': 'circle', 'colors': [7, 7, 10, 10, 9, 9, 8, 2],
+              'sizes': [3, 5, 7, 8, 9, 9, 8, 6]},
+    'debris': {'shape': 'pixel', 'colors': [7, 10, 10, 9, 9, 8, 2, 1]},
+    'spark': {'shape': 'pixel', 'colors': [7, 7, 12, 12, 6, 6, 5, 1]},
+    'exhaust': {'shape': 'rect', 'colors': [10, 10, 9, 9, 8, 8, 2, 1],
+                'sizes': [2, 2, 2, 2, 1, 1, 1, 1]},
+}
+SHAPES = ['pixel', 'rect', 'circle']
+SHAPE_PIXEL, SHAPE_RECT, SHAPE_CIRCLE = range(len(SHAPES))
+
+# エミッタ（1回の発生でどんな粒子をいくつ出すか）。層ごとに1つの曲線の粒子を出す
+# count: 粒子数（画質の密度を掛け、端数は確率で切り上げる）, speed: 速さの範囲（ピクセル/フレーム）
+# angle: 向きの中心（ラジアン、真下が0）, spread: 向きの広がり, life: 寿命の範囲（フレーム）
+# jitter: 発生位置のばらつき（ピクセル）, drag: 1フレームごとに速度に掛ける値, gravity: 1フレームごとのvyの増分
+EMITTERS = {
+    # 敵の撃破と被弾（これまでの爆発の円に破片を足す）
+    'explosion': [
+        {'curve': 'fire', 'count': 4, 'speed': (0.0, 0.3), 'life': (10, 20), 'jitter': 5, 'drag': 0.9},
+        {'curve': 'debris', 'count': 12, 'speed': (0.8, 2.2), 'life': (8, 18), 'jitter': 2,
+         'drag': 0.92, 'gravity': 0.04},
+    ],
+    # ボスの撃破（大きな閃光と多数の破片）
+    'boss_explosion': [
+        {'curve': 'flash', 'count': 3, 'speed': (0.0, 0.2), 'life': (20, 30), 'jitter': 6, 'drag': 0.9},
+        {'curve': 'fire', 'count': 24, 'speed': (0.2, 1.2), 'life': (15, 35), 'jitter': 8, 'drag': 0.93},
+        {'curve': 'debris', 'count': 96, 'speed': (1.0, 3.5), 'life': (15, 40), 'jitter': 4,
+         'drag': 0.95, 'gravity': 0.03},
+    ],
+    # シールドが敵の弾や体当たりを防いだときの火花（上向きに散る）
+    'shield_hit': [
+        {'curve': 'spark', 'count': 10, 'speed': (1.0, 2.5), 'angle': math.pi, 'spread': 2.4,
+         'life': (6, 12), 'jitter': 1, 'drag': 0.85},
+    ],
+    # 自機の噴射（毎フレーム、下へ流れる）
+    'thruster': [
+        {'curve': 'exhaust', 'count': 1, 'speed': (0.8, 1.6), 'spread': 0.5, 'life': (6, 10),
+         'jitter': 1, 'drag': 0.96},
+    ],
+}
+# 実数の列は1つの2次元配列の行にする（削除は全行を1回で詰められる）
+# 経過フレーム数ageは進む速さrate（常に1）を速度の隣に置き、位置と1回の足し算で進める
+FLOAT_COLUMNS = ['x', 'y', 'age', 'vx', 'vy', 'rate', 'drag', 'gravity', 'life']
+SMALL_BURST = 4  # これ以下の粒子数は配列を作らずに1つずつ書き込む（毎フレームの噴射など）
+
+
+def compile_curves(curves):
+    # 曲線の定義を (色, 大きさ, 描き方) の表にする（行が曲線の番号、列が寿命の段階）
+    colors = np.zeros((len(curves), CURVE_STEPS), np.int8)
+    sizes = np.ones((len(curves), CURVE_STEPS), np.float32)
+    shapes = np.zeros(len(curves), np.int8)
+    for k, spec in enumerate(curves.values()):
+        colors[k] = spec['colors']
+        sizes[k] = spec.get('sizes', 1)
+        shapes[k] = SHAPES.index(spec['shape'])
+    return colors, sizes, shapes
+
+
+CURVE_INDEX = {name: k for k, name in enumerate(CURVES)}
+CURVE_COLORS, CURVE_SIZES, CURVE_SHAPES = compile_curves(CURVES)
+
+
+class Emitter:
+    # エミッタの定義を層ごとのタプルにしたもの（発生のたびに辞書を引かない）
+    def __init__(self, layers):
+        self.layers = [(layer['count'], CURVE_INDEX[layer['curve']], layer['speed'],
+                        layer.get('angle', 0.0), layer.get('spread', 2 * math.pi), layer['life'],
+                        layer.get('jitter', 0), layer.get('drag', 1.0), layer.get('gravity', 0.0))
+                       for layer in layers]
+
+    def emit(self, particles, rng, x, y, scale=1.0, limit=None):
+        # (x, y) に粒子を出す。乱数はrng（random.Random）から引くので、状態を保存すれば同じ粒子になる
+        # 1つの粒子につき5つの乱数（位置x, y, 向き, 速さ, 寿命）を引く
+        for count, curve, speed, angle, spread, life, jitter, drag, gravity in self.layers:
+            n = min(int(count * scale + rng.random()), particles.room(limit))
+            if n <= 0:
+                continue
+            if n <= SMALL_BURST:
+                for _ in range(n):
+                    px = x + (rng.random() * 2 - 1) * jitter
+                    py = y + (rng.random() * 2 - 1) * jitter
+                    a = angle + (rng.random() - 0.5) * spread
+                    s = speed[0] + rng.random() * (speed[1] - speed[0])
+                    particles.spawn_one(px, py, math.sin(a) * s, math.cos(a) * s,
+                                        life[0] + rng.random() * (life[1] - life[0]), curve, drag, gravity)
+                continue
+            r = np.array([rng.random() for _ in range(5 * n)], np.float32).reshape(n, 5).T
+            a = angle + (r[2] - 0.5) * spread
+            s = speed[0] + r[3] * (speed[1] - speed[0])
+            particles.spawn(x + (r[0] * 2 - 1) * jitter, y + (r[1] * 2 - 1) * jitter,
+                            np.sin(a) * s, np.cos(a) * s, life[0] + r[4] * (life[1] - life[0]),
+                            curve, drag, gravity)
+
+
+EMITTER_TABLE = {name: Emitter(layers) for name, layers in EMITTERS.items()}
+
+
+class ParticleSystem:
+    # 固定容量の粒子の配列（先頭のcount個が使用中）
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros((len(FLOAT_COLUMNS), capacity), np.float32)
+        for k, name in enumerate(FLOAT_COLUMNS):
+            setattr(self, name, self.data[k])
+        self.moving = self.data[0:3]  # x, y, age
+        self.velocity = self.data[3:6]  # vx, vy, rate
+        self.curve = np.zeros(capacity, np.int8)
+        self.count = 0
+        # 削除で詰め直すときの作業用の配列
+        self.spare = np.zeros(capacity, np.float32)
+        self.spare_curve = np.zeros_like(self.curve)
+        self.keep = np.zeros(capacity, np.bool_)
+
+    def __len__(self):
+        return self.count
+
+    def column_names(self):
+        return FLOAT_COLUMNS + ['curve']
+
+    def clear(self):
+        self.count = 0
+
+    def room(self, limit=None):
+        # あと何個出せるか（limitは画質の設定による上限）
+        if limit is None:
+            limit = self.capacity
+        return max(0, min(limit, self.capacity) - self.count)
+
+    def spawn(self, x, y, vx, vy, life, curve, drag=1.0, gravity=0.0):
+        # 配列で渡した粒子をまとめて末尾に追加する（入りきらない分は捨てる）
+        n = min(len(vx), self.capacity - self.count)
+        if n <= 0:
+            return 0
+        start = self.count
+        end = start + n
+        block = self.data[:, start:end]
+        block[0] = x[:n]
+        block[1] = y[:n]
+        block[2] = 0
+        block[3] = vx[:n]
+        block[4] = vy[:n]
+        block[5] = 1
+        block[6] = drag
+        block[7] = gravity
+        block[8] = life[:n]
+        self.curve[start:end] = curve
+        self.count = end
+        return n
+
+    def spawn_one(self, x, y, vx, vy, life, curve, drag=1.0, gravity=0.0):
+        i = self.count
+        if i >= self.capacity:
+            return 0
+        self.data[:, i] = (x, y, 0, vx, vy, 1, drag, gravity, life)
+        self.curve[i] = curve
+        self.count = i + 1
+        return 1
+
+    def update(self, dt=1):
+        # 全粒子をdtフレーム進め、寿命が尽きた粒子を詰めて消す
+        # （寿命は長くても数十フレームなので、画面外に出た粒子も寿命まで残す。描画は画面で切り取られる）
+        n = self.count
+        if not n:
+            return
+        drag = self.drag[:n]
+        velocity = self.velocity[:2, :n]
+        vy = self.vy[:n]
+        if dt == 1:
+            velocity *= drag
+            vy += self.gravity[:n]
+            self.moving[:, :n] += self.velocity[:, :n]
+        else:
+            velocity *= drag ** dt
+            vy += self.gravity[:n] * dt
+            self.moving[:, :n] += self.velocity[:, :n] * dt
+        keep = np.less(self.age[:n], self.life[:n], out=self.keep[:n])
+        kept = int(np.count_nonzero(keep))
+        if kept == n:
+            return
+        # 生き残った粒子を行ごとに作業用の配列へ抜き出し、先頭に書き戻す
+        # （2次元のまま抜き出すと全体の写しができる。mode='clip'は出力を一時配列に書かない）
+        idx = keep.nonzero()[0]
+        for row in self.data:
+            np.take(row[:n], idx, out=self.spare[:kept], mode='clip')
+            row[:kept] = self.spare[:kept]
+        np.take(self.curve[:n], idx, out=self.spare_curve[:kept], mode='clip')
+        self.curve[:kept] = self.spare_curve[:kept]
+        self.count = kept
+
+    def appearance(self):
+        # 使用中の粒子の (色, 大きさ, 描き方) を寿命の段階から求める
+        n = self.count
+        step = np.minimum((self.age[:n] * CURVE_STEPS / self.life[:n]).astype(np.intp), CURVE_STEPS - 1)
+        curve = self.curve[:n]
+        return CURVE_COLORS[curve, step], CURVE_SIZES[curve, step], CURVE_SHAPES[curve]
@@ -0,0 +1,74 @@
+import math
+
+import numpy as np
+
+# ボスの弾幕パターンの定義（ステージごとに順番に使う）
+# type: spread（下向きの扇）, ring（全方位）, spiral（回転する全方位）, aimed（自機狙いの扇）
+# count: 1回に撃つ弾の数, speed: 弾の速さ, interval: 発射間隔（フレーム）
+# arc: 扇の広がり（ラジアン）, volleys: spiralが1周するまでの回数（1回ごとに2π/volleysずつ回す）
+# per_stage: ステージが1つ上がるごとの増分（countは切り捨て）
+BOSS_PATTERNS = [
+    {'type': 'spread', 'count': 3, 'speed': 2.5, 'arc': 0.4, 'interval': 25,
+     'per_stage': {'count': 0.5, 'speed': 0.05}},
+    {'type': 'ring', 'count': 12, 'speed': 1.5, 'interval': 40,
+     'per_stage': {'count': 1, 'speed': 0.05}},
+    {'type': 'spiral', 'count': 3, 'speed': 1.8, 'volleys': 21, 'interval': 6,
+     'per_stage': {'count': 0.25, 'speed': 0.05}},
+    {'type': 'aimed', 'count': 3, 'speed': 2.2, 'arc': 0.5, 'interval': 20,
+     'per_stage': {'count': 0.5, 'speed': 0.05}},
+]
+MAX_PATTERN_BULLETS = 48  # 1回に撃つ弾の数の上限
+MAX_PATTERN_SPEED = 4.0
+
+
+class CompiledPattern:
+    # ステージに合わせて計算済みの弾幕（発射のたびに表を1行取り出すだけで撃てる）
+    def __init__(self, velocities, interval, aimed):
+        self.velocities = velocities  # (1周期の回数, 弾の数, 2) のvx, vy
+        self.interval = interval
+        self.aimed = aimed  # Trueなら撃つときに自機の方向へ回す（表は真下向きが基準）
+
+    def volley(self, phase):
+        # phase回目の発射の速度（vx, vy）
+        table = self.velocities[phase % len(self.velocities)]
+        return table[:, 0], table[:, 1]
+
+
+def boss_pattern_index(stage):
+    # ステージで使うパターンの番号
+    return (stage - 1) % len(BOSS_PATTERNS)
+
+
+def compile_pattern(spec, stage):
+    # パターンの定義とステージから速度の表を作る（角度は真下を0として時計回りと逆向き）
+    scale = spec.get('per_stage', {})
+    steps = stage - 1
+    count = min(MAX_PATTERN_BULLETS, max(1, int(spec['count'] + scale.get('count', 0) * steps)))
+    speed = min(MAX_PATTERN_SPEED, spec['speed'] + scale.get('speed', 0) * steps)
+
+    kind = spec['type']
+    if kind in ('spread', 'aimed'):
+        arc = spec['arc']
+        angles = np.linspace(-arc / 2, arc / 2, count) if count > 1 else np.zeros(1)
+        angles = angles[None, :]
+    elif kind == 'ring':
+        angles = (np.arange(count) * (2 * math.pi / count))[None, :]
+    elif kind == 'spiral':
+        # 表の最後から最初に戻るときも同じ角度だけ回るように、1周期でちょうど1回転させる
+        volleys = np.arange(spec['volleys'])[:, None]
+        angles = (np.arange(count)[None, :] * (2 * math.pi / count) +
+                  volleys * (2 * math.pi / spec['volleys']))
+    else:
+        raise ValueError(f"unknown bullet pattern type {kind!r}")
+
+    velocities = np.stack([np.sin(angles) * speed, np.cos(angles) * speed], axis=-1)
+    return CompiledPattern(velocities, spec['interval'], kind == 'aimed')
+
+
+def aim(vx, vy, dx, dy):
+    # 真下向きが基準の速度を(dx, dy)の方向へ回す（dx, dyは配列でもよい、距離0なら真下のまま）
+    distance = np.hypot(dx, dy)
+    safe = np.maximum(distance, 1e-9)
+    sin = np.where(distance > 0, dx / safe, 0.0)
+    cos = np.where(distance > 0, dy / safe, 1.0)
+    return vx * cos + vy * sin, vy * cos - vx * sin
@@ -0,0 +1,77 @@
+import time
+
+import numpy as np
+
+# 計測するサブシステム（Simulationの更新処理とフロントエンドの描画処理）
+UPDATE_PHASES = ['update_player', 'update_touch_controls', 'update_shots', 'update_bullets',
+                 'update_enemies', 'update_powerups', 'update_collisions', 'update_particles',
+                 'update_stars']
+DRAW_PHASES = ['draw_stars', 'draw_enemies', 'draw_shots', 'draw_bullets', 'draw_powerups',
+               'draw_player', 'draw_particles', 'draw_hud']
+
+
+class FrameProfiler:
+    # サブシステムごとの処理時間をフレーム単位でリングバッファに記録する
+    # 有効な間だけ対象オブジェクトのメソッドをインスタンス属性の計測用関数で覆い、
+    # 無効にすると属性を消して元のメソッドに戻す（無効時の負荷は0）
+    def __init__(self, targets, history=60):
+        # targets: [(オブジェクト, [メソッド名, ...]), ...]
+        self.targets = targets
+        self.phases = [name for _, names in targets for name in names]
+        self.times = np.zeros((history, len(self.phases)))  # 秒
+        self.row = 0  # 記録中のフレームの行
+        self.frames = 0  # 記録し終えたフレーム数
+        self.enabled = False
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.times[:] = 0
+        self.row = 0
+        self.frames = 0
+        column = 0
+        for obj, names in self.targets:
+            for name in names:
+                setattr(obj, name, self.timed(getattr(obj, name), column))
+                column += 1
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        for obj, names in self.targets:
+            for name in names:
+                delattr(obj, name)
+        self.enabled = False
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def timed(self, method, column):
+        # 呼び出しにかかった時間を現在の行に足し込む関数
+        times = self.times
+        clock = time.perf_counter
+
+        def timed_method(*args, **kwargs):
+            start = clock()
+            result = method(*args, **kwargs)
+            times[self.row, column] += clock() - start
+            return result
+        return timed_method
+
+    def end_frame(self):
+        # 1フレーム分の記録を確定して次の行へ進む
+        self.row = (self.row + 1) % len(self.times)
+        self.times[self.row] = 0
+        self.frames += 1
+
+    def averages(self):
+        # 記録し終えたフレームの平均時間（ミリ秒、phasesの順）
+        count = min(self.frames, len(self.times) - 1)
+        if count == 0:
+            return np.zeros(len(self.phases))
+        total = self.times.sum(axis=0) - self.times[self.row]
+        return total / count * 1000
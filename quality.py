@@ -0,0 +1,71 @@
+from collections import deque
+
+# 画質の段階（低い順）
+# max_particles: 同時に出すパーティクルの上限, particle_density: エミッタの粒子数に掛ける値,
+# star_update_interval: 星を更新するフレーム間隔, shot_draw_limit: 描画する弾の数の上限
+# どれも見た目だけに関わる値で、変えてもゲームの展開は変わらない
+QUALITY_LEVELS = [
+    {'max_particles': 128, 'particle_density': 0.25, 'star_update_interval': 8, 'shot_draw_limit': 8},
+    {'max_particles': 512, 'particle_density': 0.5, 'star_update_interval': 4, 'shot_draw_limit': 15},
+    {'max_particles': 1536, 'particle_density': 1.0, 'star_update_interval': 2, 'shot_draw_limit': 23},
+    {'max_particles': 3072, 'particle_density': 1.5, 'star_update_interval': 1, 'shot_draw_limit': 23},
+]
+DEFAULT_LEVEL = 1  # これまで手で調整していた値
+
+
+def level_capacity(levels):
+    # すべての段階を受け入れられるSimulationの引数（容量は最も高い段階で決まる）
+    return {'max_particles': max(level['max_particles'] for level in levels)}
+
+
+class QualityController:
+    # 実際の処理時間を見て画質の段階を上げ下げする
+    # 一定フレームごとに平均の処理時間を調べ、予算を超えそうならすぐに下げ、
+    # 十分に余裕がある状態が続いたときだけ1段ずつ上げる（行ったり来たりしないように）
+    def __init__(self, fps=30, levels=QUALITY_LEVELS, level=DEFAULT_LEVEL,
+                 window=30, downgrade_ratio=0.8, upgrade_ratio=0.4, upgrade_windows=5):
+        self.budget = 1 / fps  # 1フレームに使える時間（秒）
+        self.levels = levels
+        self.level = level
+        self.window = window  # 判定に使うフレーム数
+        self.downgrade_ratio = downgrade_ratio  # 平均が予算のこの割合を超えたら下げる
+        self.upgrade_ratio = upgrade_ratio  # 平均が予算のこの割合を下回り続けたら上げる
+        self.upgrade_windows = upgrade_windows  # 上げるまでに続けて余裕がある必要がある回数
+        self.frames = 0
+        self.busy = 0.0  # この判定区間の処理時間の合計
+        self.skipped = 0  # この判定区間に描画が間に合わなかったフレーム数
+        self.calm = 0  # 余裕がある判定が続いた回数
+        self.decisions = deque(maxlen=64)  # (フレーム番号, 元の段階, 新しい段階, 平均ミリ秒, 理由)
+
+    def settings(self):
+        return self.levels[self.level]
+
+    def record(self, busy, skipped=0):
+        # 1フレームの処理時間（秒）と描画されなかったフレーム数を記録する
+        # 段階を変えたときは新しい設定を返す（変えなければNone）
+        self.frames += 1
+        self.busy += busy
+        self.skipped += skipped
+        if self.frames % self.window:
+            return None
+
+        mean = self.busy / self.window
+        skipped = self.skipped
+        self.busy = 0.0
+        self.skipped = 0
+        if (mean > self.budget * self.downgrade_ratio or skipped > 1) and self.level > 0:
+            reason = f"skipped {skipped} frames" if skipped > 1 else "over budget"
+            return self.change(self.level - 1, mean, reason)
+        if mean < self.budget * self.upgrade_ratio and not skipped:
+            self.calm += 1
+            if self.calm >= self.upgrade_windows and self.level < len(self.levels) - 1:
+                return self.change(self.level + 1, mean, "headroom")
+        else:
+            self.calm = 0
+        return None
+
+    def change(self, level, mean, reason):
+        self.decisions.append((self.frames, self.level, level, mean * 1000, reason))
+        self.level = level
+        self.calm = 0
+        return self.settings()
@@ -0,0 +1,309 @@
+import math
+import struct
+import zipfile
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+# 描画の出力先（main.pyの描画処理はどちらにも同じ命令で描く）
+# PyxelRenderer: pyxelの画面に描く（ゲーム本体）
+# FramebufferRenderer: NumPyの配列（パレットの番号）に描く。ウィンドウの無い環境でも動くので、
+#   スクリーンショット、画像の比較、描画の計測に使う。座標の丸めと図形の塗り方はpyxel 2と同じにしてある
+DRAW_COMMANDS = ('cls', 'pset', 'line', 'rect', 'rectb', 'circ', 'circb', 'blt', 'text')
+IMAGE_BANKS = 3
+IMAGE_SIZE = 256  # イメージバンクの幅と高さ
+# pyxelの既定のパレット（0xRRGGBB）
+PALETTE = [0x000000, 0x2B335F, 0x7E2072, 0x19959C, 0x8B4852, 0x395C98, 0xA9C1FF, 0xEEEEEE,
+           0xD4186C, 0xD38441, 0xE9C35B, 0x70C6A9, 0x7696DE, 0xA3A3A3, 0xFF9798, 0xEDC7B0]
+PALETTE_RGB = np.array([[(c >> 16) & 0xFF, (c >> 8) & 0xFF, c & 0xFF] for c in PALETTE], np.uint8)
+
+# pyxelの内蔵フォント（文字コード32〜127、1文字4x6ドット、上の行から4ビットずつ）
+FONT_WIDTH = 4
+FONT_HEIGHT = 6
+FONT_FIRST = 32
+FONT_GLYPHS = [
+    0x000000, 0x444040, 0xaa0000, 0xaeaea0, 0x6c6c40, 0x824820, 0x4a4ac0, 0x440000,
+    0x244420, 0x844480, 0xa4e4a0, 0x04e400, 0x000480, 0x00e000, 0x000040, 0x224880,
+    0x6aaac0, 0x4c4440, 0xc248e0, 0xc242c0, 0xaae220, 0xe8c2c0, 0x68eae0, 0xe24880,
+    0xeaeae0, 0xeae2c0, 0x040400, 0x040480, 0x248420, 0x0e0e00, 0x842480, 0xe24040,
+    0x4aa860, 0x4aeaa0, 0xcacac0, 0x688860, 0xcaaac0, 0xe8e8e0, 0xe8e880, 0x68ea60,
+    0xaaeaa0, 0xe444e0, 0x222a40, 0xaacaa0, 0x8888e0, 0xaeeaa0, 0xcaaaa0, 0x4aaa40,
+    0xcac880, 0x4aae60, 0xcaeca0, 0x6842c0, 0xe44440, 0xaaaa60, 0xaaaa40, 0xaaeea0,
+    0xaa4aa0, 0xaa4440, 0xe248e0, 0x644460, 0x884220, 0xc444c0, 0x4a0000, 0x0000e0,
+    0x840000, 0x06aa60, 0x8caac0, 0x068860, 0x26aa60, 0x06ac60, 0x24e440, 0x06ae24,
+    0x8caaa0, 0x404440, 0x2022a4, 0x8acca0, 0xc444e0, 0x0eeea0, 0x0caaa0, 0x04aa40,
+    0x0caac8, 0x06aa62, 0x068880, 0x06c6c0, 0x4e4460, 0x0aaa60, 0x0aaa40, 0x0aaee0,
+    0x0a44a0, 0x0aa624, 0x0e24e0, 0x64c460, 0x444440, 0xc464c0, 0x6c0000, 0xeeeee0,
+]
+GLYPH_MASKS = ((np.array(FONT_GLYPHS)[:, None] >> np.arange(FONT_WIDTH * FONT_HEIGHT - 1, -1, -1)) & 1).astype(
+    np.bool_).reshape(len(FONT_GLYPHS), FONT_HEIGHT, FONT_WIDTH)
+
+
+# pyxelは座標を32ビットの浮動小数点で受け取るので、同じ値に直してから丸める
+# （122.49999999999999は122.5になり、123に丸まる）
+FLOAT32 = [struct.Struct(f'<{n}f') for n in range(7)]
+POINT = FLOAT32[2]
+
+
+def to_ints(*values):
+    # pyxelと同じ座標の丸め（32ビットに直し、0.5は0から遠い方へ）
+    f = FLOAT32[len(values)]
+    return [int(v + 0.5) if v >= 0 else -int(0.5 - v) for v in f.unpack(f.pack(*values))]
+
+
+@lru_cache(maxsize=None)
+def circle_masks(radius):
+    # 半径radiusの円の (塗りつぶし, 輪郭) のマスク（中心が[radius, radius]）
+    # 各列の高さと各行の幅をそれぞれ平方根から求め、両方を合わせる
+    # （pyxelの円と同じ形にするため、丸めはpyxelと同じく0.01だけ切り上げ側に寄せる）
+    size = 2 * radius + 1
+    fill = np.zeros((size, size), np.bool_)
+    outline = np.zeros((size, size), np.bool_)
+    span = [int(math.sqrt(radius * radius - d * d) + 0.51) for d in range(radius + 1)]
+    for d, s in enumerate(span):
+        for sx, sy in ((d, s), (s, d)):
+            fill[radius - sy:radius + sy + 1, radius - sx:radius + sx + 1] = True
+            for px in (radius - sx, radius + sx):
+                for py in (radius - sy, radius + sy):
+                    outline[py, px] = True
+    return fill, outline
+
+
+@lru_cache(maxsize=512)
+def text_mask(s):
+    # 文字列を描くマスク（改行で次の行、フォントに無い文字は飛ばす）
+    lines = [[ord(c) - FONT_FIRST for c in line if 0 <= ord(c) - FONT_FIRST < len(FONT_GLYPHS)]
+             for line in s.split('\n')]
+    mask = np.zeros((len(lines) * FONT_HEIGHT, max(map(len, lines)) * FONT_WIDTH), np.bool_)
+    for row, codes in enumerate(lines):
+        for col, code in enumerate(codes):
+            mask[row * FONT_HEIGHT:(row + 1) * FONT_HEIGHT, col * FONT_WIDTH:(col + 1) * FONT_WIDTH] = GLYPH_MASKS[code]
+    return mask
+
+
+def blt_range(x, u, w, src_size, dst_size):
+    # bltの1つの軸について、写す先の範囲 [x1, x2) と写す元のスライスを求める（負のwは反転）
+    # 写す元と写す先のどちらかからはみ出す所は写さない
+    n = abs(w)
+    if w >= 0:
+        i1 = max(0, -u, -x)
+        i2 = min(n, src_size - u, dst_size - x)
+        return x + i1, x + max(i1, i2), slice(u + i1, u + max(i1, i2))
+    i1 = max(0, u + n - src_size, -x)
+    i2 = max(i1, min(n, u + n, dst_size - x))
+    stop = u + n - 1 - i2
+    return x + i1, x + i2, slice(u + n - 1 - i1, stop if stop >= 0 else None, -1)
+
+
+class Image:
+    # パレットの番号の2次元配列に描く画像（pyxel.Imageと同じ名前と引数の描画命令を持つ）
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.data = np.zeros((height, width), np.uint8)
+
+    def cls(self, col):
+        self.data.fill(col)
+
+    def pget(self, x, y):
+        x, y = to_ints(x, y)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return int(self.data[y, x])
+        return 0
+
+    def pset(self, x, y, col):
+        # 最も呼ばれる命令なので丸めを展開する（-0.5以下は-1以下に丸まるので画面の外）
+        x, y = POINT.unpack(POINT.pack(x, y))
+        if x <= -0.5 or y <= -0.5:
+            return
+        x = int(x + 0.5)
+        y = int(y + 0.5)
+        if x < self.width and y < self.height:
+            self.data[y, x] = col
+
+    def fill(self, x1, y1, x2, y2, col):
+        # 整数座標の長方形（両端を含む）を画面の範囲で切り取って塗る
+        x1 = max(x1, 0)
+        y1 = max(y1, 0)
+        x2 = min(x2, self.width - 1)
+        y2 = min(y2, self.height - 1)
+        if x1 <= x2 and y1 <= y2:
+            self.data[y1:y2 + 1, x1:x2 + 1] = col
+
+    def paint(self, x, y, mask, col):
+        # 左上を(x, y)に置いたマスクのTrueの所を塗る
+        h, w = mask.shape
+        if x >= 0 and y >= 0 and x + w <= self.width and y + h <= self.height:
+            self.data[y:y + h, x:x + w][mask] = col
+            return
+        x1 = max(x, 0)
+        y1 = max(y, 0)
+        x2 = min(x + w, self.width)
+        y2 = min(y + h, self.height)
+        if x1 < x2 and y1 < y2:
+            self.data[y1:y2, x1:x2][mask[y1 - y:y2 - y, x1 - x:x2 - x]] = col
+
+    def line(self, x1, y1, x2, y2, col):
+        # 長い方の軸に沿って1ドットずつ進め、もう一方は左（上）の端からの傾きで丸める
+        # （傾きはpyxelと同じく32ビットの浮動小数点で計算する。ちょうど0.5になる所の丸めが変わるため）
+        x1, y1, x2, y2 = to_ints(x1, y1, x2, y2)
+        steep = abs(y2 - y1) > abs(x2 - x1)
+        if steep:
+            x1, y1, x2, y2 = y1, x1, y2, x2
+        if x2 < x1:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+        n = x2 - x1
+        major = np.arange(x1, x2 + 1)
+        if n:
+            offsets = np.arange(n + 1, dtype=np.float32) * (np.float32(y2 - y1) / np.float32(n))
+            rounded = np.trunc(offsets)
+            rounded += np.sign(offsets) * (np.abs(offsets - rounded) >= 0.5)  # 0.5は0から遠い方へ
+            minor = y1 + rounded.astype(np.intp)
+        else:
+            minor = np.full(1, y1)
+        xs, ys = (minor, major) if steep else (major, minor)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        self.data[ys[inside], xs[inside]] = col
+
+    def rect(self, x, y, w, h, col):
+        x, y, w, h = to_ints(x, y, w, h)
+        if w > 0 and h > 0:
+            self.fill(x, y, x + w - 1, y + h - 1, col)
+
+    def rectb(self, x, y, w, h, col):
+        x, y, w, h = to_ints(x, y, w, h)
+        if w <= 0 or h <= 0:
+            return
+        x2 = x + w - 1
+        y2 = y + h - 1
+        self.fill(x, y, x2, y, col)
+        self.fill(x, y2, x2, y2, col)
+        self.fill(x, y, x, y2, col)
+        self.fill(x2, y, x2, y2, col)
+
+    def circ(self, x, y, r, col):
+        x, y, r = to_ints(x, y, r)
+        if r >= 0:
+            self.paint(x - r, y - r, circle_masks(r)[0], col)
+
+    def circb(self, x, y, r, col):
+        x, y, r = to_ints(x, y, r)
+        if r >= 0:
+            self.paint(x - r, y - r, circle_masks(r)[1], col)
+
+    def blt(self, x, y, img, u, v, w, h, colkey=None):
+        # imgの(u, v)から幅w, 高さhを(x, y)に写す（負の幅・高さは反転、colkeyの色は写さない）
+        x, y, u, v, w, h = to_ints(x, y, u, v, w, h)
+        x1, x2, columns = blt_range(x, u, w, img.width, self.width)
+        y1, y2, rows = blt_range(y, v, h, img.height, self.height)
+        if x1 >= x2 or y1 >= y2:
+            return
+        src = img.data[rows, columns]
+        dst = self.data[y1:y2, x1:x2]
+        if colkey is None:
+            dst[:] = src
+        else:
+            np.copyto(dst, src, where=src != colkey)
+
+    def text(self, x, y, s, col):
+        x, y = to_ints(x, y)
+        self.paint(x, y, text_mask(s), col)
+
+
+def load_image_banks(path):
+    # pyxelのリソースファイル（.pyxres）からイメージバンクを読む（{番号: (256, 256)の配列}）
+    # 1.x形式（zipの中に1行256文字の16進数で書いた imageN）だけに対応する
+    banks = {}
+    with zipfile.ZipFile(path) as z:
+        names = set(z.namelist())
+        if 'pyxel_resource/version' not in names:
+            raise ValueError(f"{path}: unsupported pyxel resource format")
+        lut = np.zeros(256, np.uint8)
+        lut[np.frombuffer(b'0123456789abcdef', np.uint8)] = np.arange(16)
+        for n in range(IMAGE_BANKS):
+            name = f'pyxel_resource/image{n}'
+            if name not in names:
+                continue
+            image = np.zeros((IMAGE_SIZE, IMAGE_SIZE), np.uint8)
+            for row, line in enumerate(z.read(name).lower().split(b'\n')[:IMAGE_SIZE]):
+                line = line.strip()[:IMAGE_SIZE]
+                image[row, :len(line)] = lut[np.frombuffer(line, np.uint8)]
+            banks[n] = image
+    return banks
+
+
+def write_png(path, pixels):
+    # パレットの番号の配列をインデックスカラーのPNGに書く
+    height, width = pixels.shape
+    raw = np.zeros((height, width + 1), np.uint8)  # 各行の先頭はフィルタの種類（0: なし）
+    raw[:, 1:] = pixels
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)))
+        f.write(chunk(b'PLTE', PALETTE_RGB.tobytes()))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 9)))
+        f.write(chunk(b'IEND', b''))
+
+
+class FramebufferRenderer:
+    # pyxelを使わずにNumPyの画面に描く（描画命令は画面のImageのメソッドをそのまま使う）
+    def __init__(self, width, height, banks=IMAGE_BANKS):
+        self.screen = Image(width, height)
+        self.images = [Image(IMAGE_SIZE, IMAGE_SIZE) for _ in range(banks)]
+        for name in DRAW_COMMANDS:
+            if name != 'blt':
+                setattr(self, name, getattr(self.screen, name))
+
+    def blt(self, x, y, img, u, v, w, h, colkey=None):
+        # imgはイメージバンクの番号かImage
+        self.screen.blt(x, y, self.images[img] if isinstance(img, int) else img, u, v, w, h, colkey)
+
+    def image(self, n):
+        return self.images[n]
+
+    def load(self, path):
+        # スプライトだけを読む（音は鳴らさないので読まない）
+        for n, data in load_image_banks(path).items():
+            self.images[n].data[:] = data
+
+    def pixels(self):
+        # 画面のパレットの番号（(高さ, 幅)の配列、コピー）
+        return self.screen.data.copy()
+
+    def save(self, path):
+        write_png(path, self.screen.data)
+
+
+class PyxelRenderer:
+    # pyxelの画面に描く（pyxel.initの後に作る）。描画命令はpyxelの関数をそのまま持つので余分な呼び出しは無い
+    def __init__(self):
+        import pyxel
+        self.pyxel = pyxel
+        for name in DRAW_COMMANDS:
+            setattr(self, name, getattr(pyxel, name))
+        self.screen = pyxel.screen
+
+    def image(self, n):
+        # pyxelのバージョンによってイメージバンクの取り出し方が違う
+        pyxel = self.pyxel
+        return pyxel.images[n] if hasattr(pyxel, 'images') else pyxel.image(n)
+
+    def load(self, path):
+        self.pyxel.load(path)
+
+    def pixels(self):
+        # 画面のパレットの番号（data_ptrの無い古いpyxelでは1ドットずつ読む）
+        screen = self.screen
+        if hasattr(screen, 'data_ptr'):
+            data = np.ctypeslib.as_array(screen.data_ptr(), shape=(screen.width * screen.height,))
+            return data.reshape(screen.height, screen.width).copy()
+        return np.array([[screen.pget(x, y) for x in range(screen.width)] for y in range(screen.height)],
+                        np.uint8)
+
+    def save(self, path):
+        write_png(path, self.pixels())
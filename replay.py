@@ -0,0 +1,262 @@
+import argparse
+import struct
+import time
+
+from simulation import Simulation, InputState, BTN_MOUSE, MAX_TIME_SCALE
+
+# リプレイファイルの形式
+# ヘッダ: マジック, バージョン, 乱数シード
+# 本体（バージョン3）: 同じ入力が続くフレームをまとめたランを並べる
+#   ラン: 可変長整数で (フレーム数, 前のランとのボタンのビットの差(XOR), マウスXの差, マウスYの差)
+#   差はジグザグ符号化（小さい負の数も1バイトになる）
+#   マウス座標はマウスボタン（タッチ）を押している間だけ記録し、離している間は前の値のままにする
+#   （Simulationが座標を読むのは押している間だけなので、展開は変わらない）
+# 本体（バージョン2）: 1フレームごとに (ボタンのビット, マウスX, マウスY) を並べる（読み込みのみ）
+REPLAY_MAGIC = b'SDRP'
+REPLAY_VERSION = 3  # 2: 爆発と星の乱数をゲームの乱数から分けた, 3: ランレングスと差分で圧縮
+RAW_VERSION = 2
+HEADER = struct.Struct('<4sHQ')
+SEED_LIMIT = 1 << 63  # 記録できるシードは0以上この値未満（Simulationが選ぶシードの範囲）
+FRAME = struct.Struct('<Hhh')
+
+
+def clamp16(value):
+    # マウス座標は画面外でも符号付き16bitに収める
+    return max(-32768, min(32767, int(value)))
+
+
+def check_seed(seed):
+    # ヘッダに書けないシードはファイルを開く前に断る
+    if not 0 <= seed < SEED_LIMIT:
+        raise ValueError(f"seed must be between 0 and {SEED_LIMIT - 1} to be recorded, got {seed}")
+
+
+def write_varint(out, value):
+    # 0以上の整数を7bitずつ下位から書く（最上位bitが続きの印）
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    # (値, 次の位置)
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+class InputEncoder:
+    # 入力をフレームごとに受け取り、ランにまとめてバイト列にする
+    def __init__(self):
+        self.out = bytearray()
+        self.frames = 0
+        self.run = None  # 書き出していないラン [ボタン, マウスX, マウスY, フレーム数]
+        self.last = (0, 0, 0)  # 最後に書き出したランの (ボタン, マウスX, マウスY)
+        self.mouse = (0, 0)  # 最後にマウスボタンを押していたときの座標
+
+    def add(self, buttons, mouse_x, mouse_y):
+        # 離している間の座標は記録しない
+        if buttons & BTN_MOUSE:
+            self.mouse = (mouse_x, mouse_y)
+        else:
+            mouse_x, mouse_y = self.mouse
+        run = self.run
+        if run is not None and run[0] == buttons and run[1] == mouse_x and run[2] == mouse_y:
+            run[3] += 1
+        else:
+            self.flush()
+            self.run = [buttons, mouse_x, mouse_y, 1]
+        self.frames += 1
+
+    def flush(self):
+        # 途中のランを書き出す（書き出したバイト数を返す）
+        if self.run is None:
+            return 0
+        buttons, mouse_x, mouse_y, count = self.run
+        last_buttons, last_x, last_y = self.last
+        size = len(self.out)
+        write_varint(self.out, count)
+        write_varint(self.out, buttons ^ last_buttons)
+        write_varint(self.out, zigzag(mouse_x - last_x))
+        write_varint(self.out, zigzag(mouse_y - last_y))
+        self.last = (buttons, mouse_x, mouse_y)
+        self.run = None
+        return len(self.out) - size
+
+
+def encode_replay(seed, frames):
+    # (ボタン, マウスX, マウスY) の並びからリプレイファイルのバイト列を作る
+    check_seed(seed)
+    encoder = InputEncoder()
+    for buttons, mouse_x, mouse_y in frames:
+        encoder.add(buttons, clamp16(mouse_x), clamp16(mouse_y))
+    encoder.flush()
+    return HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed) + encoder.out
+
+
+def decode_runs(body):
+    # バージョン3の本体から (ボタン, マウスX, マウスY, フレーム数) を順に返す
+    # 記録中に終了して途中で切れたランは捨てる
+    buttons = mouse_x = mouse_y = 0
+    pos = 0
+    end = len(body)
+    while pos < end:
+        try:
+            count, pos = read_varint(body, pos)
+            changed, pos = read_varint(body, pos)
+            dx, pos = read_varint(body, pos)
+            dy, pos = read_varint(body, pos)
+        except IndexError:
+            return
+        buttons ^= changed
+        mouse_x += unzigzag(dx)
+        mouse_y += unzigzag(dy)
+        yield buttons, mouse_x, mouse_y, count
+
+
+def iter_frames(version, body):
+    # 本体から1フレームずつ (ボタン, マウスX, マウスY) を返す
+    if version == RAW_VERSION:
+        if len(body) % FRAME.size:
+            # 記録中に終了した場合の途中までのフレームは捨てる
+            body = body[:len(body) - len(body) % FRAME.size]
+        yield from FRAME.iter_unpack(body)
+        return
+    for buttons, mouse_x, mouse_y, count in decode_runs(body):
+        frame = (buttons, mouse_x, mouse_y)
+        for _ in range(count):
+            yield frame
+
+
+class InputRecorder:
+    # Simulationに渡した入力を記録し、ランが終わるたびにファイルに書き出す
+    def __init__(self, path, seed):
+        check_seed(seed)
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed))
+        self.encoder = InputEncoder()
+
+    @property
+    def frames(self):
+        return self.encoder.frames
+
+    def record(self, inp):
+        encoder = self.encoder
+        size = len(encoder.out)
+        encoder.add(inp.buttons, clamp16(inp.mouse_x), clamp16(inp.mouse_y))
+        if len(encoder.out) != size:
+            self.write_pending()
+
+    def write_pending(self):
+        self.file.write(self.encoder.out)
+        self.encoder.out.clear()
+
+    def close(self):
+        if not self.file.closed:
+            self.encoder.flush()
+            self.write_pending()
+            self.file.close()
+
+
+def parse_replay(data, name="replay"):
+    # (シード, バージョン, 本体) を返す（dataはbytesかmemoryview）
+    if len(data) < HEADER.size:
+        raise ValueError(f"{name}: not a replay file")
+    magic, version, seed = HEADER.unpack_from(data)
+    if magic != REPLAY_MAGIC:
+        raise ValueError(f"{name}: not a replay file")
+    if version not in (RAW_VERSION, REPLAY_VERSION):
+        raise ValueError(f"{name}: unsupported replay version {version}")
+    return seed, version, memoryview(data)[HEADER.size:]
+
+
+def load_replay(path):
+    # (シード, バージョン, 本体) を返す
+    with open(path, 'rb') as f:
+        return parse_replay(f.read(), path)
+
+
+class InputPlayer:
+    # 記録した入力を1フレームずつ返す
+    # pathはファイルの場所、dataを渡した場合はそのバイト列（コーパスの1セッションなど）から読む
+    def __init__(self, path=None, data=None):
+        if data is None:
+            self.seed, version, body = load_replay(path)
+        else:
+            self.seed, version, body = parse_replay(data)
+        self.frames = iter_frames(version, body)
+        self.input = InputState()
+        self.finished = False
+
+    def next_input(self):
+        # 次のフレームの入力（記録が尽きたらNone）
+        for buttons, mouse_x, mouse_y in self.frames:
+            inp = self.input
+            inp.buttons = buttons
+            inp.mouse_x = mouse_x
+            inp.mouse_y = mouse_y
+            return inp
+        self.finished = True
+        return None
+
+
+def run_replay(path=None, data=None, time_scale=1, **options):
+    # 記録を最大速度でヘッドレス再生し、最後の状態のSimulationを返す
+    # time_scaleを2以上にすると早送りで流し見する（time_scaleフレーム分の入力をまとめて1ステップにする。
+    # 乱数を引く回数が変わるので展開は記録と一致しない）
+    player = InputPlayer(path, data)
+    sim = Simulation(seed=player.seed, time_scale=time_scale, **options)
+    inp = merged_input(player, time_scale)
+    while inp is not None:
+        sim.step(inp)
+        inp = merged_input(player, time_scale)
+    return sim
+
+
+def merged_input(player, frames):
+    # 次のframesフレーム分の入力を1つにまとめる（ボタンは押されたものすべて、マウスは最後の位置）
+    inp = player.next_input()
+    if inp is None or frames == 1:
+        return inp
+    merged = InputState(inp.buttons, inp.mouse_x, inp.mouse_y)
+    for _ in range(frames - 1):
+        inp = player.next_input()
+        if inp is None:
+            break
+        merged.buttons |= inp.buttons
+        merged.mouse_x = inp.mouse_x
+        merged.mouse_y = inp.mouse_y
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session headlessly at full speed")
+    parser.add_argument('path')
+    parser.add_argument('--fast-forward', type=int, default=1, choices=range(1, MAX_TIME_SCALE + 1),
+                        metavar='N', help="skim at N frames per step (outcomes only approximate the recording)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    sim = run_replay(args.path, time_scale=args.fast_forward)
+    elapsed = time.perf_counter() - start
+    print(f"frames: {sim.frame_count}  time: {elapsed:.3f}s  ({sim.frame_count / max(elapsed, 1e-9):.0f} fps)")
+    print(f"scene: {sim.scene}  score: {sim.score}  stage: {sim.stage}  lives: {sim.player['lives']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import csv
+import importlib
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from autopilot import autopilot_policy
+from simulation import (Simulation, InputState, BTN_LEFT, BTN_RIGHT, BTN_UP, BTN_DOWN,
+                        BTN_SPACE, DEATH_ENEMY_SHOT, DEATH_RAM, MAX_TIME_SCALE)
+
+# 1セッションの結果（ワーカーからはまとめて1つの配列で返す）
+SUMMARY_DTYPE = np.dtype([
+    ('seed', np.uint64),
+    ('score', np.int64),
+    ('stage', np.int32),
+    ('frames', np.int64),  # 生き残ったフレーム数
+    ('game_over', np.bool_),  # Falseならフレーム数の上限で打ち切り
+    ('deaths_enemy_shot', np.int32),
+    ('deaths_ram', np.int32),
+])
+
+
+# --- 方策 ---
+# 方策はシードを受け取って act(sim, frame, inp) を返す関数
+# actはステップごとに呼ばれ、inpを書き換えて入力を決める（frameはゲームのフレーム数で、早送りでは飛び飛びになる）
+
+def idle_policy(seed):
+    def act(sim, frame, inp):
+        inp.buttons = 0
+    return act
+
+
+def fire_policy(seed):
+    # その場で撃ち続ける
+    def act(sim, frame, inp):
+        inp.buttons = BTN_SPACE
+    return act
+
+
+def weave_policy(seed):
+    # 左右に往復しながら撃ち続ける
+    def act(sim, frame, inp):
+        inp.buttons = BTN_SPACE | (BTN_LEFT if (frame // 45) % 2 else BTN_RIGHT)
+    return act
+
+
+def random_policy(seed):
+    # 撃ちながら一定時間ごとにランダムな方向へ動く
+    rng = random.Random(seed)
+    moves = [0, BTN_LEFT, BTN_RIGHT, BTN_UP, BTN_DOWN]
+    state = {'move': 0, 'period': -1}
+
+    def act(sim, frame, inp):
+        if frame // 15 != state['period']:
+            state['period'] = frame // 15
+            state['move'] = rng.choice(moves)
+        inp.buttons = BTN_SPACE | state['move']
+    return act
+
+
+POLICIES = {
+    'idle': idle_policy,
+    'fire': fire_policy,
+    'weave': weave_policy,
+    'random': random_policy,
+    'autopilot': autopilot_policy,
+}
+
+
+def resolve_policy(name):
+    # 登録名か "モジュール:関数" で方策を選ぶ（ワーカーでも名前から解決する）
+    if name in POLICIES:
+        return POLICIES[name]
+    module, sep, attr = name.partition(':')
+    if not sep:
+        raise ValueError(f"unknown policy {name!r} (use one of {', '.join(POLICIES)} or module:function)")
+    return getattr(importlib.import_module(module), attr)
+
+
+# --- 実行 ---
+
+def run_session(seed, policy, max_frames, out, time_scale=1):
+    # 1セッションをゲームオーバー（またはmax_frames）まで進め、結果をoutに書き込む
+    sim = Simulation(seed=seed, time_scale=time_scale)
+    sim.start_game()
+    act = policy(seed)
+    inp = InputState()
+    frame = 0
+    while sim.scene == "GAME" and frame < max_frames:
+        act(sim, frame, inp)
+        sim.step(inp)
+        frame += time_scale
+    out['seed'] = seed
+    out['score'] = sim.score
+    out['stage'] = sim.stage
+    out['frames'] = frame
+    out['game_over'] = sim.scene == "GAMEOVER"
+    out['deaths_enemy_shot'] = sim.deaths[DEATH_ENEMY_SHOT]
+    out['deaths_ram'] = sim.deaths[DEATH_RAM]
+
+
+def run_chunk(seeds, policy_name, max_frames, time_scale=1):
+    # ワーカーで実行する単位（結果は1つの構造化配列にまとめて返す）
+    policy = resolve_policy(policy_name)
+    summaries = np.zeros(len(seeds), SUMMARY_DTYPE)
+    for k, seed in enumerate(seeds):
+        run_session(seed, policy, max_frames, summaries[k], time_scale)
+    return summaries
+
+
+def rollout(seeds, policy_name, max_frames=30 * 60 * 10, workers=None, chunk_size=64, time_scale=1):
+    # シードを塊に分けてプロセスプールで実行し、終わった塊から順に結果を返す
+    resolve_policy(policy_name)  # 名前の誤りはワーカーに渡す前に知らせる
+    seeds = [int(seed) for seed in seeds]
+    chunks = [seeds[i:i + chunk_size] for i in range(0, len(seeds), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_chunk, chunk, policy_name, max_frames, time_scale)
+                   for chunk in chunks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def print_summary(summaries, elapsed):
+    count = len(summaries)
+    frames = int(summaries['frames'].sum())
+    print(f"sessions: {count}  time: {elapsed:.1f}s  ({count / elapsed:.1f} sessions/s, "
+          f"{frames / elapsed:.0f} frames/s)")
+    print(f"score: mean {summaries['score'].mean():.1f}  median {np.median(summaries['score']):.0f}  "
+          f"max {summaries['score'].max()}")
+    print(f"frames survived: mean {summaries['frames'].mean():.0f}  "
+          f"game over: {int(summaries['game_over'].sum())}/{count}")
+    print(f"deaths: enemy shot {int(summaries['deaths_enemy_shot'].sum())}  "
+          f"ram {int(summaries['deaths_ram'].sum())}")
+    stages, counts = np.unique(summaries['stage'], return_counts=True)
+    print("stage reached: " + "  ".join(f"{s}:{c}" for s, c in zip(stages.tolist(), counts.tolist())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many seeded headless sessions across processes")
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0, help="first seed (sessions use seed, seed+1, ...)")
+    parser.add_argument('--policy', default='random',
+                        help=f"one of {', '.join(POLICIES)} or module:function")
+    parser.add_argument('--max-frames', type=int, default=30 * 60 * 10,
+                        help="stop a session after this many frames (default: 10 minutes)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=64, help="sessions per task sent to a worker")
+    parser.add_argument('--csv', metavar='PATH', help="write one row per session")
+    parser.add_argument('--time-scale', type=int, default=1, choices=range(1, MAX_TIME_SCALE + 1),
+                        metavar='N', help="fast-forward: advance N frames per step (see fast_forward.py)")
+    args = parser.parse_args()
+    try:
+        resolve_policy(args.policy)
+    except (ValueError, ImportError, AttributeError) as e:
+        parser.error(str(e))
+
+    if args.sessions < 1:
+        parser.error("--sessions must be at least 1")
+
+    seeds = range(args.seed, args.seed + args.sessions)
+    start = time.perf_counter()
+    summaries = np.concatenate(list(rollout(seeds, args.policy, args.max_frames,
+                                            args.workers, args.chunk_size, args.time_scale)))
+    elapsed = time.perf_counter() - start
+    summaries.sort(order='seed')
+    print_summary(summaries, elapsed)
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(SUMMARY_DTYPE.names)
+            writer.writerows(summaries.tolist())
+
+
+if __name__ == '__main__':
+    main()
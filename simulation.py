@@ -0,0 +1,836 @@
+import random
+
+import numpy as np
+
+from audio import AudioQueue
+from collision import (CollisionWorld, SweepStart, LAYER_PLAYER_SHOTS, LAYER_ENEMY_SHOTS,
+                       LAYER_ENEMIES, LAYER_POWERUPS)
+from entities import EntityStore
+from particles import ParticleSystem, EMITTER_TABLE
+from patterns import BOSS_PATTERNS, boss_pattern_index, compile_pattern, aim
+from snapshot import SnapshotLayout
+
+# 画面サイズ
+SCREEN_WIDTH = 160
+SCREEN_HEIGHT = 140
+PLAYER_AREA_HEIGHT = 120  # 自機が移動できる範囲
+
+# 入力ボタンのビット（キーボードとゲームパッドの十字キーはまとめて扱う）
+BTN_LEFT = 1 << 0
+BTN_RIGHT = 1 << 1
+BTN_UP = 1 << 2
+BTN_DOWN = 1 << 3
+BTN_SPACE = 1 << 4
+BTN_ESC = 1 << 5
+BTN_R = 1 << 6
+BTN_A = 1 << 7  # ゲームパッドのAボタン
+BTN_START = 1 << 8  # ゲームパッドのスタートボタン
+BTN_MOUSE = 1 << 9  # マウス左ボタン（タッチ）
+NUM_BUTTONS = 10
+
+MAX_TIME_SCALE = 8  # 早送りで1ステップに進められるフレーム数の上限
+
+# エンティティの種類（EntityStore.kindの値）
+SHOT_PLAYER = 0
+SHOT_ENEMY = 1  # 通常の敵の弾（bulletsに入る）
+BULLET_PATTERN = 2  # ボスの弾幕の弾（bulletsに入る）
+ENEMY_SMALL = 0
+ENEMY_MEDIUM = 1
+ENEMY_BOSS = 2
+POWERUP_POWER = 0
+POWERUP_SHIELD = 1
+
+# 被弾の原因（Simulation.deathsのキー）
+DEATH_ENEMY_SHOT = 'enemy_shot'
+DEATH_RAM = 'ram'
+
+# 取ったアイテムの種類の名前（Simulation.pickupsのキー）
+PICKUP_NAMES = {POWERUP_POWER: 'power', POWERUP_SHIELD: 'shield'}
+
+# 敵撃破時のボスゲージ上昇量 (調整可能)
+GAUGE_INCREASE = {ENEMY_SMALL: 20, ENEMY_MEDIUM: 50, ENEMY_BOSS: 0}
+
+
+class InputState:
+    # 1フレーム分の入力（押されているボタンのビットとマウス座標）
+    def __init__(self, buttons=0, mouse_x=0, mouse_y=0):
+        self.buttons = buttons
+        self.mouse_x = mouse_x
+        self.mouse_y = mouse_y
+
+
+class Simulation:
+    # 画面・音声を持たないゲーム本体（pyxelに依存しない）
+    def __init__(self, max_enemies=8, max_shots=15, max_particles=512, particle_density=0.5,
+                 star_update_interval=4, max_bullets=512, seed=None, time_scale=1):
+        # 乱数（ゲームの展開に関わる乱数はすべてこの1本の系列から引く）
+        if seed is None:
+            seed = random.randrange(1 << 63)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # 見た目だけの乱数（爆発）は別の系列にする
+        # 画質の設定で引く回数が変わっても、ゲームの展開は変わらない
+        self.effects_rng = random.Random(f"{seed}:effects")
+
+        # パフォーマンス最適化用の変数
+        self.skip_frame = 0
+        self.frame_count = 0
+        self.game_frames = 0  # ゲームが実際に進んだフレーム数（タイトル・一時停止中は増えない）
+        self.max_enemies = max_enemies  # さらに敵の数を削減
+        self.max_particles = max_particles  # 同時に出すパーティクルの上限
+        self.particle_density = particle_density  # エミッタの粒子数に掛ける値
+        self.star_update_interval = star_update_interval  # 星を更新するフレーム間隔
+        self.max_shots = max_shots  # 同時に表示する弾の数を制限
+        self.max_powerups = 32  # 画面内のアイテム数の上限（配列の容量）
+        self.max_bullets = max_bullets  # 敵の弾の容量（ボスの弾幕はこの範囲でいくらでも撃てる）
+
+        # エンティティの格納庫（容量は上限から決める）
+        # 自機の弾（キーとタッチの両方で撃つと1フレームで6発ぶん上限を超えることがある）
+        self.shots = EntityStore(max_shots + 6)
+        # 敵の弾は自機の弾とは別の格納庫に入れる
+        self.bullets = EntityStore(max_bullets)
+        # ボスは上限とは別に1体出現する
+        self.enemies = EntityStore(max_enemies + 1, {
+            'score': np.int32,
+            'fire_rate': np.float64,
+            'anim_frame': np.int8,
+            'anim_counter': np.int8,
+            'pattern': np.int8,  # ボスの弾幕パターンの番号（BOSS_PATTERNS）
+            'phase': np.int32,  # ボスが弾幕を撃った回数
+        })
+        self.powerups = EntityStore(self.max_powerups)
+        # パーティクル（爆発・火花・噴射）は先頭に詰めた配列でまとめて更新する
+        # （画質の設定で上限を下げることはあっても、ここで決めた容量より上げることはない）
+        self.particles = ParticleSystem(max_particles)
+
+        # ステージごとに計算した弾幕の表（(パターン番号, ステージ): CompiledPattern）
+        self.pattern_cache = {}
+
+        # 衝突判定（全レイヤーを1フレームに1回まとめて問い合わせる）
+        self.collision = CollisionWorld(SCREEN_WIDTH, SCREEN_HEIGHT)
+
+        # 早送り（1回のstepでtime_scaleフレーム分進める、1が通常）
+        # 速度とフレーム数で数えるタイマーをすべてtime_scale倍にし、当たり判定は移動の経路全体で行う
+        self.set_time_scale(time_scale)
+        self.sweep_starts = {name: SweepStart(getattr(self, name).capacity)
+                             for name in ('shots', 'bullets', 'enemies', 'powerups')}
+        self.player_start = (0, 0)
+
+        # 毎フレーム使い回す作業用の配列（数百個になる弾の判定は格納庫ごとの作業用の配列を使う）
+        self.fire_rolls = np.zeros(self.enemies.capacity)
+        self.rammed = np.zeros(self.enemies.capacity, np.bool_)
+        self.damaged = np.zeros(self.enemies.capacity, np.int32)  # このステップに敵が受けた弾の数
+
+        # 入力状態（ボタンごとの押下継続フレーム数）
+        self.input = InputState()
+        self.hold_frames = [0] * NUM_BUTTONS
+
+        # 音声の要求はフレームの間ためておき、まとめてチャンネルに割り当てる
+        self.audio = AudioQueue()
+        # このフレームで出た音声コマンド（フロントエンドが再生する）
+        self.audio_events = self.audio.events
+
+        self.scene = "TITLE"
+        self.is_paused = False
+        self.reset_game()
+
+        # タッチ操作用の変数
+        self.touch_last_x = 0
+        self.touch_last_y = 0
+        self.touch_fire_timer = 0
+        self.touch_start_time = 0
+        self.is_tap = False
+
+        # セーブステートの配置（格納庫の列へのビューを持つので最後に作る）
+        self.snapshot_layout = SnapshotLayout(self)
+
+    def reset_game(self):
+        # プレイヤー情報
+        self.player = {
+            'x': 80,
+            'y': 100,
+            'width': 8,
+            'height': 8,
+            'lives': 3,
+            'invincible': 0,
+            'power_level': 0,
+            'shield': 0
+        }
+
+        # ゲーム状態
+        self.shots.clear()
+        self.bullets.clear()
+        self.enemies.clear()
+        self.powerups.clear()
+        self.particles.clear()
+        self.boss = None  # ボスのハンドル（EntityStore.handle）
+        self.boss_gauge = 0
+        self.boss_gauge_max = 1000
+        self.boss_appeared = False
+
+        # 背景色の設定
+        self.bg_color = 0  # 最初の背景は黒
+
+        # ステージ情報
+        self.score = 0
+        self.stage = 1
+        self.enemy_spawn_timer = 0
+
+        # 背景の星のスクロール量（星の配置は描画側がステージごとに作る）
+        self.star_scroll = 0.0
+
+        # 原因ごとの失った残機の数
+        self.deaths = {DEATH_ENEMY_SHOT: 0, DEATH_RAM: 0}
+
+        # 種類ごとの取ったアイテムの数
+        self.pickups = {name: 0 for name in PICKUP_NAMES.values()}
+
+        # タッチ操作フラグ
+        self.is_touching = False
+
+    # --- セーブステート ---
+
+    def snapshot(self):
+        # ゲームの状態全体を固定レイアウトのバイト列にする
+        data = bytearray(self.snapshot_layout.size)
+        self.snapshot_layout.write(self, data)
+        return bytes(data)
+
+    def restore(self, data):
+        # snapshotで作ったバイト列の状態に戻す（容量の同じSimulationに限る）
+        self.snapshot_layout.read(self, data)
+
+    def set_time_scale(self, time_scale):
+        if not 1 <= time_scale <= MAX_TIME_SCALE:
+            raise ValueError(f"time_scale must be between 1 and {MAX_TIME_SCALE}")
+        self.time_scale = time_scale
+
+    # --- 入力 ---
+
+    def btn(self, button):
+        # ボタンが押されているか
+        return (self.input.buttons & button) != 0
+
+    def btnp(self, button, hold=0, repeat=0):
+        # pyxel.btnpと同じ判定（押した瞬間、またはhold後にrepeat間隔で真）
+        # 早送り中はステップで進めたフレームのどれかで真なら真
+        frames = self.hold_frames[button.bit_length() - 1]
+        if self.time_scale > 1:
+            return bool(self.btnp_frames(button, hold, repeat))
+        if frames == 1:
+            return True
+        if frames > 1 and hold > 0 and repeat > 0:
+            elapsed = frames - 1
+            return elapsed >= hold and (elapsed - hold) % repeat == 0
+        return False
+
+    def btnp_frames(self, button, hold=0, repeat=0):
+        # このステップで進めたフレームのうちbtnpが真になるフレーム（ステップの最初を0とする番号）
+        frames = self.hold_frames[button.bit_length() - 1]
+        first = frames - self.time_scale + 1  # ステップの最初のフレームでの押下継続フレーム数
+        hits = []
+        for held in range(max(first, 1), frames + 1):
+            elapsed = held - 1
+            if held == 1 or (hold > 0 and repeat > 0 and elapsed >= hold and (elapsed - hold) % repeat == 0):
+                hits.append(held - first)
+        return hits
+
+    # --- 音声 ---
+
+    def play(self, ch, snd):
+        self.audio.play(ch, snd)
+
+    def playm(self, msc, loop=False):
+        self.audio.playm(msc, loop)
+
+    def stop(self):
+        self.audio.stop()
+
+    # --- 更新 ---
+
+    def step(self, inp):
+        # 入力を受け取って1フレーム進める
+        self.input = inp
+        buttons = inp.buttons
+        hold_frames = self.hold_frames
+        dt = self.time_scale
+        for i in range(NUM_BUTTONS):
+            if buttons & (1 << i):
+                hold_frames[i] += dt
+            else:
+                hold_frames[i] = 0
+
+        self.update()
+        self.audio.flush(self.frame_count)
+        self.frame_count += dt
+
+    def update(self):
+        # フレームスキップカウンターを更新
+        self.skip_frame += 1
+
+        # 一時停止切り替え（ESCキーまたはポーズボタン）
+        if self.btnp(BTN_ESC) or self.btnp(BTN_START):
+            if self.scene == "GAME":
+                self.is_paused = not self.is_paused
+                if self.is_paused:
+                    self.stop()
+                else:
+                    self.playm(0, loop=True)
+
+        # シーンごとの更新処理
+        if self.scene == "TITLE":
+            self.update_title()
+        elif self.scene == "GAME":
+            if not self.is_paused:
+                self.update_game()
+        elif self.scene == "GAMEOVER":
+            self.update_gameover()
+
+        # リスタート処理
+        if self.btnp(BTN_R):
+            self.reset_game()
+            self.scene = "GAME"
+            self.is_paused = False
+
+    def start_game(self):
+        # タイトルからゲームを開始
+        self.scene = "GAME"
+        self.is_paused = False
+        self.playm(0, loop=True)
+        self.is_tap = False
+
+    def update_title(self):
+        # スタート画面の更新処理（スペース、ゲームパッドのAボタン、タップ）
+        if self.btnp(BTN_SPACE) or self.btnp(BTN_A) or self.is_tap:
+            self.start_game()
+
+    def update_game(self):
+        dt = self.time_scale
+        self.game_frames += dt
+
+        # プレイヤーの更新（早送りでは動く前の位置を当たり判定のために覚えておく）
+        if dt > 1:
+            self.player_start = (self.player['x'], self.player['y'])
+        self.update_player()
+
+        # モバイル用タッチコントロールの更新
+        self.update_touch_controls()
+
+        if dt > 1:
+            for name, start in self.sweep_starts.items():
+                start.save(getattr(self, name))
+
+        # ショットの更新（数を制限）
+        if dt > 1:
+            # 早送りでは1ステップに何回分も撃つので、画面外に出た弾を消してから数える
+            self.update_shots()
+            if len(self.shots) > self.max_shots:
+                self.shots.keep_newest(self.max_shots)
+        elif len(self.shots) <= self.max_shots:
+            self.update_shots()
+        else:
+            # 弾が多すぎる場合は古い弾を削除
+            self.shots.keep_newest(self.max_shots)
+
+        # 敵の弾の更新
+        self.update_bullets()
+
+        # 敵の更新
+        self.update_enemies()
+
+        # パワーアップアイテムの更新
+        self.update_powerups()
+
+        # 衝突判定と結果の反映
+        self.update_collisions()
+
+        # エフェクトの更新
+        self.update_particles()
+
+        # 星の更新は数フレームに1回だけ行う（間隔は画質の設定で変わる）
+        if self.skip_frame % self.star_update_interval == 0:
+            self.update_stars()
+
+        # 敵の生成タイミング管理
+        self.enemy_spawn_timer -= dt
+        if self.enemy_spawn_timer <= 0 and len(self.enemies) < self.max_enemies:
+            self.spawn_enemy()
+            # 出現間隔をさらに長く（早送りではステップの途中で出現した分を次の間隔から引く）
+            interval = 100 - min(60, self.stage * 8)  # ステージに応じて出現間隔を短縮
+            self.enemy_spawn_timer = interval + max(self.enemy_spawn_timer, 1 - dt)
+
+        # ボス出現条件をゲージベースに変更
+        if not self.boss_appeared and self.boss_gauge >= self.boss_gauge_max:
+            self.boss_appeared = True # ボス出現フラグを立てる
+
+            # 強力な敵として生成（より強力に）
+            boss = self.enemies.spawn(
+                self.rng.randint(20, 140),
+                self.rng.randint(-40, -30),
+                16, 16,
+                vx=self.rng.choice([-0.8, 0.8]),
+                vy=0.4,
+                kind=ENEMY_BOSS,  # ボス用の新しいタイプ（散弾パターンで攻撃）
+                hp=10 + self.stage * 2,  # 耐久力をさらに上げる
+                timer=30,  # 最初の弾幕までのフレーム数
+                score=500,  # 高得点
+                fire_rate=0,  # ボスは確率ではなく弾幕の間隔で撃つ
+                anim_frame=0,  # アニメーションフレーム
+                anim_counter=0,  # アニメーションカウンター
+                pattern=boss_pattern_index(self.stage),
+                phase=0
+            )
+            self.boss = self.enemies.handle(boss)
+            # ボス出現音
+            self.play(0, 3)
+
+            # ボス出現時に必ずパワーアップアイテムも出現させる
+            self.spawn_powerup(self.rng.randint(10, 150), self.rng.randint(-20, -10))
+
+    def update_gameover(self):
+        # ゲームオーバー画面の更新処理（Rキー、ゲームパッドのAボタン、タップ）
+        if self.btnp(BTN_R) or self.btnp(BTN_A) or self.is_tap:
+            self.reset_game()
+            self.scene = "GAME"
+            self.is_paused = False
+
+    def update_player(self):
+        dt = self.time_scale
+
+        # 無敵時間と盾の更新
+        if self.player['invincible'] > 0:
+            self.player['invincible'] = max(self.player['invincible'] - dt, 0)
+        if self.player['shield'] > 0:
+            self.player['shield'] = max(self.player['shield'] - dt, 0)
+
+        # 移動速度
+        speed = 2 * dt
+
+        # 移動処理
+        if self.btn(BTN_LEFT):
+            self.player['x'] = max(self.player['x'] - speed, 0)
+        if self.btn(BTN_RIGHT):
+            self.player['x'] = min(self.player['x'] + speed, SCREEN_WIDTH - self.player['width'])
+        if self.btn(BTN_UP):
+            self.player['y'] = max(self.player['y'] - speed, 0)
+        if self.btn(BTN_DOWN):
+            self.player['y'] = min(self.player['y'] + speed, PLAYER_AREA_HEIGHT - self.player['height'])
+
+        # ショット発射（キーボードまたはゲームパッドのAボタン）
+        # 早送りではステップの中で撃ったフレームごとに1回ずつ撃つ
+        for frame in self.btnp_frames(BTN_SPACE, 12, 4) or self.btnp_frames(BTN_A, 12, 4):
+            self.fire_player_shot(frame)
+
+        # タッチ操作による移動（タッチ画面用）
+        if self.is_touching:
+            # 移動と射撃の処理
+            self.touch_fire_timer += dt
+            while self.touch_fire_timer >= 8:  # 射撃間隔を少し長く
+                self.touch_fire_timer -= 8
+                self.fire_player_shot(dt - 1 - self.touch_fire_timer)
+
+    def update_touch_controls(self):
+        # タッチ状態をリセット
+        self.is_touching = False
+        self.is_tap = False
+
+        # タッチ操作の検出
+        if self.btnp(BTN_MOUSE):
+            self.touch_last_x = self.input.mouse_x
+            self.touch_last_y = self.input.mouse_y
+            self.touch_start_time = self.frame_count
+
+        if self.btn(BTN_MOUSE):
+            x, y = self.input.mouse_x, self.input.mouse_y
+
+            # 短時間タップ判定
+            if self.frame_count - self.touch_start_time < 5:
+                self.is_tap = True
+
+            # タイトル/ゲームオーバー画面のタップ判定
+            if self.scene == "TITLE" or self.scene == "GAMEOVER":
+                if 20 <= x <= 140 and 30 <= y <= 110:
+                    self.is_tap = True
+
+            # ゲーム中のタッチ操作
+            if self.scene == "GAME":
+                self.is_touching = True
+
+                # タッチ位置に自機を移動（単純な実装）
+                target_x = x - self.player['width'] // 2
+                target_y = y - self.player['height'] // 2
+
+                # 移動速度制限
+                max_move = 4 * self.time_scale
+                dx = target_x - self.player['x']
+                dy = target_y - self.player['y']
+
+                if abs(dx) > max_move:
+                    dx = max_move * (1 if dx > 0 else -1)
+                if abs(dy) > max_move:
+                    dy = max_move * (1 if dy > 0 else -1)
+
+                # プレイヤーを移動
+                self.player['x'] = max(min(self.player['x'] + dx, SCREEN_WIDTH - self.player['width']), 0)
+                self.player['y'] = max(min(self.player['y'] + dy, PLAYER_AREA_HEIGHT - self.player['height']), 0)
+
+        # タッチ終了時の処理
+        if not self.btn(BTN_MOUSE) and self.is_touching:
+            self.is_touching = False
+            self.touch_fire_timer = 0
+
+
+    def fire_player_shot(self, frame=0):
+        # プレイヤーの弾発射関数
+        # frameは早送りのステップの中で撃ったフレーム（後のフレームで撃った弾ほど手前に置く）
+        power = self.player['power_level']
+        px = self.player['x']
+        py = self.player['y']
+        shots = self.shots
+        first_seq = shots.next_seq
+
+        # ショット音
+        self.play(0, 0)
+
+        # パワーレベルに応じた弾の生成（上方向の速度は負のvyで表す）
+        if power == 0:
+            # 基本ショット
+            shots.spawn(px + 4, py - 4, 2, 4, vy=-4, kind=SHOT_PLAYER, hp=1)
+        elif power == 1:
+            # ダブルショット
+            shots.spawn(px + 1, py, 2, 4, vy=-4, kind=SHOT_PLAYER, hp=1)
+            shots.spawn(px + 5, py, 2, 4, vy=-4, kind=SHOT_PLAYER, hp=1)
+        else:
+            # トリプルショット (3方向)
+            shot_speed_y = 3.5  # Spread shot vertical speed
+            shot_speed_x = 1.0  # Spread shot horizontal speed
+            shots.spawn(px + 3, py - 4, 2, 4, vx=0, vy=-shot_speed_y, kind=SHOT_PLAYER, hp=1)  # Center
+            shots.spawn(px + 1, py - 2, 2, 4, vx=-shot_speed_x, vy=-shot_speed_y, kind=SHOT_PLAYER, hp=1)  # Left
+            shots.spawn(px + 5, py - 2, 2, 4, vx=shot_speed_x, vy=-shot_speed_y, kind=SHOT_PLAYER, hp=1)  # Right
+
+        if frame:
+            fired = shots.alive & (shots.seq >= first_seq)
+            shots.x[fired] -= shots.vx[fired] * frame
+            shots.y[fired] -= shots.vy[fired] * frame
+
+    def damage_player(self, cause):
+        # シールドがなければライフ減少
+        self.player['lives'] -= 1
+        self.deaths[cause] += 1
+        self.player['invincible'] = 60  # 1秒間の無敵
+        self.create_explosion(self.player['x'], self.player['y'])
+        self.play(0, 2)  # ダメージ音
+
+        if self.player['lives'] <= 0:
+            self.scene = "GAMEOVER"
+            self.is_paused = False
+
+    def update_shots(self):
+        # 自機のショットの更新（全弾をまとめて移動し、画面外の弾を削除）
+        shots = self.shots
+        if not shots.count:
+            return
+        alive = shots.alive
+        dt = self.time_scale
+        shots.x[alive] += shots.vx[alive] * dt
+        shots.y[alive] += shots.vy[alive] * dt
+        shots.kill_mask((shots.y < -shots.h) | (shots.x < 0) | (shots.x > SCREEN_WIDTH))
+
+    def update_bullets(self):
+        # 敵の弾の更新（弾幕は上や横にも飛ぶので、画面外へ遠ざかっている弾だけを削除）
+        bullets = self.bullets
+        if not bullets.count:
+            return
+        # 弾は数百発になるので、一時配列を作らずに格納庫の作業用の配列で判定する
+        bullets.advance(self.time_scale)
+        bullets.kill_mask(bullets.leaving(SCREEN_WIDTH, SCREEN_HEIGHT))
+
+    def update_enemies(self):
+        # 敵の更新
+        enemies = self.enemies
+        shots = self.shots
+        if not enemies.count:
+            return
+        alive = enemies.alive.copy()
+        dt = self.time_scale
+
+        # 敵の移動
+        enemies.y[alive] += enemies.vy[alive] * dt
+
+        # 左右の動きがある敵（画面端で向きを反転）
+        moving = alive & (enemies.vx != 0)
+        enemies.x[moving] += enemies.vx[moving] * dt
+        bounce = moving & ((enemies.x <= 0) | (enemies.x >= SCREEN_WIDTH - enemies.w))
+        enemies.vx[bounce] = -enemies.vx[bounce]
+        if dt > 1:
+            # 早送りでは画面端を越えた分だけ跳ね返った位置に戻す
+            right = SCREEN_WIDTH - enemies.w
+            enemies.x[bounce] = np.where(enemies.x[bounce] < 0, -enemies.x[bounce],
+                                         np.minimum(enemies.x[bounce], 2 * right[bounce] - enemies.x[bounce]))
+
+        # ボスのアニメーション更新（10フレームごと）
+        boss = alive & (enemies.kind == ENEMY_BOSS)
+        if boss.any():
+            enemies.anim_counter[boss] += dt
+            flip = boss & (enemies.anim_counter >= 10)
+            enemies.anim_counter[flip] -= 10
+            enemies.anim_frame[flip] ^= 1
+
+        # 通常の敵の弾の発射判定（生成順に乱数を引き、当たった敵だけ個別に処理）
+        # 弾数の制限は従来どおり自機の弾と通常の敵の弾を合わせて数える
+        bullets = self.bullets
+        order = enemies.indices(alive & ~boss)
+        rolls = self.fire_rolls[:order.size]
+        for k in range(order.size):
+            rolls[k] = self.rng.random()
+        enemy_shots = np.equal(bullets.kind, SHOT_ENEMY, out=bullets.test_mask)
+        enemy_shots &= bullets.alive
+        fired = len(shots) + np.count_nonzero(enemy_shots)
+        fire_rate = enemies.fire_rate[order]
+        if dt > 1:
+            fire_rate = 1 - (1 - fire_rate) ** dt  # dtフレームの間に1回以上撃つ確率
+        for i in order[rolls < fire_rate]:
+            if fired >= self.max_shots:  # 弾数制限のチェック
+                continue
+            bullets.spawn(enemies.x[i] + enemies.w[i] // 2, enemies.y[i] + enemies.h[i], 2, 4,
+                          vy=2, kind=SHOT_ENEMY, hp=1)
+            fired += 1
+
+        # ボスの弾幕
+        i = enemies.resolve(self.boss)
+        if i >= 0:
+            self.fire_boss_pattern(i)
+
+        # 画面外に出た敵を削除
+        enemies.kill_mask(alive & (enemies.y > SCREEN_HEIGHT))
+
+    def fire_boss_pattern(self, i):
+        # 発射間隔ごとに、計算済みの表から1回分の弾をまとめて撃つ
+        # 早送りではステップの間に来た発射をすべて撃ち、撃ってから過ぎたフレームの分だけ弾を進めておく
+        enemies = self.enemies
+        enemies.timer[i] -= self.time_scale
+        while enemies.timer[i] <= 0:
+            late = -int(enemies.timer[i])
+            pattern = self.boss_pattern(int(enemies.pattern[i]))
+            vx, vy = pattern.volley(int(enemies.phase[i]))
+            x = enemies.x[i] + enemies.w[i] / 2 - 1.5
+            y = enemies.y[i] + enemies.h[i]
+            if pattern.aimed:
+                # 自機の中心へ向ける
+                vx, vy = aim(vx, vy, self.player['x'] + 4 - x, self.player['y'] + 4 - y)
+            if late:
+                x = x + vx * late
+                y = y + vy * late
+            self.bullets.spawn_many(x, y, 3, 3, vx, vy, kind=BULLET_PATTERN, hp=1)
+            enemies.phase[i] += 1
+            enemies.timer[i] += pattern.interval
+
+    def boss_pattern(self, index):
+        # 今のステージに合わせた弾幕（ステージごとに1回だけ計算する）
+        key = (index, self.stage)
+        pattern = self.pattern_cache.get(key)
+        if pattern is None:
+            pattern = compile_pattern(BOSS_PATTERNS[index], self.stage)
+            self.pattern_cache[key] = pattern
+        return pattern
+
+    def update_collisions(self):
+        # 全レイヤーの衝突を一度に求め、元の処理順（敵弾、体当たり、自機の弾、アイテム）で反映する
+        shots = self.shots
+        enemies = self.enemies
+        p = self.player
+        player_box = (p['x'], p['y'], p['width'], p['height'])
+        if self.time_scale > 1:
+            hits = self.collision.swept_query(self.player_start, player_box, enemies, shots,
+                                              self.bullets, self.powerups, self.sweep_starts)
+        else:
+            hits = self.collision.query(player_box, enemies, shots, self.bullets, self.powerups)
+
+        # 敵の弾とプレイヤーの衝突判定
+        for i in hits[LAYER_ENEMY_SHOTS]:
+            if self.player['invincible'] > 0:
+                break
+            if self.player['shield'] > 0:
+                # シールドがある場合はダメージなし
+                self.emit('shield_hit', self.bullets.x[i], self.bullets.y[i])
+                self.bullets.kill(i)
+                self.play(0, 3)  # シールド効果音
+            else:
+                self.bullets.kill(i)
+                self.damage_player(DEATH_ENEMY_SHOT)
+
+        # 敵とプレイヤーの衝突判定（体当たりした敵は弾との判定をしない）
+        rammed = self.rammed
+        rammed[:] = False
+        for i in hits[LAYER_ENEMIES]:
+            if self.player['invincible'] > 0:
+                break
+            rammed[i] = True
+            if self.player['shield'] > 0:
+                # シールドがある場合はダメージなし、敵を破壊
+                self.emit('shield_hit', self.player['x'] + 4, self.player['y'])
+                self.create_explosion(enemies.x[i], enemies.y[i])
+                enemies.kill(i)
+                self.add_score(int(enemies.score[i]))
+                self.add_boss_gauge(int(enemies.kind[i]))
+            else:
+                self.damage_player(DEATH_RAM)
+
+        # プレイヤーの弾と敵の衝突判定（敵ごとに最も古い弾を1フレームに1発だけ消費する）
+        # 早送りでは当たった時刻の早い順に、進めたフレーム数まで消費する
+        damaged = self.damaged
+        damaged[:] = 0
+        limit = self.time_scale
+        targets, bullets = hits[LAYER_PLAYER_SHOTS]
+        for k in range(targets.size):
+            i = targets[k]
+            shot = bullets[k]
+            if rammed[i] or damaged[i] >= limit or not shots.alive[shot] or not enemies.alive[i]:
+                continue
+            damaged[i] += 1
+            self.hit_enemy(i, shot)
+
+        # アイテムとプレイヤーの衝突判定
+        for i in hits[LAYER_POWERUPS]:
+            self.pick_up_powerup(i)
+
+    def hit_enemy(self, i, shot):
+        # 敵にダメージ
+        enemies = self.enemies
+        enemies.hp[i] -= self.shots.hp[shot]
+        self.shots.kill(shot)
+
+        # 敵の体力が0以下になったら破壊
+        if enemies.hp[i] > 0:
+            return
+        ex = enemies.x[i]
+        ey = enemies.y[i]
+        is_boss = enemies.kind[i] == ENEMY_BOSS
+        self.create_explosion(ex, ey)
+
+        # ボスの場合は大きな爆発
+        if is_boss:
+            # 追加の爆発エフェクト
+            self.emit('boss_explosion', ex + enemies.w[i] / 2, ey + enemies.h[i] / 2)
+
+            # ボスを倒したらステージアップと背景色変更
+            self.stage += 1
+            self.boss_appeared = False  # 次のボス出現のためにフラグをリセット
+            self.boss_gauge = 0  # ボスゲージもリセット
+
+            self.boss = None
+
+            # 背景色を変更（ステージごとに少しずつ変化）
+            self.bg_color = (self.stage - 1) % 5  # 0, 1, 2, 3, 4 の循環
+
+        # パワーアップアイテムのドロップ（確率、ボスは確定でドロップ）
+        drop_chance = 1.0 if is_boss else 0.1
+        if self.rng.random() < drop_chance:
+            self.spawn_powerup(ex + enemies.w[i] // 2, ey + enemies.h[i] // 2)
+
+        # スコア加算
+        self.add_score(int(enemies.score[i]))
+        self.add_boss_gauge(int(enemies.kind[i]))
+        enemies.kill(i)
+
+    def add_boss_gauge(self, kind):
+        # 敵撃破時にボスゲージを加算 (ボス自身は加算しない)
+        if not self.boss_appeared: # ボス出現前のみゲージを加算
+            self.boss_gauge = min(self.boss_gauge + GAUGE_INCREASE[kind], self.boss_gauge_max)
+
+    def update_powerups(self):
+        # パワーアップアイテムの更新
+        powerups = self.powerups
+        if not powerups.count:
+            return
+        alive = powerups.alive
+        powerups.y[alive] += powerups.vy[alive] * self.time_scale
+
+        # 画面外に出たアイテムを削除
+        powerups.kill_mask(powerups.y > SCREEN_HEIGHT)
+
+    def pick_up_powerup(self, i):
+        # パワーアップ効果
+        powerups = self.powerups
+        self.pickups[PICKUP_NAMES[int(powerups.kind[i])]] += 1
+        if powerups.kind[i] == POWERUP_POWER:
+            self.player['power_level'] = min(2, self.player['power_level'] + 1)
+        else:
+            self.player['shield'] = 300  # シールド効果（10秒）
+
+        # アイテム取得音
+        self.play(0, 3)
+
+        powerups.kill(i)
+
+    def update_particles(self):
+        # パーティクルの更新（自機の噴射を足してから、全粒子をまとめて動かす）
+        dt = self.time_scale
+        self.emit('thruster', self.player['x'] + 4, self.player['y'] + 8, dt)
+        self.particles.update(dt)
+
+    def update_stars(self):
+        # 星のスクロール（更新間隔が変わっても同じ速さで流れるようにする）
+        self.star_scroll += self.star_update_interval * self.time_scale / 4
+
+    def spawn_enemy(self):
+        # 敵の生成（タイプを最小限にして最適化）
+        enemy_type = self.rng.choice([ENEMY_SMALL, ENEMY_MEDIUM])
+
+        # ステージに応じた敵の強化
+        stage_factor = min(self.stage * 0.15, 1.0)  # ステージが上がるほど強くなる
+
+        if enemy_type == ENEMY_SMALL:
+            self.enemies.spawn(
+                self.rng.randint(0, 152),
+                self.rng.randint(-20, -10),
+                8, 8,
+                vy=self.rng.uniform(0.8, 2.0) * (1 + stage_factor),  # 速度を上げる
+                kind=ENEMY_SMALL,
+                hp=1,
+                score=10,
+                fire_rate=0.005 + (stage_factor * 0.01)  # ステージが上がると発射確率も上がる
+            )
+        else:
+            x = self.rng.randint(10, 142)
+            y = self.rng.randint(-30, -20)
+            vy = self.rng.uniform(0.5, 1.2) * (1 + stage_factor)  # 速度を上げる
+            self.enemies.spawn(
+                x, y, 16, 16,
+                vx=self.rng.choice([-0.8, 0.8]) * (1 + stage_factor * 0.5),  # 左右移動も速く
+                vy=vy,
+                kind=ENEMY_MEDIUM,
+                hp=2,
+                score=50,
+                fire_rate=0.015 + (stage_factor * 0.02)  # 発射確率を上げる
+            )
+
+        # パワーアップ出現率の増加
+        drop_rate = self.rng.random()
+        if drop_rate < 0.03 + (stage_factor * 0.01):  # 低確率でパワーアップアイテムを直接生成
+            self.spawn_powerup(self.rng.randint(10, 150), self.rng.randint(-20, -10))
+
+    def spawn_powerup(self, x, y):
+        # パワーアップアイテムの生成（種類はランダム）
+        kind = self.rng.choice([POWERUP_POWER, POWERUP_SHIELD])
+        self.powerups.spawn(x, y, 8, 8, vy=1, kind=kind)
+
+    def create_explosion(self, x, y):
+        # 爆発エフェクトの生成
+        self.emit('explosion', x, y)
+
+        # 爆発音
+        self.play(0, 1)
+
+    def emit(self, name, x, y, scale=1):
+        # エミッタnameで粒子を出す（見た目だけの乱数を使い、数は画質の設定に合わせる）
+        EMITTER_TABLE[name].emit(self.particles, self.effects_rng, x, y,
+                                 self.particle_density * scale, self.max_particles)
+
+    def add_score(self, value):
+        # スコア加算
+        self.score += value
+
+        # スコアに応じたステージアップ
+        if self.score > 0 and self.score % 1000 == 0:
+            self.stage += 1
@@ -0,0 +1,187 @@
+import struct
+
+import numpy as np
+
+from timestep import SIM_FPS
+
+# セーブステートの形式（固定レイアウトのバイナリ）
+# ヘッダ: マジック, バージョン, 格納庫ごととパーティクルの容量（容量の違うSimulationには戻せない）
+# 本体: 数値の状態, 乱数の状態2本, 格納庫ごとの全列と空きスロットのスタック, パーティクルの全列と使用中の数
+SNAPSHOT_MAGIC = b'SDSS'
+SNAPSHOT_VERSION = 3
+HEADER = struct.Struct('<4sH5I')
+SCENES = ("TITLE", "GAME", "GAMEOVER")
+PLAYER_FIELDS = ('x', 'y', 'width', 'height', 'lives', 'invincible', 'power_level', 'shield')
+# 数値の状態（SCALAR_FIELDS, PLAYER_FIELDSの順に続けて、hold_frames, 原因の名前順のdeaths, 名前順のpickups）
+SCALAR_FIELDS = (
+    'scene', 'is_paused', 'skip_frame', 'frame_count', 'game_frames',
+    'score', 'stage', 'enemy_spawn_timer', 'boss', 'boss_gauge', 'boss_gauge_max',
+    'boss_appeared', 'bg_color', 'star_scroll',
+    'touch_last_x', 'touch_last_y', 'touch_fire_timer', 'touch_start_time', 'is_tap',
+    'is_touching', 'buttons', 'mouse_x', 'mouse_y',
+)
+SCALAR_FORMAT = '<B?3qqiiqii?Bd3iq2?Hii' + 'dd6i'
+STORE_STATE = struct.Struct('<Iq')  # 空きスロットの個数, next_seq
+PARTICLE_STATE = struct.Struct('<I')  # 使用中のパーティクルの数
+# random.Randomの状態（メルセンヌ・ツイスタの624語と位置, gaussの保留値）
+RNG_STATE = struct.Struct('<625I?d')
+
+
+def pack_rng(rng):
+    version, words, gauss_next = rng.getstate()
+    return RNG_STATE.pack(*words, gauss_next is not None, gauss_next or 0.0)
+
+
+def unpack_rng(rng, data, offset):
+    values = RNG_STATE.unpack_from(data, offset)
+    gauss_next = values[626] if values[625] else None
+    rng.setstate((3, values[:625], gauss_next))
+
+
+class SnapshotLayout:
+    # Simulationの状態をバイト列に書き出す・読み戻すための固定レイアウト
+    # 格納庫の列はバイト単位のビューを作っておき、memcpyだけでコピーする
+    def __init__(self, sim):
+        self.stores = [sim.shots, sim.bullets, sim.enemies, sim.powerups]
+        self.particles = sim.particles
+        self.header = HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                  *(store.capacity for store in self.stores), sim.particles.capacity)
+        self.death_causes = sorted(sim.deaths)
+        self.pickup_names = sorted(sim.pickups)
+        self.scalars = struct.Struct(
+            SCALAR_FORMAT + f'{len(sim.hold_frames)}i{len(self.death_causes)}i{len(self.pickup_names)}i')
+        offset = HEADER.size + self.scalars.size + RNG_STATE.size * 2
+        # (開始, 終了, 列のバイト列ビュー)
+        self.columns = []
+        # (格納庫, 空きスロットの個数とnext_seqを書く位置, スタックの開始位置)
+        self.free_stacks = []
+        for store in self.stores:
+            for name in store.column_names():
+                view = memoryview(getattr(store, name)).cast('B')
+                self.columns.append((offset, offset + view.nbytes, view))
+                offset += view.nbytes
+            self.free_stacks.append((store, offset, offset + STORE_STATE.size))
+            offset += STORE_STATE.size + store.capacity * 4
+        for name in sim.particles.column_names():
+            view = memoryview(getattr(sim.particles, name)).cast('B')
+            self.columns.append((offset, offset + view.nbytes, view))
+            offset += view.nbytes
+        self.particle_count_at = offset
+        self.size = offset + PARTICLE_STATE.size
+
+    def write(self, sim, buffer):
+        # bufferの先頭size バイトに状態を書き込む（bufferは書き込み可能なバッファ）
+        mv = memoryview(buffer)
+        mv[:HEADER.size] = self.header
+        player = sim.player
+        boss = -1 if sim.boss is None else sim.boss
+        inp = sim.input
+        self.scalars.pack_into(
+            mv, HEADER.size,
+            SCENES.index(sim.scene), sim.is_paused, sim.skip_frame, sim.frame_count,
+            sim.game_frames, sim.score, sim.stage, sim.enemy_spawn_timer, boss,
+            sim.boss_gauge, sim.boss_gauge_max, sim.boss_appeared, sim.bg_color,
+            sim.star_scroll, sim.touch_last_x, sim.touch_last_y, sim.touch_fire_timer,
+            sim.touch_start_time, sim.is_tap, sim.is_touching,
+            inp.buttons, inp.mouse_x, inp.mouse_y,
+            *(player[name] for name in PLAYER_FIELDS),
+            *sim.hold_frames,
+            *(sim.deaths[cause] for cause in self.death_causes),
+            *(sim.pickups[name] for name in self.pickup_names))
+        offset = HEADER.size + self.scalars.size
+        mv[offset:offset + RNG_STATE.size] = pack_rng(sim.rng)
+        offset += RNG_STATE.size
+        mv[offset:offset + RNG_STATE.size] = pack_rng(sim.effects_rng)
+
+        for start, end, view in self.columns:
+            mv[start:end] = view
+        for store, count_at, start in self.free_stacks:
+            free = np.array(store.free_slots, np.int32)
+            STORE_STATE.pack_into(mv, count_at, len(free), store.next_seq)
+            mv[start:start + free.nbytes] = free.data.cast('B')
+        PARTICLE_STATE.pack_into(mv, self.particle_count_at, self.particles.count)
+
+    def read(self, sim, buffer):
+        # write で書いた状態をsimに戻す
+        mv = memoryview(buffer)
+        if len(mv) < self.size or bytes(mv[:4]) != SNAPSHOT_MAGIC:
+            raise ValueError("not a snapshot")
+        if bytes(mv[:HEADER.size]) != self.header:
+            version = struct.unpack_from('<H', mv, 4)[0]
+            if version != SNAPSHOT_VERSION:
+                raise ValueError(f"unsupported snapshot version {version}")
+            raise ValueError("snapshot was taken with different entity capacities")
+
+        values = self.scalars.unpack_from(mv, HEADER.size)
+        (scene, sim.is_paused, sim.skip_frame, sim.frame_count, sim.game_frames,
+         sim.score, sim.stage, sim.enemy_spawn_timer, boss, sim.boss_gauge, sim.boss_gauge_max,
+         sim.boss_appeared, sim.bg_color, sim.star_scroll,
+         sim.touch_last_x, sim.touch_last_y, sim.touch_fire_timer, sim.touch_start_time,
+         sim.is_tap, sim.is_touching, buttons, mouse_x, mouse_y) = values[:len(SCALAR_FIELDS)]
+        sim.scene = SCENES[scene]
+        sim.boss = None if boss < 0 else boss
+        inp = sim.input
+        inp.buttons = buttons
+        inp.mouse_x = mouse_x
+        inp.mouse_y = mouse_y
+        offset = len(SCALAR_FIELDS)
+        sim.player.update(zip(PLAYER_FIELDS, values[offset:offset + len(PLAYER_FIELDS)]))
+        offset += len(PLAYER_FIELDS)
+        sim.hold_frames[:] = values[offset:offset + len(sim.hold_frames)]
+        offset += len(sim.hold_frames)
+        sim.deaths.update(zip(self.death_causes, values[offset:offset + len(self.death_causes)]))
+        offset += len(self.death_causes)
+        sim.pickups.update(zip(self.pickup_names, values[offset:]))
+
+        offset = HEADER.size + self.scalars.size
+        unpack_rng(sim.rng, mv, offset)
+        unpack_rng(sim.effects_rng, mv, offset + RNG_STATE.size)
+
+        for start, end, view in self.columns:
+            view[:] = mv[start:end]
+        for store, count_at, start in self.free_stacks:
+            count, store.next_seq = STORE_STATE.unpack_from(mv, count_at)
+            store.free_slots[:] = np.frombuffer(mv, np.int32, count, start).tolist()
+            store.count = store.capacity - count
+        self.particles.count = PARTICLE_STATE.unpack_from(mv, self.particle_count_at)[0]
+
+
+class RewindBuffer:
+    # 直近seconds秒分のスナップショットを確保済みのリングに溜めて巻き戻す
+    # 記録のたびに新しいバイト列を作らず、リングの1枠に上書きする
+    def __init__(self, sim, seconds=5, fps=SIM_FPS):
+        self.sim = sim
+        self.layout = sim.snapshot_layout
+        self.slots = max(1, int(seconds * fps))
+        self.buffer = bytearray(self.layout.size * self.slots)
+        self.view = memoryview(self.buffer)
+        self.head = 0  # 次に書き込む枠
+        self.count = 0  # 溜まっている枠の数
+
+    def __len__(self):
+        return self.count
+
+    def slot(self, index):
+        size = self.layout.size
+        return self.view[index * size:(index + 1) * size]
+
+    def record(self):
+        # 現在の状態を1枠に記録する（満杯なら最も古い枠を上書き）
+        self.layout.write(self.sim, self.slot(self.head))
+        self.head = (self.head + 1) % self.slots
+        self.count = min(self.count + 1, self.slots)
+
+    def rewind(self, steps=1):
+        # 最新の記録よりsteps回前に記録した状態に戻す（それより新しい記録は捨てる）
+        # 記録が足りなければ最も古い状態に戻し、戻れる記録が無ければFalse
+        steps = min(steps, self.count - 1)
+        if steps <= 0:
+            return False
+        self.head = (self.head - steps) % self.slots
+        self.count -= steps
+        self.layout.read(self.sim, self.slot((self.head - 1) % self.slots))
+        return True
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
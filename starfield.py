@@ -0,0 +1,33 @@
+import random
+
+from simulation import SCREEN_WIDTH
+
+# 視差スクロールする星の層（遠い順）: (1タイルあたりの星の数, スクロールの速さの倍率)
+STAR_LAYERS = [(48, 0.5), (24, 1.0), (12, 1.5)]
+STAR_TILE_HEIGHT = 84  # 1層のタイルの高さ（3層をイメージバンクに縦に並べる）
+
+# 背景色ごとの層の色（遠い層ほど暗くし、背景に埋もれない色を選ぶ）
+STAR_LAYER_COLORS = {
+    0: (5, 6, 7),
+    1: (5, 6, 7),
+    2: (13, 6, 7),
+    3: (13, 6, 7),
+    4: (13, 15, 7),
+}
+
+
+def star_layers(stage, bg_color):
+    # ステージごとの星の配置を層ごとに [(x, y, 色), ...] で返す
+    # ステージから決まる乱数で作るので、同じステージなら毎回同じ配置になる
+    rng = random.Random(stage)
+    colors = STAR_LAYER_COLORS.get(bg_color, STAR_LAYER_COLORS[0])
+    layers = []
+    for (count, _), color in zip(STAR_LAYERS, colors):
+        layers.append([(rng.randrange(SCREEN_WIDTH), rng.randrange(STAR_TILE_HEIGHT), color)
+                       for _ in range(count)])
+    return layers
+
+
+def layer_offset(star_scroll, layer):
+    # 層のタイルを描く縦方向のずれ（0以上STAR_TILE_HEIGHT未満）
+    return int(star_scroll * STAR_LAYERS[layer][1]) % STAR_TILE_HEIGHT
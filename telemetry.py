@@ -0,0 +1,424 @@
+import argparse
+import glob
+import gzip
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from simulation import DEATH_ENEMY_SHOT, DEATH_RAM, POWERUP_POWER, POWERUP_SHIELD, PICKUP_NAMES
+from timestep import SIM_FPS
+
+# プレイ中の計測値（テレメトリ）をJSON Linesでgzipしたファイルに書き出す
+# ゲームのループは1秒ごとに確保済みのリングへ1行書くだけで、
+# 文字列にして圧縮し、ファイルを切り替えるのは別スレッドが行う
+# 行の種類:
+#   {"type": "second", ...}  ゲームが進んだ1秒ごとの集計（SECOND_DTYPEの列）
+#   {"type": "session", ...} セッション（リスタートかゲームオーバーまで）の終わりにまとめ
+SECOND_DTYPE = np.dtype([
+    ('session', '<i4'),  # 記録を始めてから何番目のセッションか
+    ('second', '<i4'),  # セッションの何秒目か
+    ('frames', '<i2'),  # この秒に進んだフレーム数（最後の秒は足りないことがある）
+    ('over_budget', '<i2'),  # 予算を超えたフレーム数
+    ('max_ms', '<f4'),  # 最も遅いフレームの時間
+    ('shots', '<f4'),  # エンティティ数の平均
+    ('enemies', '<f4'),
+    ('bullets', '<f4'),
+    ('particles', '<f4'),
+    ('stage', '<i2'),
+    ('score', '<i4'),
+    ('boss_gauge', '<i2'),
+    ('gauge_gain', '<i2'),  # この秒に増えたボスゲージ
+    ('deaths_enemy_shot', '<i2'),  # この秒に失った残機（原因別）
+    ('deaths_ram', '<i2'),
+    ('pickups_power', '<i2'),  # この秒に取ったアイテム（種類別）
+    ('pickups_shield', '<i2'),
+])
+RING_ROWS = 4096  # 書き込みを待てる秒数（あふれた分は捨てる）
+MAX_FILE_BYTES = 8 << 20  # 圧縮前のサイズがこれを超えたら次のファイルに切り替える
+FLUSH_INTERVAL = 1.0  # 書き込みスレッドが起きる間隔（秒）
+FILE_PATTERNS = ('*.jsonl.gz', '*.jsonl')
+ENTITY_FIELDS = ('shots', 'enemies', 'bullets', 'particles')
+POWER = PICKUP_NAMES[POWERUP_POWER]
+SHIELD = PICKUP_NAMES[POWERUP_SHIELD]
+
+
+class RotatingWriter:
+    # 行をgzipしたファイルに書き、大きくなったら次のファイルに切り替える
+    # 書いている間は .part という名前にしておき、閉じてから本来の名前にする（集計が途中のファイルを読まない）
+    def __init__(self, directory, prefix, max_bytes=MAX_FILE_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.file = None
+        self.path = None
+        self.written = 0
+        self.number = 0
+        self.paths = []  # 書き終えたファイル
+
+    def write(self, line):
+        if self.file is None:
+            self.path = os.path.join(self.directory, f"{self.prefix}-{self.number:04d}.jsonl.gz")
+            self.file = gzip.open(self.path + '.part', 'wt', compresslevel=6)
+            self.number += 1
+        self.file.write(line)
+        self.written += len(line)
+        if self.written >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        # 今のファイルを閉じる（次のwriteで新しいファイルを開く）
+        if self.file is None:
+            return
+        self.file.close()
+        os.replace(self.path + '.part', self.path)
+        self.paths.append(self.path)
+        self.file = None
+        self.written = 0
+
+    def close(self):
+        self.rotate()
+
+
+class TelemetryRecorder:
+    # Simulationを1ステップ進めるたびにrecordを呼ぶ
+    # 値は整数の足し算だけで貯め、ゲームが1秒進むごとにリングの1行にまとめる
+    # セッションの始まりと終わりはgame_framesとplayerの辞書（reset_gameで作り直される）で見分ける
+    # リスタートしたステップではsimの値がもう新しいゲームのものなので、
+    # 終わったセッションの値は前のステップまでに覚えたもの（作り直される前のdeathsとpickupsの辞書）を使う
+    def __init__(self, directory, budget=1 / SIM_FPS, fps=SIM_FPS, ring_rows=RING_ROWS,
+                 max_bytes=MAX_FILE_BYTES, flush_interval=FLUSH_INTERVAL):
+        self.budget = budget  # 1フレームの時間の予算（秒）
+        self.fps = fps
+        self.run = f"{socket.gethostname()}-{os.getpid()}-{int(time.time())}"
+        self.writer = RotatingWriter(directory, f"telemetry-{self.run}", max_bytes)
+        self.flush_interval = flush_interval
+
+        # 書き込み待ちの秒の行（head: 書いた行数, tail: 書き込みスレッドが読んだ行数）
+        self.ring = np.zeros(ring_rows, SECOND_DTYPE)
+        self.head = 0
+        self.tail = 0
+        self.sessions = queue.SimpleQueue()  # 書き込み待ちのセッションのまとめ
+        self.dropped = 0  # リングがあふれて捨てた行数
+        self.error = None  # 書き込みスレッドで起きた例外
+        self.wake = threading.Event()
+        self.closing = False
+
+        self.session = -1
+        self.active = False
+        self.player = None
+        self.last_game_frames = -1
+        self.thread = threading.Thread(target=self.run_writer, name="telemetry", daemon=True)
+        self.thread.start()
+
+    # --- ゲームのループから呼ぶ ---
+
+    def record(self, sim, seconds):
+        # 1ステップの結果を記録する（secondsはそのフレームにかかった時間）
+        game_frames = sim.game_frames
+        if game_frames == self.last_game_frames:
+            # ゲームが進んでいない（タイトル・一時停止・ゲームオーバー）
+            if self.active and sim.scene != "GAME":
+                self.end_session(sim.scene == "GAMEOVER")
+            return
+        self.last_game_frames = game_frames
+        if sim.player is not self.player:
+            if self.active:
+                self.end_session(False)
+            self.begin_session(sim)
+
+        self.frames += 1
+        self.shots += sim.shots.count
+        self.enemies += sim.enemies.count
+        self.bullets += sim.bullets.count
+        self.particles += sim.particles.count
+        if seconds > self.budget:
+            self.over_budget += 1
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        self.score = sim.score
+        self.gauge = sim.boss_gauge
+        if sim.stage != self.stage:
+            self.stage = sim.stage
+            self.stage_frames.append(self.session_frames + self.frames)
+        if self.frames == self.fps:
+            self.end_second()
+        if sim.scene != "GAME":
+            self.end_session(sim.scene == "GAMEOVER")
+
+    def begin_session(self, sim):
+        self.session += 1
+        self.active = True
+        self.player = sim.player
+        self.seed = sim.seed
+        self.deaths = sim.deaths
+        self.pickups = sim.pickups
+        self.second = 0
+        self.session_frames = 0
+        self.session_over_budget = 0
+        self.score = sim.score
+        self.stage = sim.stage
+        self.stage_frames = [0]  # ステージごとの、そのステージになったフレーム（セッションの始めから）
+        self.gauge = sim.boss_gauge
+        self.last_gauge = self.gauge
+        self.last_deaths = dict(self.deaths)
+        self.last_pickups = dict(self.pickups)
+        self.reset_second()
+
+    def reset_second(self):
+        self.frames = 0
+        self.over_budget = 0
+        self.max_seconds = 0.0
+        self.shots = 0
+        self.enemies = 0
+        self.bullets = 0
+        self.particles = 0
+
+    def end_second(self):
+        # 貯めた値をリングの1行にする
+        deaths = self.deaths
+        pickups = self.pickups
+        gauge = self.gauge
+        if self.head - self.tail >= len(self.ring):
+            self.dropped += 1
+        else:
+            frames = self.frames
+            # ボスを倒すとゲージは0に戻る
+            gain = gauge - self.last_gauge if gauge >= self.last_gauge else gauge
+            last_deaths = self.last_deaths
+            last_pickups = self.last_pickups
+            self.ring[self.head % len(self.ring)] = (
+                self.session, self.second, frames, self.over_budget, self.max_seconds * 1000,
+                self.shots / frames, self.enemies / frames, self.bullets / frames,
+                self.particles / frames, self.stage, self.score, gauge, gain,
+                deaths[DEATH_ENEMY_SHOT] - last_deaths[DEATH_ENEMY_SHOT],
+                deaths[DEATH_RAM] - last_deaths[DEATH_RAM],
+                pickups[POWER] - last_pickups[POWER], pickups[SHIELD] - last_pickups[SHIELD])
+            self.head += 1
+        self.last_gauge = gauge
+        self.last_deaths = dict(deaths)
+        self.last_pickups = dict(pickups)
+        self.session_frames += self.frames
+        self.session_over_budget += self.over_budget
+        self.second += 1
+        self.reset_second()
+        self.wake.set()
+
+    def end_session(self, game_over):
+        # 途中の秒を書き、セッションのまとめを書き込み待ちにする
+        if self.frames:
+            self.end_second()
+        self.active = False
+        self.sessions.put({
+            'type': 'session',
+            'session': f"{self.run}:{self.session}",
+            'seed': self.seed,
+            'frames': self.session_frames,
+            'over_budget': self.session_over_budget,
+            'score': self.score,
+            'stage': self.stage,
+            'game_over': game_over,
+            'stage_frames': self.stage_frames,
+            'deaths': dict(self.deaths),
+            'pickups': dict(self.pickups),
+            'ended_at': time.time(),
+        })
+        self.wake.set()
+
+    def close(self, timeout=5.0):
+        # 続いているセッションを終わらせ、残りを書き終えるまで待つ
+        if self.active:
+            self.end_session(False)
+        self.closing = True
+        self.wake.set()
+        self.thread.join(timeout)
+
+    # --- 書き込みスレッド ---
+
+    def run_writer(self):
+        try:
+            while True:
+                self.wake.wait(self.flush_interval)
+                self.wake.clear()
+                closing = self.closing
+                self.drain()
+                if closing:
+                    break
+        except OSError as e:
+            self.error = e
+        finally:
+            try:
+                self.writer.close()
+            except OSError as e:
+                self.error = e
+
+    def drain(self):
+        # セッションのまとめを先に取り出してから秒の行を書く（まとめがそのセッションの行より先にならない）
+        sessions = []
+        while True:
+            try:
+                sessions.append(self.sessions.get_nowait())
+            except queue.Empty:
+                break
+        names = SECOND_DTYPE.names
+        head = self.head
+        rows = len(self.ring)
+        while self.tail < head:
+            values = self.ring[self.tail % rows].tolist()
+            line = dict(zip(names, values))
+            line['session'] = f"{self.run}:{values[0]}"
+            line['max_ms'] = round(line['max_ms'], 3)
+            for name in ENTITY_FIELDS:
+                line[name] = round(line[name], 2)
+            self.writer.write(json.dumps({'type': 'second', **line}) + '\n')
+            self.tail += 1
+        for session in sessions:
+            self.writer.write(json.dumps(session) + '\n')
+
+
+# --- 集計 ---
+
+def new_summary():
+    return {
+        'files': 0, 'sessions': 0, 'game_overs': 0, 'frames': 0, 'over_budget': 0, 'max_ms': 0.0,
+        'seconds': 0, 'entity_sums': dict.fromkeys(ENTITY_FIELDS, 0.0),
+        'entity_max': dict.fromkeys(ENTITY_FIELDS, 0.0),
+        'deaths': {}, 'pickups': {}, 'stages': {},
+        'gauge_gain': {}, 'gauge_seconds': {},  # ステージ: ボスゲージの増加の合計, 秒数
+        'stage_reach': {}, 'stage_reach_count': {},  # ステージ: そこまでのフレーム数の合計, 回数
+    }
+
+
+def add_counts(total, counts):
+    for key, value in counts.items():
+        total[key] = total.get(key, 0) + value
+
+
+def summarize_file(path, summary):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        for line in f:
+            row = json.loads(line)
+            if row['type'] == 'second':
+                summary['seconds'] += 1
+                frames = row['frames']
+                sums = summary['entity_sums']
+                peaks = summary['entity_max']
+                for name in ENTITY_FIELDS:
+                    value = row[name]
+                    sums[name] += value * frames
+                    if value > peaks[name]:
+                        peaks[name] = value
+                if row['max_ms'] > summary['max_ms']:
+                    summary['max_ms'] = row['max_ms']
+                stage = str(row['stage'])
+                summary['gauge_gain'][stage] = summary['gauge_gain'].get(stage, 0) + row['gauge_gain']
+                summary['gauge_seconds'][stage] = summary['gauge_seconds'].get(stage, 0) + frames / SIM_FPS
+            elif row['type'] == 'session':
+                summary['sessions'] += 1
+                summary['game_overs'] += row['game_over']
+                summary['frames'] += row['frames']
+                summary['over_budget'] += row['over_budget']
+                add_counts(summary['deaths'], row['deaths'])
+                add_counts(summary['pickups'], row['pickups'])
+                add_counts(summary['stages'], {str(row['stage']): 1})
+                for stage, frame in enumerate(row['stage_frames'][1:], 2):
+                    add_counts(summary['stage_reach'], {str(stage): frame})
+                    add_counts(summary['stage_reach_count'], {str(stage): 1})
+    summary['files'] += 1
+
+
+def summarize_files(paths):
+    # ワーカーで実行する単位（ファイルの塊を1つのまとめにする）
+    summary = new_summary()
+    for path in paths:
+        summarize_file(path, summary)
+    return summary
+
+
+def merge_summaries(total, summary):
+    for key, value in summary.items():
+        if key == 'max_ms':
+            total[key] = max(total[key], value)
+        elif key == 'entity_max':
+            for name, v in value.items():
+                total[key][name] = max(total[key][name], v)
+        elif isinstance(value, dict):
+            add_counts(total[key], value)
+        else:
+            total[key] += value
+
+
+def find_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in FILE_PATTERNS:
+                files.extend(glob.glob(os.path.join(path, '**', pattern), recursive=True))
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def summarize(paths, workers=None, chunk_size=32):
+    # ファイルを塊に分けてプロセスプールで集計する
+    files = find_files(paths)
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    total = new_summary()
+    if len(chunks) <= 1:
+        for chunk in chunks:
+            merge_summaries(total, summarize_files(chunk))
+        return total
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for summary in executor.map(summarize_files, chunks):
+            merge_summaries(total, summary)
+    return total
+
+
+def print_summary(summary, elapsed):
+    frames = summary['frames']
+    print(f"files: {summary['files']}  sessions: {summary['sessions']} "
+          f"(game over {summary['game_overs']})  play time: {frames / SIM_FPS / 3600:.2f} h"
+          f"  ({elapsed:.1f}s)")
+    if not frames:
+        return
+    print(f"frames over budget: {summary['over_budget']} ({summary['over_budget'] / frames:.2%})"
+          f"  slowest frame: {summary['max_ms']:.1f} ms")
+    print("entities per frame: " + "  ".join(
+        f"{name} {total / frames:.1f} (max {summary['entity_max'][name]:.0f})"
+        for name, total in summary['entity_sums'].items()))
+    print("deaths: " + "  ".join(f"{cause} {count}" for cause, count in sorted(summary['deaths'].items())))
+    print("pickups: " + "  ".join(f"{name} {count}" for name, count in sorted(summary['pickups'].items())))
+    stages = sorted(summary['stages'], key=int)
+    print("stage reached: " + "  ".join(f"{s}:{summary['stages'][s]}" for s in stages))
+    print("boss gauge per second: " + "  ".join(
+        f"{s}:{summary['gauge_gain'][s] / summary['gauge_seconds'][s]:.1f}"
+        for s in sorted(summary['gauge_gain'], key=int) if summary['gauge_seconds'][s]))
+    print("mean time to stage (s): " + "  ".join(
+        f"{s}:{summary['stage_reach'][s] / summary['stage_reach_count'][s] / SIM_FPS:.0f}"
+        for s in sorted(summary['stage_reach'], key=int)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize telemetry files")
+    parser.add_argument('paths', nargs='+', help="telemetry files or directories")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--json', metavar='PATH', help="write the summary as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = summarize(args.paths, args.workers)
+    print_summary(summary, time.perf_counter() - start)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import numpy as np
+
+from batch_env import BatchEnv, random_actions
+
+
+def run(seeds, steps, actions):
+    # seeds[0]の環境の観測と報酬を毎ステップ記録する（他の環境の入力はランダム）
+    env = BatchEnv()
+    observations = [env.reset(len(seeds), seeds)[0].copy()]
+    rewards = []
+    rng = np.random.default_rng(123)
+    for step in range(steps):
+        batch_actions = random_actions(rng, len(seeds))
+        batch_actions[0] = actions[step]
+        obs, reward, _ = env.step(batch_actions)
+        observations.append(obs[0].copy())
+        rewards.append(reward[0])
+    return np.array(observations), np.array(rewards)
+
+
+def test_seed_trajectory_does_not_depend_on_batch():
+    # 同じシードの環境は、単独でも他の環境と一緒でも同じ展開になる
+    steps = 2000
+    actions = random_actions(np.random.default_rng(7), steps)
+    alone = run([7], steps, actions)
+    batched = run([7, 8, 9, 10], steps, actions)
+    np.testing.assert_array_equal(alone[0], batched[0])
+    np.testing.assert_array_equal(alone[1], batched[1])
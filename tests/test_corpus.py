@@ -0,0 +1,84 @@
+import pytest
+
+from corpus import Corpus, CorpusWriter
+from replay import encode_replay, iter_frames, parse_replay
+from simulation import BTN_MOUSE, BTN_SPACE
+
+
+def session_frames(seed, count):
+    # スペースを押したり離したりしながら、たまに画面に触れて動かす入力
+    frames = []
+    for k in range(count):
+        buttons = BTN_SPACE if (k + seed) % 7 < 4 else 0
+        if k % 11 < 3:
+            frames.append((buttons | BTN_MOUSE, k % 160, seed * 10 + k // 11))
+        else:
+            frames.append((buttons, *frames[-1][1:]) if frames else (buttons, 0, 0))
+    return frames
+
+
+def write_pack(path, sessions):
+    with CorpusWriter(path) as writer:
+        for seed, frames in sessions:
+            writer.add(encode_replay(seed, frames))
+
+
+def test_index_round_trip(tmp_path):
+    # 索引のシードとフレーム数、切り出したセッションの入力が書いたものと一致する
+    path = str(tmp_path / "corpus.pack")
+    sessions = [(seed, session_frames(seed, 100 + seed * 37)) for seed in range(5)]
+    write_pack(path, sessions)
+    with Corpus(path) as corpus:
+        assert len(corpus) == len(sessions)
+        assert corpus.index['seed'].tolist() == [seed for seed, _ in sessions]
+        assert corpus.index['frames'].tolist() == [len(frames) for _, frames in sessions]
+        for i, (seed, frames) in enumerate(sessions):
+            data = corpus.session(i)
+            assert bytes(data) == encode_replay(seed, frames)
+            read_seed, version, body = parse_replay(data)
+            assert read_seed == seed
+            assert list(iter_frames(version, body)) == frames
+            body.release()
+            data.release()
+
+
+def test_close_releases_sessions(tmp_path):
+    # 取り出したビューを持ったままでも閉じられ、閉じた後のビューは使えない
+    path = str(tmp_path / "corpus.pack")
+    write_pack(path, [(1, session_frames(1, 50)), (2, session_frames(2, 50))])
+    with Corpus(path) as corpus:
+        view = corpus.session(1)
+        kept = bytes(corpus.session(0))
+    assert kept == encode_replay(1, session_frames(1, 50))
+    with pytest.raises(ValueError):
+        bytes(view)
+
+
+def test_close_reports_views_still_in_use(tmp_path):
+    # セッションから作ったビューが残っていると、何が残っているかを示して失敗する
+    path = str(tmp_path / "corpus.pack")
+    write_pack(path, [(1, session_frames(1, 50))])
+    corpus = Corpus(path)
+    _, _, body = parse_replay(corpus.session(0))
+    with pytest.raises(BufferError, match="still in use"):
+        corpus.close()
+    body.release()
+    corpus.close()
+
+
+def test_dropped_views_are_forgotten(tmp_path):
+    # 捨てたビューや再生に使ったビューは覚えておかず、中身が同じでも別々に解放する
+    path = str(tmp_path / "corpus.pack")
+    frames = session_frames(1, 50)
+    write_pack(path, [(1, frames), (1, frames)])
+    with Corpus(path) as corpus:
+        for _ in range(100):
+            bytes(corpus.session(0))
+            corpus.replay(1)
+        assert len(corpus.views) == 0
+        first, second = corpus.session(0), corpus.session(1)
+        assert first == second and len(corpus.views) == 2
+    with pytest.raises(ValueError):
+        bytes(first)
+    with pytest.raises(ValueError):
+        bytes(second)
@@ -0,0 +1,30 @@
+from leaderboard import Leaderboard
+
+
+def test_recorded_scores_appear_once(tmp_path):
+    # 書き込みスレッドが読み直した後も、記録した点数は1回ずつだけ並ぶ
+    board = Leaderboard(str(tmp_path / "scores.db"))
+    for score in (300, 100, 200):
+        board.record(score, 1, 60)
+        assert sorted(e[0] for e in board.top) == sorted(set(e[0] for e in board.top))
+    board.close()
+    assert [e[0] for e in board.top] == [300, 200, 100]
+    assert board.stage_bests == {1: 300}
+    assert board.pending == []
+
+    # 開き直すとディスクから同じ記録を読む
+    reopened = Leaderboard(str(tmp_path / "scores.db"))
+    reopened.close()
+    assert [e[0] for e in reopened.top] == [300, 200, 100]
+
+
+def test_writer_error_is_kept(tmp_path):
+    # SQLiteのエラー以外で書き込みスレッドが止まっても理由が残り、以降の記録は捨てる
+    board = Leaderboard(str(tmp_path / "scores.db"))
+    board.record(100, 1, 60, seed=1 << 64)
+    board.thread.join(2.0)
+    assert not board.thread.is_alive()
+    assert isinstance(board.error, OverflowError)
+    board.record(200, 1, 60)
+    assert board.dropped == 1
+    board.close()
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from replay import (FRAME, HEADER, RAW_VERSION, REPLAY_MAGIC, REPLAY_VERSION, SEED_LIMIT,
+                    InputRecorder, encode_replay, iter_frames, parse_replay, run_replay)
+from simulation import BTN_LEFT, BTN_MOUSE, BTN_RIGHT, BTN_SPACE
+
+
+def random_frames(seed, count):
+    # ボタンは数フレームずつ続け、マウス座標は押している間だけ動かす（離している間は前の値のまま）
+    rng = random.Random(seed)
+    frames = []
+    buttons = mouse_x = mouse_y = 0
+    for _ in range(count):
+        if rng.random() < 0.2:
+            buttons = rng.randrange(1 << 10)
+        if buttons & BTN_MOUSE:
+            mouse_x = max(-32768, min(32767, mouse_x + rng.randint(-300, 300)))
+            mouse_y = max(-32768, min(32767, mouse_y + rng.randint(-300, 300)))
+        frames.append((buttons, mouse_x, mouse_y))
+    return frames
+
+
+def encode_raw(seed, frames):
+    # バージョン2（1フレームごとに固定長）のリプレイファイル
+    return HEADER.pack(REPLAY_MAGIC, RAW_VERSION, seed) + b''.join(FRAME.pack(*f) for f in frames)
+
+
+def test_encode_round_trip():
+    frames = random_frames(1, 1000)
+    seed, version, body = parse_replay(encode_replay(42, frames))
+    assert (seed, version) == (42, REPLAY_VERSION)
+    assert list(iter_frames(version, body)) == frames
+
+
+def test_mouse_is_kept_while_released():
+    # 離している間の座標は記録せず、最後に押していた位置として読み戻す
+    frames = [(BTN_MOUSE, 10, 20), (0, 99, 99), (BTN_SPACE, -5, 7), (BTN_MOUSE, -5, 7)]
+    _, version, body = parse_replay(encode_replay(0, frames))
+    assert list(iter_frames(version, body)) == [
+        (BTN_MOUSE, 10, 20), (0, 10, 20), (BTN_SPACE, 10, 20), (BTN_MOUSE, -5, 7)]
+
+
+def test_truncated_replay_drops_partial_run():
+    # 記録中に終了して途中で切れたランは捨て、それより前のフレームは読める
+    frames = [(BTN_LEFT, 0, 0)] * 3 + [(BTN_RIGHT, 0, 0)] * 200
+    data = encode_replay(0, frames)
+    _, version, body = parse_replay(data[:-1])
+    assert list(iter_frames(version, body)) == frames[:3]
+
+
+def test_read_raw_version():
+    frames = random_frames(2, 500)
+    seed, version, body = parse_replay(encode_raw(7, frames))
+    assert (seed, version) == (7, RAW_VERSION)
+    assert list(iter_frames(version, body)) == frames
+    # 途中までのフレームは捨てる
+    _, version, body = parse_replay(encode_raw(7, frames)[:-2])
+    assert list(iter_frames(version, body)) == frames[:-1]
+
+
+def test_raw_and_encoded_replays_play_the_same():
+    # 同じ入力ならバージョン2でもバージョン3でも同じ展開になる
+    rng = random.Random(3)
+    frames = [(BTN_SPACE, 0, 0)] + [(rng.choice((0, BTN_LEFT, BTN_RIGHT)) | BTN_SPACE, 0, 0)
+                                    for _ in range(600)]
+    raw = run_replay(data=encode_raw(5, frames))
+    encoded = run_replay(data=encode_replay(5, frames))
+    assert raw.frame_count == encoded.frame_count == len(frames)
+    assert (raw.score, raw.stage, raw.scene) == (encoded.score, encoded.stage, encoded.scene)
+    assert raw.snapshot() == encoded.snapshot()
+
+
+@pytest.mark.parametrize('seed', [-1, SEED_LIMIT])
+def test_unrecordable_seed_is_rejected(tmp_path, seed):
+    # ヘッダに書けないシードは、ファイルを作る前にValueErrorで断る
+    with pytest.raises(ValueError, match="seed"):
+        encode_replay(seed, [])
+    with pytest.raises(ValueError, match="seed"):
+        InputRecorder(str(tmp_path / "session.sdr"), seed)
+    assert not (tmp_path / "session.sdr").exists()
+    assert parse_replay(encode_replay(SEED_LIMIT - 1, []))[0] == SEED_LIMIT - 1
@@ -0,0 +1,30 @@
+SIM_FPS = 30  # シミュレーションの1秒あたりのステップ数（タイマーはすべてこの単位で数える）
+
+
+class FixedTimestep:
+    # 実時間の経過を貯めておき、固定の時間刻みで何ステップ進めるかを決める
+    # 描画が遅れても時間どおりにゲームが進み、ステップの中身は描画の速さに左右されない
+    def __init__(self, step=1 / SIM_FPS, max_steps=4):
+        self.step = step  # 1ステップの時間（秒）
+        self.max_steps = max_steps  # 1回の描画で追いつくために進める最大ステップ数
+        self.accumulator = 0.0  # まだステップにしていない経過時間
+        self.last_time = None
+        self.dropped = 0.0  # 追いつけずに捨てた時間の合計（この分だけゲームが遅れた）
+
+    def advance(self, now):
+        # 時刻nowまでに進めるべきステップ数（0以上max_steps以下）
+        if self.last_time is None:
+            self.last_time = now - self.step  # 最初の呼び出しでは1ステップ進める
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        steps = int(self.accumulator / self.step)
+        self.accumulator -= steps * self.step
+        if steps > self.max_steps:
+            # 大きく遅れたときは追いつくのをあきらめる（処理が重くなって更に遅れるのを防ぐ）
+            self.dropped += (steps - self.max_steps) * self.step
+            steps = self.max_steps
+        return steps
+
+    def alpha(self):
+        # 最後のステップから次のステップまでの進み具合（描画の補間に使う、0以上1未満）
+        return min(max(self.accumulator / self.step, 0.0), 1.0)